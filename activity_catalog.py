@@ -0,0 +1,197 @@
+import csv
+import re
+from array import array
+from bisect import bisect_left
+import numpy as np
+from entry_schema import ENTRY_CATEGORIES
+
+_WORD = re.compile(r"\w+")
+
+def fold(text):
+    """Lowercase a label and keep only its words, space separated"""
+    return " ".join(_WORD.findall(text.lower()))
+
+def trigrams(folded):
+    """Get the distinct trigrams of a folded label, padded so word starts count"""
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _postings(keys_per_item, ranks, sort_keys):
+    """Build postings from each item's keys and rank; returns (keys, CSR offsets, ranks)"""
+    key_ids = {}
+    key_column = array("i")
+    rank_column = array("i")
+    for keys, rank in zip(keys_per_item, ranks):
+        for key in keys:
+            key_column.append(key_ids.setdefault(key, len(key_ids)))
+            rank_column.append(rank)
+    keys = list(key_ids)
+    key_column = np.frombuffer(key_column, dtype=np.int32)
+    if sort_keys:
+        keys.sort()
+        positions = np.empty(len(keys), dtype=np.int32)
+        positions[[key_ids[key] for key in keys]] = np.arange(len(keys), dtype=np.int32)
+        key_column = positions[key_column]
+    # Sorting by (key, rank) leaves each key's postings in rank order
+    order = np.lexsort((np.frombuffer(rank_column, dtype=np.int32), key_column))
+    starts = np.searchsorted(key_column[order], np.arange(len(keys) + 1)).astype(np.int64)
+    return keys, starts, np.frombuffer(rank_column, dtype=np.int32)[order]
+
+class ActivityCatalog:
+    """Activities with emission factors, held as arrays with search indexes
+
+    Items are stored column-wise: the names in one list, categories and
+    units as small integer codes and factors in a float array, so tens of
+    thousands of activities cost a few MB. Two indexes serve
+    search-as-you-type:
+
+    - a sorted list of every word in the names, with CSR offsets into item
+      ranks, so a word prefix is two bisects and one array slice
+    - trigram postings in the same layout, for misspelled queries
+
+    ``price`` looks up and multiplies a whole basket in one call.
+    """
+
+    def __init__(self, names, categories, factors, units=None):
+        self.names = list(names)
+        self.category_names = sorted(set(categories))
+        category_codes = {category: code for code, category in enumerate(self.category_names)}
+        self.category_codes = np.fromiter((category_codes[category] for category in categories),
+                                          dtype=np.int16, count=len(self.names))
+        self.factors = np.asarray(factors, dtype=np.float64)
+        units = units or [""] * len(self.names)
+        self.unit_names = sorted(set(units))
+        unit_codes = {unit: code for code, unit in enumerate(self.unit_names)}
+        self.unit_codes = np.fromiter((unit_codes[unit] for unit in units), dtype=np.int16, count=len(self.names))
+        self._index = {name: position for position, name in enumerate(self.names)}
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Build the word-prefix and trigram indexes
+
+        Postings hold ranks rather than item ids: position in the
+        shortest-name-first order, which ``_order`` maps back to items. A
+        search marks ranks in a boolean array, so its matches come out
+        best first without sorting.
+        """
+        order = sorted(range(len(self.names)), key=lambda item: (len(self.names[item]), self.names[item]))
+        self._order = np.asarray(order, dtype=np.int32)
+        ranks = np.empty(len(self.names), dtype=np.int32)
+        ranks[self._order] = np.arange(len(self.names), dtype=np.int32)
+        folded = [fold(name) for name in self.names]
+        self._words, self._word_starts, self._word_ranks = _postings(
+            (set(label.split()) for label in folded), ranks.tolist(), sort_keys=True
+        )
+        grams, self._gram_starts, self._gram_ranks = _postings(
+            (trigrams(label) for label in folded), ranks.tolist(), sort_keys=False
+        )
+        self._grams = {gram: row for row, gram in enumerate(grams)}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a catalog from dicts with activity, category, co2 and optional unit"""
+        names, categories, factors, units = [], [], [], []
+        for line_number, row in enumerate(rows, start=1):
+            category = row["category"]
+            if category not in ENTRY_CATEGORIES:
+                raise ValueError(f"Catalog row {line_number}: unknown category '{category}'")
+            names.append(row["activity"])
+            categories.append(category)
+            factors.append(float(row["co2"]))
+            units.append(row.get("unit") or "")
+        return cls(names, categories, factors, units)
+
+    @classmethod
+    def load_csv(cls, path):
+        """Load a catalog from a CSV file with activity, category, co2 and optional unit columns"""
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return cls.from_rows(csv.DictReader(f))
+
+    def merged(self, other):
+        """Get a catalog with another catalog's items added; ``other`` wins on duplicate names"""
+        keep = [item for item, name in enumerate(self.names) if name not in other._index]
+        return ActivityCatalog(
+            [self.names[item] for item in keep] + other.names,
+            [self.category(item) for item in keep] + [other.category(item) for item in range(len(other))],
+            np.concatenate([self.factors[keep], other.factors]),
+            [self.unit(item) for item in keep] + [other.unit(item) for item in range(len(other))]
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def index(self, name):
+        """Get an activity's item id, or -1 if it is not in the catalog"""
+        return self._index.get(name, -1)
+
+    def category(self, item):
+        """Get an item's category"""
+        return self.category_names[self.category_codes[item]]
+
+    def unit(self, item):
+        """Get an item's unit label"""
+        return self.unit_names[self.unit_codes[item]]
+
+    def factor(self, name):
+        """Get an activity's kg CO₂ per unit, or None if it is not in the catalog"""
+        item = self._index.get(name, -1)
+        return float(self.factors[item]) if item >= 0 else None
+
+    def factors_for(self, names):
+        """Get the factors of many activities as an array, NaN where an activity is unknown"""
+        items = np.fromiter((self._index.get(name, -1) for name in names), dtype=np.int64)
+        found = items >= 0
+        factors = np.full(len(items), np.nan)
+        factors[found] = self.factors[items[found]]
+        return factors
+
+    def price(self, names, quantities):
+        """Price a basket: kg CO₂ for each (activity, quantity) pair, NaN for unknown activities"""
+        return self.factors_for(names) * np.asarray(quantities, dtype=np.float64)
+
+    def _prefix_mask(self, word):
+        """Mark the ranks of items with a word starting with ``word``"""
+        mask = np.zeros(len(self.names), dtype=bool)
+        start = bisect_left(self._words, word)
+        end = bisect_left(self._words, word + "\U0010ffff", start)
+        mask[self._word_ranks[self._word_starts[start]:self._word_starts[end]]] = True
+        return mask
+
+    def _fuzzy_ranks(self, folded, limit):
+        """Get the ranks of the items sharing the most trigrams with a query, best first"""
+        grams = trigrams(folded)
+        rows = [self._grams[gram] for gram in grams if gram in self._grams]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        postings = np.concatenate([self._gram_ranks[self._gram_starts[row]:self._gram_starts[row + 1]]
+                                   for row in rows])
+        counts = np.bincount(postings, minlength=len(self.names))
+        # At least half of the query's trigrams must match
+        candidates = np.flatnonzero(counts >= max(1, (len(grams) + 1) // 2))
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-counts[candidates], limit - 1)[:limit]]
+        # Candidates are ranks, so ties keep the shortest names first
+        return candidates[np.lexsort((candidates, -counts[candidates]))]
+
+    def search(self, query, limit=20):
+        """Get up to ``limit`` activity names matching a query, best first
+
+        Items with a word starting with each query word come first; if
+        that leaves room, items sharing enough trigrams with the query
+        (typos, partial words) follow.
+        """
+        folded = fold(query)
+        if not folded:
+            return [self.names[item] for item in self._order[:limit].tolist()]
+        mask = None
+        for word in folded.split():
+            word_mask = self._prefix_mask(word)
+            mask = word_mask if mask is None else mask & word_mask
+        ranks = np.flatnonzero(mask)[:limit].tolist()
+        if len(ranks) < limit:
+            seen = set(ranks)
+            ranks.extend(rank for rank in self._fuzzy_ranks(folded, limit).tolist() if rank not in seen)
+        return [self.names[item] for item in self._order[ranks[:limit]].tolist()]
@@ -0,0 +1,153 @@
+import os
+import streamlit as st
+from datetime import datetime
+from metrics import get_metrics
+from profiler import get_rerun_profiler
+from jobs import get_job_queue, show_job_progress
+
+def admin_users():
+    """Get the usernames listed in CO2_ADMIN_USERS"""
+    return {name.strip() for name in os.environ.get("CO2_ADMIN_USERS", "").split(",") if name.strip()}
+
+def is_admin(username):
+    """Check whether a user may see the admin pages"""
+    return username in admin_users()
+
+class AdminPage:
+    def __init__(self, metrics=None, profiler=None, jobs=None):
+        self.metrics = metrics or get_metrics()
+        self.profiler = profiler or get_rerun_profiler()
+        self.jobs = jobs or get_job_queue()
+
+    def show_admin_page(self, username):
+        """Display the metrics page for administrators"""
+        st.title("🛠️ Performance Metrics")
+
+        # The navigation hides the page, but a stale session may still ask for it
+        if not is_admin(username):
+            st.error("This page is only available to administrators.")
+            return
+
+        st.caption("Timings since this server process started, by operation and page.")
+        rows = self.metrics.summary()
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.info("No operations recorded yet.")
+
+        st.subheader("📈 Gauges")
+        gauges = self.metrics.collect_gauges()
+        st.dataframe(
+            [{"metric": name, "value": value} for name, value in sorted(gauges.items())],
+            use_container_width=True,
+            hide_index=True
+        )
+
+        text = self.metrics.render_prometheus()
+        with st.expander("Prometheus export"):
+            st.code(text, language="text")
+        st.download_button("⬇️ Download metrics", text, file_name="co2_metrics.prom", mime="text/plain")
+
+        st.markdown("---")
+        self.show_jobs()
+
+        st.markdown("---")
+        self.show_profiling()
+
+    def show_jobs(self):
+        """Start maintenance jobs and list recent background jobs"""
+        st.subheader("⚙️ Background Jobs")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("🔁 Rebuild leaderboard index", use_container_width=True):
+                self.jobs.submit("rebuild_leaderboard")
+        with col2:
+            if st.button("🏅 Recompute rewards", use_container_width=True):
+                self.jobs.submit("recompute_rewards")
+        with col3:
+            if st.button("🧮 Reprice to latest factors", use_container_width=True):
+                self.jobs.submit("recompute_emissions")
+
+        jobs = self.jobs.jobs(limit=25)
+        if not jobs:
+            st.info("No jobs yet.")
+            return
+        st.dataframe(
+            [
+                {
+                    "job": job.id,
+                    "kind": job.kind,
+                    "state": job.state,
+                    "priority": job.priority,
+                    "submitted": datetime.fromtimestamp(job.submitted).strftime("%Y-%m-%d %H:%M:%S"),
+                    "seconds": round(job.finished - job.started, 3) if job.finished and job.started else None,
+                    "progress": job.progress or "",
+                    "result": job.error or (str(job.result) if job.result is not None else ""),
+                }
+                for job in jobs
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+        running = [job for job in jobs if not job.done]
+        if running:
+            show_job_progress(self.jobs, running[0].id, f"{len(running)} jobs pending")
+
+    def show_profiling(self):
+        """Arm rerun profiling and browse the captures"""
+        st.subheader("🔬 Rerun Profiling")
+
+        sessions = self.profiler.sessions()
+        armed = self.profiler.armed()
+        if sessions:
+            labels = {
+                session_id: f"{username or 'not logged in'} on {page or '?'} "
+                            f"(session {session_id}, seen {datetime.fromtimestamp(seen):%H:%M:%S})"
+                for session_id, (username, page, seen) in sessions.items()
+            }
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                session_id = st.selectbox("Session", list(labels), format_func=labels.get, key="profile_session")
+            with col2:
+                reruns = st.number_input("Reruns", min_value=1, max_value=20, value=1, key="profile_reruns")
+            if st.button("Profile next reruns", key="profile_arm"):
+                self.profiler.arm(session_id, int(reruns))
+                st.success(f"The next {int(reruns)} reruns of session {session_id} will be profiled.")
+            if armed:
+                st.caption("Waiting: " + ", ".join(f"{key} ({left} left)" for key, left in armed.items()))
+        else:
+            st.info("No sessions seen yet.")
+
+        sample_every = st.number_input(
+            "Sample every Nth rerun across all sessions (0 = off)",
+            min_value=0, value=self.profiler.sample_every, step=10, key="profile_sample_every"
+        )
+        self.profiler.sample_every = int(sample_every)
+
+        capture_ids = self.profiler.capture_ids()
+        if not capture_ids:
+            st.info("No captures yet.")
+            return
+        for capture_id in capture_ids[:20]:
+            summary = self.profiler.load_summary(capture_id)
+            if summary is None:
+                continue
+            title = (f"{summary['captured_at']} - {summary['username'] or 'not logged in'} on "
+                     f"{summary['page'] or '?'} ({summary['seconds'] * 1000:.0f} ms, "
+                     f"peak {summary['peak_bytes'] / 1024 / 1024:.1f} MB, {summary['reason']})")
+            with st.expander(title):
+                st.markdown("**Top functions by cumulative time**")
+                st.dataframe(summary["functions"], use_container_width=True, hide_index=True)
+                st.markdown("**Top allocation sites still held at the end of the rerun**")
+                st.dataframe(summary["allocations"], use_container_width=True, hide_index=True)
+                col1, col2 = st.columns(2)
+                for column, extension, label in ((col1, ".prof", "cProfile stats"),
+                                                 (col2, ".tracemalloc", "tracemalloc snapshot")):
+                    try:
+                        with open(self.profiler.artifact_path(capture_id, extension), "rb") as f:
+                            data = f.read()
+                    except FileNotFoundError:
+                        continue
+                    column.download_button(f"⬇️ {label}", data, file_name=capture_id + extension,
+                                           key=f"download_{capture_id}{extension}")
@@ -1,8 +1,9 @@
+import uuid
 import streamlit as st
-from auth import AuthManager
-from dashboard import Dashboard
-from co2_tracker import CO2Tracker
-from rewards import RewardsManager
+from managers import get_auth_manager, get_co2_tracker, get_dashboard, get_rewards_manager, get_admin_page
+from admin import is_admin
+from metrics import get_metrics
+from profiler import get_rerun_profiler
 
 # Configure the app
 st.set_page_config(
@@ -19,15 +20,15 @@ if "username" not in st.session_state:
     st.session_state.username = None
 if "current_page" not in st.session_state:
     st.session_state.current_page = "auth"
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:8]
 
-# Initialize managers
-auth_manager = AuthManager()
-dashboard = Dashboard()
-co2_tracker = CO2Tracker()
-rewards_manager = RewardsManager()
+# Initialize managers (pages create theirs on first use)
+auth_manager = get_auth_manager()
 
 def logout():
     """Handle user logout"""
+    auth_manager.end_session()
     st.session_state.authenticated = False
     st.session_state.username = None
     st.session_state.current_page = "auth"
@@ -35,10 +36,13 @@ def logout():
 
 def main():
     """Main application logic"""
+    metrics = get_metrics()
     
     # If not authenticated, show authentication page
-    if not st.session_state.authenticated:
-        auth_manager.show_auth_page()
+    if not auth_manager.check_session():
+        metrics.set_page("auth")
+        with metrics.timed("render"):
+            auth_manager.show_auth_page()
         return
     
     # Sidebar navigation for authenticated users
@@ -48,9 +52,12 @@ def main():
         st.markdown("---")
         
         # Navigation menu
+        pages = ["Dashboard", "Track CO₂", "Rewards", "Profile"]
+        if is_admin(st.session_state.username):
+            pages.append("Admin")
         page = st.radio(
             "Navigate to:",
-            ["Dashboard", "Track CO₂", "Rewards", "Profile"],
+            pages,
             key="navigation"
         )
         
@@ -58,15 +65,19 @@ def main():
         if st.button("🚪 Logout", use_container_width=True):
             logout()
     
-    # Main content area
-    if page == "Dashboard":
-        dashboard.show_dashboard(st.session_state.username)
-    elif page == "Track CO₂":
-        co2_tracker.show_tracker(st.session_state.username)
-    elif page == "Rewards":
-        rewards_manager.show_rewards_page(st.session_state.username)
-    elif page == "Profile":
-        show_profile()
+    # Main content area; everything below is timed and labelled with the page
+    metrics.set_page(page)
+    with metrics.timed("render"):
+        if page == "Dashboard":
+            get_dashboard().show_dashboard(st.session_state.username)
+        elif page == "Track CO₂":
+            get_co2_tracker().show_tracker(st.session_state.username)
+        elif page == "Rewards":
+            get_rewards_manager().show_rewards_page(st.session_state.username)
+        elif page == "Profile":
+            show_profile()
+        elif page == "Admin":
+            get_admin_page().show_admin_page(st.session_state.username)
 
 def show_profile():
     """Show user profile page"""
@@ -82,14 +93,13 @@ def show_profile():
         
     with col2:
         st.info("**Carbon Tracking Stats**")
-        # Get user's tracking statistics
-        user_data = co2_tracker.load_user_data(st.session_state.username)
-        total_entries = len(user_data) if user_data else 0
+        # Get user's tracking statistics from the rollups instead of every entry
+        rollups = get_co2_tracker().get_rollups(st.session_state.username)
+        total_entries = rollups['count']
         st.write(f"• Total Entries: {total_entries}")
         
-        if user_data:
-            total_emissions = sum(entry.get('co2_amount', 0) for entry in user_data)
-            st.write(f"• Total CO₂ Tracked: {total_emissions:.2f} kg")
+        if total_entries:
+            st.write(f"• Total CO₂ Tracked: {rollups['total']:.2f} kg")
     
     st.markdown("---")
     st.subheader("🔧 Account Actions")
@@ -99,12 +109,18 @@ def show_profile():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Yes, Delete All", type="primary", key="confirm_delete"):
-                co2_tracker.clear_user_data(st.session_state.username)
+                get_co2_tracker().clear_user_data(st.session_state.username)
                 st.success("All CO₂ data has been cleared!")
                 st.rerun()
         with col2:
             if st.button("Cancel", type="secondary", key="cancel_delete"):
                 st.rerun()
 
+def current_page():
+    """Get the page this rerun showed"""
+    return st.session_state.get("navigation") if st.session_state.authenticated else "auth"
+
 if __name__ == "__main__":
-    main()
+    # Admins can profile a session's next reruns, or sample every Nth rerun, from the admin page
+    with get_rerun_profiler().capture(st.session_state.session_id, st.session_state.username, current_page):
+        main()
@@ -1,23 +1,25 @@
 import streamlit as st
-import yaml
-import os
 from passlib.hash import pbkdf2_sha256
+from storage import get_storage
+from auth_sessions import get_user_index, get_session_tokens, get_password_verifier
 
 class AuthManager:
+    SESSION_PARAM = "session"
+    
     def __init__(self):
-        self.user_file = "users.yaml"
+        self.storage = get_storage()
+        self.user_index = get_user_index(self.storage)
+        self.session_tokens = get_session_tokens()
+        self.password_verifier = get_password_verifier()
     
     def load_users(self):
-        """Load users from YAML file"""
-        if not os.path.exists(self.user_file):
-            return {}
-        with open(self.user_file, "r") as f:
-            return yaml.safe_load(f) or {}
+        """Load users from the storage backend"""
+        # Copy so callers can modify it without touching the shared index
+        return dict(self.user_index.get_all())
     
     def save_users(self, users):
-        """Save users to YAML file"""
-        with open(self.user_file, "w") as f:
-            yaml.dump(users, f)
+        """Save users to the storage backend"""
+        self.storage.save_users(users)
     
     def login_user(self, username, password, users):
         """Verify user login credentials"""
@@ -25,12 +27,44 @@ class AuthManager:
             return True
         return False
     
+    def authenticate(self, username, password):
+        """Verify credentials on the shared worker pool; returns (success, message)"""
+        user = self.user_index.get_user(username)
+        if not user:
+            return False, "❌ Invalid username or password."
+        return self.password_verifier.verify(username, password, user['password'])
+    
+    def start_session(self, username):
+        """Mark the session as logged in and give it a session token"""
+        st.session_state.authenticated = True
+        st.session_state.username = username
+        user = self.user_index.get_user(username)
+        # Kept server-side only: a token in the URL would leak through
+        # history, referrers and logs to anyone who could then replay it
+        st.session_state.session_token = self.session_tokens.issue(username, user['password'])
+    
+    def check_session(self):
+        """Check that a logged-in session's token is still valid, without PBKDF2; logs it out if not"""
+        # Links from when tokens rode in the URL are stripped and not honoured
+        if self.SESSION_PARAM in st.query_params:
+            del st.query_params[self.SESSION_PARAM]
+        if not st.session_state.get("authenticated"):
+            return False
+        token = st.session_state.get("session_token")
+        # Expired, or the password changed since login
+        if not token or self.session_tokens.verify(token, self.user_index) != st.session_state.username:
+            self.end_session()
+            return False
+        return True
+    
+    def end_session(self):
+        """Log the session out and drop its token"""
+        st.session_state.pop("session_token", None)
+        st.session_state.authenticated = False
+        st.session_state.username = None
+    
     def signup_user(self, username, password):
         """Register a new user"""
-        users = self.load_users()
-        if username in users:
-            return False, "🚫 Username already exists!"
-        
         # Validate username and password
         if len(username.strip()) < 3:
             return False, "🚫 Username must be at least 3 characters long!"
@@ -38,11 +72,21 @@ class AuthManager:
         if len(password) < 6:
             return False, "🚫 Password must be at least 6 characters long!"
         
-        users[username] = {
-            "password": pbkdf2_sha256.hash(password),
-            "created_at": str(st.session_state.get('current_time', 'Unknown'))
-        }
-        self.save_users(users)
+        # Hash before taking the lock so the slow part doesn't block other signups
+        password_hash = pbkdf2_sha256.hash(password)
+        
+        # Hold the users lock across the read-modify-write so concurrent
+        # signups cannot overwrite each other
+        with self.storage.lock_users():
+            users = self.load_users()
+            if username in users:
+                return False, "🚫 Username already exists!"
+            
+            users[username] = {
+                "password": password_hash,
+                "created_at": str(st.session_state.get('current_time', 'Unknown'))
+            }
+            self.save_users(users)
         return True, "✅ Signup successful! You can now login."
     
     def show_auth_page(self):
@@ -72,14 +116,13 @@ class AuthManager:
                 if not username.strip() or not password.strip():
                     st.error("❌ Please enter both username and password.")
                 else:
-                    users = self.load_users()
-                    if self.login_user(username, password, users):
-                        st.session_state.authenticated = True
-                        st.session_state.username = username
+                    success, message = self.authenticate(username, password)
+                    if success:
+                        self.start_session(username)
                         st.success(f"✅ Welcome back, {username}!")
                         st.rerun()
                     else:
-                        st.error("❌ Invalid username or password.")
+                        st.error(message)
     
     def show_signup_form(self):
         """Display signup form"""
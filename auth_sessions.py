@@ -0,0 +1,207 @@
+import os
+import time
+import hmac
+import base64
+import hashlib
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from passlib.hash import pbkdf2_sha256
+from metrics import get_metrics
+
+class UserIndex:
+    """In-memory copy of the registered users, reloaded only when they change"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._users = {}
+        self._version = object()
+        self._lock = threading.Lock()
+
+    def get_all(self):
+        """Get the current users dict (do not mutate it)"""
+        version = self.storage.users_version()
+        with self._lock:
+            if version != self._version:
+                with get_metrics().timed("load_users"):
+                    self._users = self.storage.load_users()
+                self._version = version
+            return self._users
+
+    def get_user(self, username):
+        """Get one user's record, or None if they are not registered"""
+        return self.get_all().get(username)
+
+
+class SessionTokens:
+    """Signed, expiring session tokens
+
+    A token is ``username.expiry.nonce.signature`` (base64url, HMAC-SHA256).
+    The signature also covers the user's password hash, so changing a password
+    invalidates that user's existing tokens. Tokens are kept in server-side
+    session state and never sent to the browser, so ending a session only
+    has to drop its token.
+    """
+
+    def __init__(self, secret, ttl_seconds=12 * 3600):
+        self.secret = secret
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_env(cls, secret_file="user_data/.session_secret"):
+        """Create a signer from CO2_SESSION_SECRET, or a secret generated on first use"""
+        secret = os.environ.get("CO2_SESSION_SECRET")
+        if secret:
+            secret = secret.encode()
+        else:
+            if not os.path.exists(secret_file):
+                secret_dir = os.path.dirname(secret_file)
+                if secret_dir and not os.path.exists(secret_dir):
+                    os.makedirs(secret_dir)
+                fd = os.open(secret_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(secrets.token_bytes(32))
+            with open(secret_file, "rb") as f:
+                secret = f.read()
+        return cls(secret, int(os.environ.get("CO2_SESSION_TTL", 12 * 3600)))
+
+    @staticmethod
+    def _b64(value):
+        """Encode bytes as unpadded base64url"""
+        return base64.urlsafe_b64encode(value).rstrip(b"=").decode()
+
+    def _sign(self, payload, password_hash):
+        """Sign a token payload for a user"""
+        message = payload.encode() + b"|" + password_hash.encode()
+        return self._b64(hmac.new(self.secret, message, hashlib.sha256).digest())
+
+    def issue(self, username, password_hash):
+        """Create a token for a user"""
+        expiry = int(time.time()) + self.ttl_seconds
+        payload = f"{self._b64(username.encode())}.{expiry}.{secrets.token_urlsafe(12)}"
+        return f"{payload}.{self._sign(payload, password_hash)}"
+
+    def verify(self, token, user_index):
+        """Get the username a token was issued to, or None if it is invalid"""
+        try:
+            encoded_user, expiry, nonce, signature = token.split(".")
+            padding = "=" * (-len(encoded_user) % 4)
+            username = base64.urlsafe_b64decode(encoded_user + padding).decode()
+            expiry = int(expiry)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if expiry < time.time():
+            return None
+        user = user_index.get_user(username)
+        if not user:
+            return None
+        expected = self._sign(f"{encoded_user}.{expiry}.{nonce}", user['password'])
+        if not hmac.compare_digest(expected, signature):
+            return None
+        return username
+
+
+class PasswordVerifier:
+    """Runs PBKDF2 verification on a bounded pool with per-user rate limits
+
+    Each user may have one verification in flight and at most
+    ``max_attempts`` attempts per ``window_seconds``, so a burst from one
+    account cannot occupy the whole pool. A verification still running at
+    ``timeout_seconds`` fails the login; the user stays in flight until it
+    ends, so retries cannot stack up more work behind it.
+    """
+
+    def __init__(self, max_workers=2, max_attempts=5, window_seconds=60, timeout_seconds=30):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.timeout_seconds = timeout_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pbkdf2")
+        self._attempts = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        """Create a verifier sized by CO2_AUTH_WORKERS / CO2_AUTH_MAX_ATTEMPTS"""
+        return cls(
+            max_workers=int(os.environ.get("CO2_AUTH_WORKERS", max(1, (os.cpu_count() or 2) // 2))),
+            max_attempts=int(os.environ.get("CO2_AUTH_MAX_ATTEMPTS", 5)),
+            window_seconds=int(os.environ.get("CO2_AUTH_WINDOW", 60))
+        )
+
+    def _admit(self, username):
+        """Check and record a user's attempt against their limits"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune >= self.window_seconds:
+                self._prune(now)
+            if username in self._in_flight:
+                return False
+            attempts = self._attempts.setdefault(username, deque())
+            while attempts and attempts[0] <= now - self.window_seconds:
+                attempts.popleft()
+            if len(attempts) >= self.max_attempts:
+                return False
+            attempts.append(now)
+            self._in_flight.add(username)
+            return True
+
+    def _prune(self, now):
+        """Drop the attempt history of users with no attempt in the window; caller holds the lock"""
+        self._attempts = {
+            username: attempts for username, attempts in self._attempts.items()
+            if attempts and attempts[-1] > now - self.window_seconds
+        }
+        self._last_prune = now
+
+    def _release(self, username):
+        """Let a user's next attempt through"""
+        with self._lock:
+            self._in_flight.discard(username)
+
+    def verify(self, username, password, password_hash):
+        """Verify a password; returns (success, message)"""
+        if not self._admit(username):
+            return False, "⏳ Too many login attempts. Please wait a minute and try again."
+        try:
+            future = self._pool.submit(pbkdf2_sha256.verify, password, password_hash)
+        except Exception:
+            self._release(username)
+            raise
+        future.add_done_callback(lambda _: self._release(username))
+        try:
+            # Timed on the caller so it carries the page, queueing for a worker included
+            with get_metrics().timed("pbkdf2_verify"):
+                verified = future.result(timeout=self.timeout_seconds)
+        except FutureTimeout:
+            # Drops it if still queued; a running hash cannot be stopped
+            future.cancel()
+            return False, "⏳ Login is taking too long. Please try again in a moment."
+        if verified:
+            return True, None
+        return False, "❌ Invalid username or password."
+
+
+_shared = {}
+_shared_guard = threading.Lock()
+
+def _get_shared(key, factory):
+    """Get or create a process-wide auth helper"""
+    with _shared_guard:
+        if key not in _shared:
+            _shared[key] = factory()
+        return _shared[key]
+
+def get_user_index(storage):
+    """Get the process-wide user index for a storage backend"""
+    return _get_shared(("users", id(storage)), lambda: UserIndex(storage))
+
+def get_session_tokens():
+    """Get the process-wide session token signer"""
+    return _get_shared("tokens", SessionTokens.from_env)
+
+def get_password_verifier():
+    """Get the process-wide password verification pool"""
+    return _get_shared("verifier", PasswordVerifier.from_env)
@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import date, datetime, timedelta
+from multiprocessing import Pool
+
+# Total entry counts benchmarked by default
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+def parse_size(text):
+    """Parse an entry count such as 1000, 100k or 1m"""
+    text = text.strip().lower()
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+def _measure(func, repeat, setup=None):
+    """Time ``func`` ``repeat`` times, running ``setup`` untimed before each call"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "runs": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+    }
+
+def _run_size(args):
+    """Generate one data tree and time every data path against it (runs in a child process)"""
+    work_dir, total_entries, users, repeat, seed = args
+    os.chdir(work_dir)
+    from synthetic_data import SyntheticDataGenerator
+    from co2_tracker import CO2Tracker
+    from dashboard import Dashboard
+    from rewards import RewardsManager
+
+    # Streamlit calls outside `streamlit run` log "missing ScriptRunContext" warnings
+    logging.disable(logging.WARNING)
+
+    entries_per_user = max(total_entries // users, 1)
+    generator = SyntheticDataGenerator(seed=seed)
+    tracker = CO2Tracker()
+    storage = tracker.storage
+
+    started = time.perf_counter()
+    usernames = generator.populate(storage, users, entries_per_user)
+    tracker.rebuild_leaderboard_index()
+    generate_seconds = time.perf_counter() - started
+
+    dashboard = Dashboard()
+    rewards_manager = RewardsManager()
+    username = usernames[len(usernames) // 2]
+    end_date = generator.end_date
+    history_filters = {
+        "category": "Food",
+        "start_date": (end_date - timedelta(days=180)).isoformat(),
+        "end_date": end_date.isoformat()
+    }
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    added = [0]
+
+    def add_entry():
+        added[0] += 1
+        tracker.add_emission_entry(username, {
+            "date": end_date.isoformat(),
+            "activity": f"benchmark {added[0]}",
+            "category": "Other",
+            "co2_amount": 1.0,
+            "distance": None,
+            "duration": None,
+            "notes": "",
+            "entry_type": "detailed",
+            "timestamp": datetime.now().isoformat()
+        })
+
+    def reset_last_login():
+        rewards = rewards_manager.load_user_rewards(username)
+        rewards["last_login"] = yesterday
+        rewards_manager.save_user_rewards(username, rewards)
+
+    def filter_history():
+        # The storage calls show_entry_history makes for a filtered first page
+        storage.get_entry_summary(username)
+        storage.sum_entries(username, **history_filters)
+        storage.query_entry_page(username, limit=26, **history_filters)
+
+    benchmarks = [
+        ("load_user_data_cold", lambda: tracker.load_user_data(username), storage.entry_cache.clear),
+        ("load_user_data_warm", lambda: tracker.load_user_data(username), None),
+        ("add_emission_entry", add_entry, None),
+        ("get_leaderboard_top10", lambda: rewards_manager.get_leaderboard(10), None),
+        ("get_leaderboard_all", lambda: rewards_manager.get_leaderboard(), None),
+        ("update_daily_login", lambda: rewards_manager.update_daily_login(username), reset_last_login),
+        ("history_filter", filter_history, None),
+        ("history_filter_after_write", filter_history, add_entry),
+        ("show_dashboard", lambda: dashboard.show_dashboard(username), None),
+    ]
+
+    results = []
+    for name, func, setup in benchmarks:
+        timing = _measure(func, repeat, setup)
+        timing.update({"benchmark": name, "entries": total_entries, "users": users,
+                       "entries_per_user": entries_per_user})
+        results.append(timing)
+    return {"entries": total_entries, "generate_seconds": generate_seconds, "results": results}
+
+def run_benchmarks(sizes=None, users=100, repeat=5, seed=0, keep=False):
+    """Benchmark every data path at each total entry count; returns a JSON-ready dict"""
+    sizes = sizes or DEFAULT_SIZES
+    runs = []
+    for total_entries in sizes:
+        work_dir = tempfile.mkdtemp(prefix=f"co2_bench_{total_entries}_")
+        try:
+            # A fresh process per size so singletons and caches start cold
+            with Pool(1) as pool:
+                runs.append(pool.apply(_run_size, ((work_dir, total_entries, users, repeat, seed),)))
+        finally:
+            if not keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        runs[-1]["work_dir"] = work_dir if keep else None
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "storage_backend": os.environ.get("CO2_STORAGE_BACKEND", "yaml"),
+            "users": users,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "runs": runs,
+        "results": [result for run in runs for result in run["results"]],
+    }
+
+def _populate(args):
+    """Write a synthetic data tree into a directory (runs in a child process)"""
+    work_dir, users, entries_per_user, seed = args
+    os.chdir(work_dir)
+    from synthetic_data import SyntheticDataGenerator
+    from co2_tracker import CO2Tracker
+    tracker = CO2Tracker()
+    usernames = SyntheticDataGenerator(seed=seed).populate(tracker.storage, users, entries_per_user)
+    tracker.rebuild_leaderboard_index()
+    return usernames
+
+def measure_app_runs(app_dir, username, reruns):
+    """Time the app script's first run and reruns per page in this process with AppTest"""
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(app_dir, "app.py"), default_timeout=300)
+
+    def timed_run():
+        started = time.perf_counter()
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        return time.perf_counter() - started
+
+    timings = {"cold_start": [timed_run()]}
+    timings["login_rerun"] = [timed_run() for _ in range(reruns)]
+    # Log in as the login form does, without the password check
+    from storage import get_storage
+    from auth_sessions import get_session_tokens
+    app.session_state.authenticated = True
+    app.session_state.username = username
+    app.session_state.session_token = get_session_tokens().issue(username, get_storage().load_users()[username]["password"])
+    # Logging in lands on the dashboard
+    timings["dashboard_first"] = [timed_run()]
+    timings["dashboard_rerun"] = [timed_run() for _ in range(reruns)]
+    for page, name in [("Track CO₂", "tracker"), ("Rewards", "rewards")]:
+        app.sidebar.radio[0].set_value(page)
+        timings[f"{name}_first"] = [timed_run()]
+        timings[f"{name}_rerun"] = [timed_run() for _ in range(reruns)]
+    return timings
+
+def run_startup_benchmark(app_dir=None, users=10, entries_per_user=1000, reruns=10, seed=0, keep=False):
+    """Measure cold start and per-rerun time of the Streamlit app in a fresh interpreter
+
+    ``app_dir`` defaults to this checkout; point it at another checkout to
+    compare before and after a change with the same harness.
+    """
+    app_dir = os.path.abspath(app_dir or os.path.dirname(__file__))
+    work_dir = tempfile.mkdtemp(prefix="co2_startup_")
+    try:
+        with Pool(1) as pool:
+            usernames = pool.apply(_populate, ((work_dir, users, entries_per_user, seed),))
+        # A new interpreter so no app module is imported before the first run
+        script = (
+            f"import json, runpy; measure = runpy.run_path({os.path.abspath(__file__)!r})['measure_app_runs']; "
+            f"print(json.dumps(measure({app_dir!r}, {usernames[0]!r}, {reruns})))"
+        )
+        env = dict(os.environ, PYTHONPATH=app_dir, STREAMLIT_LOGGER_LEVEL="error")
+        output = subprocess.run([sys.executable, "-c", script], cwd=work_dir, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    results = []
+    for name, values in timings.items():
+        results.append({
+            "benchmark": f"app_{name}",
+            "entries": users * entries_per_user,
+            "users": users,
+            "entries_per_user": entries_per_user,
+            "runs": len(values),
+            "min": min(values),
+            "median": statistics.median(values),
+            "mean": statistics.fmean(values),
+            "max": max(values),
+        })
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "app_dir": app_dir,
+            "reruns": reruns,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+def run_catalog_benchmark(count=50_000, queries=2_000, basket_size=1_000, seed=0):
+    """Time catalog build, search-as-you-type and basket pricing on a synthetic catalog"""
+    import random
+    import tracemalloc
+    from activity_catalog import ActivityCatalog
+    from synthetic_data import generate_activity_catalog
+
+    rows = generate_activity_catalog(count, seed)
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        catalog = ActivityCatalog.from_rows(rows)
+        build_seconds = time.perf_counter() - started
+        catalog_bytes = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    # What a user has typed so far: the first letters of one or two words, sometimes with a typo
+    rng = random.Random(seed)
+    typed = []
+    for _ in range(queries):
+        words = rng.choice(catalog.names).split()
+        text = " ".join(words[:rng.choice([1, 1, 2])])[:rng.randrange(1, 12)]
+        if len(text) > 4 and rng.random() < 0.2:
+            position = rng.randrange(1, len(text) - 1)
+            text = text[:position] + text[position + 1] + text[position] + text[position + 2:]
+        typed.append(text)
+    timings = []
+    for text in typed:
+        started = time.perf_counter()
+        catalog.search(text)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    names = [rng.choice(catalog.names) for _ in range(basket_size)]
+    quantities = [rng.choice([0.5, 1.0, 2.0, 10.0]) for _ in range(basket_size)]
+    basket = _measure(lambda: catalog.price(names, quantities), 20)
+    return {
+        "items": len(catalog),
+        "build_seconds": build_seconds,
+        "catalog_mb": catalog_bytes / 1e6,
+        "search_p50_ms": timings[len(timings) // 2] * 1000,
+        "search_p95_ms": timings[int(len(timings) * 0.95)] * 1000,
+        "search_max_ms": timings[-1] * 1000,
+        "basket_items": basket_size,
+        "basket_ms": basket["median"] * 1000,
+    }
+
+def compare_results(old, new, statistic="median"):
+    """Pair up two result files as (benchmark, entries, old seconds, new seconds, ratio)"""
+    old_results = {(r["benchmark"], r["entries"]): r[statistic] for r in old["results"]}
+    rows = []
+    for r in new["results"]:
+        key = (r["benchmark"], r["entries"])
+        if key in old_results:
+            before, after = old_results[key], r[statistic]
+            rows.append((key[0], key[1], before, after, after / before if before else float("inf")))
+    return rows
+
+def load_results(path):
+    """Load a benchmark results file"""
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,123 @@
+import io
+import csv
+import json
+import time
+from entry_schema import normalize_entry
+
+IMPORT_FORMATS = ["csv", "ndjson"]
+
+def detect_format(filename):
+    """Guess the import format from a file name"""
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+def iter_rows(stream, fmt):
+    """Stream (line number, row dict) from a CSV or NDJSON text stream"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, {"_error": f"invalid JSON: {e}"}
+                continue
+            yield line_number, row if isinstance(row, dict) else {"_error": "expected a JSON object"}
+    else:
+        raise ValueError(f"Unknown import format '{fmt}', expected one of {IMPORT_FORMATS}")
+
+def open_text(binary_stream):
+    """Wrap an uploaded/binary file for streaming text reads"""
+    return io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+
+class ImportReport:
+    """Outcome of a bulk import"""
+
+    MAX_REJECTS_KEPT = 1000
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self.failed = 0
+        self.rejects = []
+        self.error = None
+        self.users = set()
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        """Get the import throughput"""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def reject(self, line_number, error):
+        """Record a rejected row, keeping the first few for display"""
+        self.rejected += 1
+        if len(self.rejects) < self.MAX_REJECTS_KEPT:
+            self.rejects.append((line_number, error))
+
+    def fail(self, line_number, error):
+        """Record a valid row whose write failed"""
+        self.failed += 1
+        if len(self.rejects) < self.MAX_REJECTS_KEPT:
+            self.rejects.append((line_number, f"not saved: {error}"))
+
+def import_entries(tracker, rows, username=None, batch_size=5000):
+    """Validate rows in batches and commit each batch as one group, one write per user
+
+    Rows name their user in a ``username`` column unless ``username`` is
+    given, in which case every row goes to that user. If a batch's write
+    fails, the rows of the users it failed for are reported as failed and
+    the import stops; every earlier batch, and the batch's other users,
+    are committed.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        by_user = {}
+        lines_by_user = {}
+        for line_number, row in batch:
+            if "_error" in row:
+                report.reject(line_number, row["_error"])
+                continue
+            target = username or str(row.get("username") or "").strip()
+            if not target:
+                report.reject(line_number, "username is required")
+                continue
+            entry, error = normalize_entry(row)
+            if error:
+                report.reject(line_number, error)
+                continue
+            by_user.setdefault(target, []).append(entry)
+            lines_by_user.setdefault(target, []).append(line_number)
+        batch.clear()
+        try:
+            errors = tracker.add_emission_entries_by_user(by_user)
+        except Exception as e:
+            errors = {target: e for target in by_user}
+        for target, entries in by_user.items():
+            error = errors.get(target)
+            if error is None:
+                report.imported += len(entries)
+                report.users.add(target)
+                continue
+            for line_number in lines_by_user[target]:
+                report.fail(line_number, error)
+            report.error = report.error or f"{target}: {error}"
+        return not errors
+
+    for line_number, row in rows:
+        report.rows += 1
+        batch.append((line_number, row))
+        if len(batch) >= batch_size and not flush():
+            break
+    else:
+        flush()
+
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,128 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+import numpy as np
+
+# Most points a time-series chart sends to the browser
+DEFAULT_POINT_BUDGET = int(os.environ.get("CO2_CHART_POINTS", 500))
+
+# Longest range (days) drawn per day, then per week; longer ranges are drawn per month
+DAILY_MAX_DAYS = 366
+WEEKLY_MAX_DAYS = 3 * 366
+
+RESOLUTION_LABELS = {"day": "Daily", "week": "Weekly", "month": "Monthly"}
+
+# Ranges offered on the dashboard, in days back from today (None for all time)
+CHART_RANGES = {
+    "Last 90 days": 90,
+    "Last year": 365,
+    "All time": None,
+}
+
+def choose_resolution(days):
+    """Pick day, week or month resolution for a range spanning ``days`` days"""
+    if days <= DAILY_MAX_DAYS:
+        return "day"
+    if days <= WEEKLY_MAX_DAYS:
+        return "week"
+    return "month"
+
+def downsample_lttb(x, y, budget):
+    """Reduce a series to ``budget`` points with Largest-Triangle-Three-Buckets
+
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with the previous pick and the next
+    bucket's average, so peaks and dips survive. ``x`` may be datetime64.
+    """
+    count = len(x)
+    if budget >= count or budget < 3:
+        return x, y
+    xs = x.astype("datetime64[D]").astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    ys = np.asarray(y, dtype=np.float64)
+
+    # Split the inner points into budget - 2 buckets
+    edges = np.linspace(1, count - 1, budget - 1).astype(np.int64)
+    picks = np.empty(budget, dtype=np.int64)
+    picks[0], picks[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(budget - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = count - 1, count
+        next_x, next_y = xs[next_start:next_end].mean(), ys[next_start:next_end].mean()
+        # Twice the triangle area for every candidate in the bucket
+        areas = np.abs((xs[previous] - next_x) * (ys[start:end] - ys[previous])
+                       - (xs[previous] - xs[start:end]) * (next_y - ys[previous]))
+        previous = start + int(np.argmax(areas))
+        picks[bucket + 1] = previous
+    return x[picks], y[picks]
+
+def emissions_series(columns, days=None, today=None, budget=DEFAULT_POINT_BUDGET):
+    """Get (dates, totals, resolution) of CO₂ over the last ``days`` days, ready to plot
+
+    The resolution follows the span actually covered, and LTTB trims what
+    is left over the point budget.
+    """
+    end_date = today if days is not None else None
+    start_date = today - timedelta(days=days - 1) if days is not None else None
+    if start_date is None:
+        span = int(columns.ordinals[-1] - columns.ordinals[0]) + 1 if len(columns) else 0
+    else:
+        span = days
+    resolution = choose_resolution(span)
+    dates, totals = columns.series(start_date, end_date, resolution)
+    dates, totals = downsample_lttb(dates, totals, budget)
+    return dates, totals, resolution
+
+
+class FigureCache:
+    """LRU of built Plotly figures keyed by (user, data version, chart, range)
+
+    Figures are reused across reruns and sessions until the user's data
+    changes; callers must not modify a cached figure.
+    """
+
+    def __init__(self, max_figures=512):
+        self.max_figures = max_figures
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username, version, chart, chart_range, build):
+        """Get a cached figure, calling ``build()`` on a miss"""
+        key = (username, version, chart, chart_range)
+        with self._lock:
+            figure = self._items.get(key)
+            if figure is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return figure
+            self.misses += 1
+        figure = build()
+        with self._lock:
+            self._items[key] = figure
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_figures:
+                self._items.popitem(last=False)
+        return figure
+
+    def clear(self):
+        """Drop every cached figure"""
+        with self._lock:
+            self._items.clear()
+
+
+_figure_cache = None
+_figure_cache_guard = threading.Lock()
+
+def get_figure_cache():
+    """Get the process-wide figure cache, sized by CO2_FIGURE_CACHE_SIZE"""
+    global _figure_cache
+    with _figure_cache_guard:
+        if _figure_cache is None:
+            _figure_cache = FigureCache(int(os.environ.get("CO2_FIGURE_CACHE_SIZE", 512)))
+        return _figure_cache
@@ -1,45 +1,136 @@
 import streamlit as st
-import yaml
 import os
+from contextlib import ExitStack
 from datetime import datetime, date
+from storage import get_storage
+from leaderboard_index import get_leaderboard_index
+from rollups import get_rollup_store
+from entry_schema import ENTRY_CATEGORIES
+from bulk_import import detect_format, iter_rows, open_text, import_entries
+from exporter import EXPORT_FORMATS, CONTENT_TYPES
+from emission_factors import get_emission_factors, price_quick_entry
+from jobs import PRIORITY_INTERACTIVE, get_job_queue, show_job_progress
+from write_coalescer import get_write_coalescer
+from metrics import get_metrics
 
 class CO2Tracker:
+    HISTORY_PAGE_SIZES = [10, 25, 50, 100]
+    QUICK_SEARCH_LIMIT = 50
+    
     def __init__(self):
         self.data_dir = "user_data"
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
-    
-    def get_user_data_file(self, username):
-        """Get the data file path for a specific user"""
-        return os.path.join(self.data_dir, f"{username}_co2_data.yaml")
+        self.storage = get_storage()
+        self.leaderboard_index = get_leaderboard_index(self.data_dir)
+        self.leaderboard_index.ensure_built(self.storage)
+        self.rollups = get_rollup_store(self.storage)
+        # Entry writes from every session are committed in groups
+        self.writes = get_write_coalescer((self.data_dir, id(self.storage)), self._commit_entries)
+        self.metrics = get_metrics()
+        self.metrics.register_collector("writes", self.write_gauges)
+        self.jobs = get_job_queue(self.data_dir)
     
     def load_user_data(self, username):
         """Load CO₂ data for a specific user"""
-        file_path = self.get_user_data_file(username)
-        if not os.path.exists(file_path):
-            return []
-        
-        with open(file_path, "r") as f:
-            data = yaml.safe_load(f)
-            return data if data else []
+        with self.metrics.timed("load_user_data"):
+            return self.storage.load_entries(username)
     
     def save_user_data(self, username, data):
         """Save CO₂ data for a specific user"""
-        file_path = self.get_user_data_file(username)
-        with open(file_path, "w") as f:
-            yaml.dump(data, f)
+        with self.metrics.timed("save_user_data"), self.storage.lock_user(username):
+            self.storage.save_entries(username, data)
+            self.leaderboard_index.set_user(username, sum(entry.get('co2_amount', 0) for entry in data), len(data))
+            self.rollups.rebuild(username, data)
     
     def clear_user_data(self, username):
         """Clear all CO₂ data for a specific user"""
-        file_path = self.get_user_data_file(username)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        with self.storage.lock_user(username):
+            self.storage.clear_entries(username)
+            self.leaderboard_index.set_user(username, 0, 0)
+            self.rollups.clear(username)
     
     def add_emission_entry(self, username, entry):
         """Add a new emission entry for a user"""
-        data = self.load_user_data(username)
-        data.append(entry)
-        self.save_user_data(username, data)
+        self.add_emission_entries(username, [entry])
+    
+    def add_emission_entries(self, username, entries):
+        """Add several emission entries for a user in one write"""
+        with self.metrics.timed("add_emission_entries"):
+            self.writes.submit(username, entries)
+    
+    def add_emission_entries_by_user(self, entries_by_user):
+        """Add entries for several users, committed together; returns the errors of users whose entries failed"""
+        return self.writes.commit_many(entries_by_user)
+    
+    def _commit_entries(self, entries_by_user):
+        """Write one group of new entries; returns the errors of users whose entries failed"""
+        errors = {}
+        changes = []
+        with self.metrics.timed("commit_entries"), ExitStack() as stack:
+            # The users' locks keep their entries and derived totals in step; always
+            # taking them in name order keeps two groups from deadlocking
+            for username in sorted(entries_by_user):
+                stack.enter_context(self.storage.lock_user(username))
+            for username, entries in entries_by_user.items():
+                try:
+                    self.storage.append_entries(username, entries)
+                except Exception as error:
+                    errors[username] = error
+                    continue
+                changes.append((username, sum(entry.get('co2_amount', 0) for entry in entries), len(entries)))
+                try:
+                    self.rollups.add_entries(username, entries)
+                except Exception as error:
+                    # The entries are stored; rollups are rebuilt from them when next missing
+                    self.rollups.clear(username)
+                    errors[username] = error
+            # One leaderboard journal write for the whole group
+            self.leaderboard_index.record_changes(changes)
+        return errors
+    
+    def delete_emission_entry(self, username, entry):
+        """Delete an emission entry for a user"""
+        # Two sessions deleting the same entry must only count it once
+        with self.storage.lock_user(username):
+            if not self.storage.has_entry(username, entry):
+                return
+            self.storage.delete_entry(username, entry)
+            self.leaderboard_index.record_change(username, -entry.get('co2_amount', 0), -1)
+            self.rollups.remove_entry(username, entry)
+    
+    def write_gauges(self):
+        """Get the write coalescer and entry cache figures for the metrics export"""
+        stats = self.writes.stats()
+        cache = self.storage.entry_cache
+        return {
+            "co2_write_groups": stats["batches"],
+            "co2_write_records": stats["records"],
+            "co2_write_failures": stats["failures"],
+            "co2_write_pending_records": stats["pending_records"],
+            "co2_write_group_records_p50": stats["batch_records"]["p50"],
+            "co2_write_group_records_p95": stats["batch_records"]["p95"],
+            "co2_write_commit_seconds_p50": stats["commit_seconds"]["p50"],
+            "co2_write_commit_seconds_p95": stats["commit_seconds"]["p95"],
+            "co2_entry_cache_hits": cache.hits,
+            "co2_entry_cache_misses": cache.misses,
+        }
+    
+    def get_rollups(self, username):
+        """Get a user's category rollups and overall totals and date bounds"""
+        return self.rollups.get(username)
+    
+    def get_recent_entries(self, username, limit):
+        """Get a user's latest entries by date"""
+        return self.storage.latest_entries(username, limit)
+    
+    def get_entry_index(self, username):
+        """Get a user's date-sorted entry index with prefix sums and chart columns"""
+        return self.storage.get_entry_index(username)
+    
+    def rebuild_leaderboard_index(self):
+        """Rebuild the leaderboard index from every user's stored entries"""
+        return self.leaderboard_index.rebuild(self.storage.get_user_totals)
     
     def show_tracker(self, username):
         """Display the CO₂ tracking interface"""
@@ -47,7 +138,9 @@ class CO2Tracker:
         st.markdown("Add your daily activities to track your carbon footprint")
         
         # Tabs for different tracking methods
-        tab1, tab2, tab3 = st.tabs(["📝 Quick Entry", "📊 Detailed Entry", "📋 View History"])
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(
+            ["📝 Quick Entry", "📊 Detailed Entry", "📋 View History", "📥 Import", "📤 Export"]
+        )
         
         with tab1:
             self.show_quick_entry_form(username)
@@ -57,33 +150,39 @@ class CO2Tracker:
         
         with tab3:
             self.show_entry_history(username)
+        
+        with tab4:
+            self.show_import_form(username)
+        
+        with tab5:
+            self.show_export_form(username)
     
     def show_quick_entry_form(self, username):
         """Show quick entry form for common activities"""
         st.subheader("⚡ Quick Entry")
         st.markdown("Select from common activities with pre-calculated CO₂ values")
         
-        # Predefined activities with CO₂ factors (kg CO₂)
-        quick_activities = {
-            "🚗 Car trip (10 km)": {"category": "Transportation", "co2": 2.31},
-            "🚌 Bus trip (10 km)": {"category": "Transportation", "co2": 0.89},
-            "🚊 Train trip (10 km)": {"category": "Transportation", "co2": 0.41},
-            "✈️ Domestic flight (1000 km)": {"category": "Transportation", "co2": 254.0},
-            "💡 Home electricity (1 day avg)": {"category": "Energy", "co2": 6.8},
-            "🔥 Natural gas heating (1 day)": {"category": "Energy", "co2": 5.3},
-            "🥩 Beef meal": {"category": "Food", "co2": 6.61},
-            "🐔 Chicken meal": {"category": "Food", "co2": 1.57},
-            "🌱 Vegetarian meal": {"category": "Food", "co2": 0.38},
-            "🛒 Grocery shopping": {"category": "Shopping", "co2": 3.2},
-        }
+        # Activities and their CO₂ factors (kg CO₂) from the latest factor version
+        factors = get_emission_factors()
+        catalog = factors.catalog()
+        
+        # The search box sits outside the form so each query reruns the search
+        query = st.text_input("🔍 Search activities:", placeholder="e.g. car, beef, grid...", key="quick_search")
+        with self.metrics.timed("catalog.search"):
+            matches = catalog.search(query, self.QUICK_SEARCH_LIMIT)
+        if not matches:
+            st.info("No activities match your search.")
+            return
         
         with st.form("quick_entry_form"):
             selected_activity = st.selectbox(
                 "Select Activity:",
-                options=list(quick_activities.keys())
+                options=matches
             )
             
-            activity_data = quick_activities[selected_activity]
+            item = catalog.index(selected_activity)
+            unit = catalog.unit(item)
+            st.caption(f"{catalog.category(item)} · {catalog.factors[item]:g} kg CO₂ per {unit or 'time'}")
             
             col1, col2 = st.columns(2)
             with col1:
@@ -91,7 +190,7 @@ class CO2Tracker:
             with col2:
                 entry_date = st.date_input("Date:", value=date.today())
             
-            estimated_co2 = activity_data["co2"] * quantity
+            estimated_co2 = price_quick_entry(float(catalog.factors[item]), quantity)
             st.info(f"Estimated CO₂: **{estimated_co2:.2f} kg**")
             
             notes = st.text_area("Additional Notes (optional):", placeholder="Any additional details...")
@@ -102,12 +201,13 @@ class CO2Tracker:
                 entry = {
                     "date": entry_date.isoformat(),
                     "activity": selected_activity,
-                    "category": activity_data["category"],
-                    "co2_amount": round(estimated_co2, 2),
+                    "category": catalog.category(item),
+                    "co2_amount": estimated_co2,
                     "quantity": quantity,
                     "notes": notes,
                     "entry_type": "quick",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(),
+                    "factor_version": factors.latest_version
                 }
                 
                 self.add_emission_entry(username, entry)
@@ -126,7 +226,7 @@ class CO2Tracker:
                 activity_name = st.text_input("Activity Description:", placeholder="e.g., Drove to work")
                 category = st.selectbox(
                     "Category:",
-                    ["Transportation", "Energy", "Food", "Shopping", "Home", "Work", "Other"]
+                    ENTRY_CATEGORIES
                 )
             
             with col2:
@@ -166,32 +266,110 @@ class CO2Tracker:
                     st.success(f"✅ Added {activity_name} ({co2_amount:.2f} kg CO₂)")
                     st.rerun()
     
+    def show_import_form(self, username):
+        """Show bulk import of historical entries from CSV or NDJSON"""
+        st.subheader("📥 Import History")
+        st.markdown(
+            "Upload a CSV (with a header row) or NDJSON file with one entry per row. "
+            "Columns: `date`, `activity`, `category`, `co2_amount`, and optionally "
+            "`entry_type`, `quantity`, `distance`, `duration`, `notes`, `timestamp`."
+        )
+        
+        uploaded = st.file_uploader("Entries file:", type=["csv", "ndjson", "jsonl"])
+        if uploaded is not None and st.button("📥 Import Entries", use_container_width=True):
+            fmt = detect_format(uploaded.name)
+            with st.spinner("Importing entries..."):
+                report = import_entries(self, iter_rows(open_text(uploaded), fmt), username=username)
+            
+            st.success(
+                f"✅ Imported {report.imported} of {report.rows} rows "
+                f"in {report.seconds:.2f}s ({report.rows_per_second:,.0f} rows/s)"
+            )
+            if report.error:
+                st.error(f"❌ Import stopped after a failed write: {report.error}")
+            if report.rejected or report.failed:
+                st.warning(f"⚠️ {report.rejected} rows were rejected, {report.failed} could not be saved")
+                st.dataframe(
+                    [{"line": line_number, "error": error} for line_number, error in report.rejects[:100]],
+                    use_container_width=True
+                )
+    
+    def show_export_form(self, username):
+        """Show a download of the user's entries as CSV, NDJSON or Parquet"""
+        st.subheader("📤 Export History")
+        
+        summary = self.storage.get_entry_summary(username)
+        if not summary['min_date']:
+            st.info("No entries to export yet.")
+            return
+        
+        min_date = date.fromisoformat(summary['min_date'])
+        max_date = date.fromisoformat(summary['max_date'])
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            fmt = st.selectbox("Format:", EXPORT_FORMATS)
+        with col2:
+            start_date = st.date_input("From:", value=min_date, min_value=min_date, max_value=max_date, key="export_start")
+        with col3:
+            end_date = st.date_input("To:", value=max_date, min_value=min_date, max_value=max_date, key="export_end")
+        
+        if st.button("📦 Prepare Export", use_container_width=True):
+            # Rows stream into a file on a worker thread while the page polls
+            st.session_state.export_job = self.jobs.submit("export", {
+                "data_dir": self.data_dir,
+                "usernames": [username],
+                "format": fmt,
+                "start": start_date.isoformat(),
+                "end": end_date.isoformat()
+            }, PRIORITY_INTERACTIVE)
+        
+        job_id = st.session_state.get("export_job")
+        job = self.jobs.get(job_id) if job_id else None
+        if job is None or job.params["usernames"] != [username]:
+            return
+        if not job.done:
+            show_job_progress(self.jobs, job.id, "Preparing your export")
+            return
+        if job.state != "done":
+            st.error(f"❌ {job.error}")
+            return
+        try:
+            # The download button serves from memory, so only the finished file is read back
+            with open(job.result["path"], "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            st.info("This export has expired. Prepare it again to download it.")
+            return
+        params = job.params
+        st.download_button(
+            f"⬇️ Download {job.result['count']} entries",
+            data=data,
+            file_name=f"{username}_co2_{params['start']}_{params['end']}.{params['format']}",
+            mime=CONTENT_TYPES[params["format"]],
+            use_container_width=True
+        )
+    
     def show_entry_history(self, username):
         """Show history of CO₂ entries"""
         st.subheader("📋 Entry History")
         
-        data = self.load_user_data(username)
+        summary = self.storage.get_entry_summary(username)
         
-        if not data:
+        if not summary['min_date']:
             st.info("No entries found. Start tracking your CO₂ emissions using the forms above!")
             return
         
-        # Sort by date (newest first)
-        sorted_data = sorted(data, key=lambda x: x['date'], reverse=True)
-        
         # Filters
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            categories = ["All"] + list(set(entry['category'] for entry in data))
+            categories = ["All"] + summary['categories']
             selected_category = st.selectbox("Filter by Category:", categories)
         
         # Get date range for filters
-        if data:
-            min_date = min(datetime.fromisoformat(entry['date']).date() for entry in data)
-            max_date = max(datetime.fromisoformat(entry['date']).date() for entry in data)
-        else:
-            min_date = max_date = datetime.now().date()
+        min_date = date.fromisoformat(summary['min_date'])
+        max_date = date.fromisoformat(summary['max_date'])
 
         with col2:
             start_date = st.date_input("From Date:", value=min_date, min_value=min_date, max_value=max_date)
@@ -199,26 +377,36 @@ class CO2Tracker:
         with col3:
             end_date = st.date_input("To Date:", value=max_date, min_value=min_date, max_value=max_date)
         
-        # Filter data
-        filtered_data = sorted_data
-        if selected_category != "All":
-            filtered_data = [entry for entry in filtered_data if entry['category'] == selected_category]
+        filters = {
+            "category": None if selected_category == "All" else selected_category,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat()
+        }
+        
+        page_size = st.selectbox("Entries per page:", self.HISTORY_PAGE_SIZES, index=1)
         
-        if data:  # Only apply date filter if we have data
-            filtered_data = [
-                entry for entry in filtered_data
-                if start_date <= datetime.fromisoformat(entry['date']).date() <= end_date
-            ]
+        # Page cursors restart whenever the filters or page size change
+        cursor_key = (username, tuple(filters.values()), page_size)
+        if st.session_state.get("history_cursor_key") != cursor_key:
+            st.session_state.history_cursor_key = cursor_key
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
         
-        # Display summary
-        if filtered_data:
-            total_filtered_co2 = sum(entry['co2_amount'] for entry in filtered_data)
+        # Display summary over the whole selection without materializing it
+        total_filtered_co2, filtered_count = self.storage.sum_entries(username, **filters)
+        if filtered_count:
             st.metric("Total CO₂ in Selection:", f"{total_filtered_co2:.2f} kg")
         
+        # Fetch one extra row to know whether there is a next page
+        page = self.storage.query_entry_page(username, limit=page_size + 1, after=cursors[-1], **filters)
+        has_next = len(page) > page_size
+        page = page[:page_size]
+        filtered_data = [entry for _, entry in page]
+        
         # Display entries
         st.markdown("---")
         
-        for i, entry in enumerate(filtered_data):
+        for i, (position, entry) in enumerate(page):
             with st.expander(
                 f"📅 {entry['date']} - {entry['activity']} ({entry['co2_amount']} kg CO₂)",
                 expanded=i < 5  # Expand first 5 entries
@@ -245,18 +433,32 @@ class CO2Tracker:
                     st.write(f"**Notes:** {entry['notes']}")
                 
                 # Delete button
-                if st.button(f"🗑️ Delete", key=f"delete_{i}"):
+                if st.button(f"🗑️ Delete", key=f"delete_{position[1]}"):
                     st.warning(f"⚠️ Delete this entry: {entry['activity']}?")
                     col1, col2 = st.columns(2)
                     with col1:
-                        if st.button("Yes, Delete", type="primary", key=f"confirm_delete_{i}"):
-                            data.remove(entry)
-                            self.save_user_data(username, data)
+                        if st.button("Yes, Delete", type="primary", key=f"confirm_delete_{position[1]}"):
+                            self.delete_emission_entry(username, entry)
                             st.success("Entry deleted!")
                             st.rerun()
                     with col2:
-                        if st.button("Cancel", type="secondary", key=f"cancel_delete_{i}"):
+                        if st.button("Cancel", type="secondary", key=f"cancel_delete_{position[1]}"):
                             st.rerun()
         
         if not filtered_data:
             st.info("No entries match the selected filters.")
+        
+        # Cursor-based paging
+        page_number = len(cursors)
+        page_count = max((filtered_count + page_size - 1) // page_size, 1)
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Previous", disabled=page_number == 1, key="history_prev"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            st.caption(f"Page {page_number} of {page_count} ({filtered_count} entries)")
+        with col3:
+            if st.button("Next ➡️", disabled=not has_next, key="history_next"):
+                cursors.append(page[-1][0])
+                st.rerun()
@@ -0,0 +1,222 @@
+import io
+import threading
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+# Fields of the entry schema that CompactEntry stores in slots
+ENTRY_FIELDS = (
+    "date", "activity", "category", "co2_amount", "quantity", "distance",
+    "duration", "notes", "entry_type", "timestamp", "factor_version"
+)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+class EntryCodes:
+    """Process-wide table interning repeated values as small integer codes
+
+    Categories, activities, entry types and key layouts repeat across
+    thousands of entries, so each distinct value is stored once here and
+    entries keep its code.
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+        self._key_sets = {}
+        self._lock = threading.Lock()
+
+    def code(self, value):
+        """Get the code for a value, assigning the next one if it is new"""
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def value(self, code):
+        """Get the value for a code"""
+        return self._values[code]
+
+    def key_set(self, code):
+        """Get the keys of an interned key layout as a frozenset"""
+        key_set = self._key_sets.get(code)
+        if key_set is None:
+            key_set = self._key_sets[code] = frozenset(self._values[code])
+        return key_set
+
+    def __len__(self):
+        return len(self._values)
+
+
+ENTRY_CODES = EntryCodes()
+
+def _encode_date(value):
+    """Get the day ordinal for an ISO date string, or None if it would not round-trip"""
+    if type(value) is not str:
+        return None
+    try:
+        ordinal = date.fromisoformat(value).toordinal()
+    except ValueError:
+        return None
+    return ordinal if date.fromordinal(ordinal).isoformat() == value else None
+
+def _encode_timestamp(value):
+    """Get microseconds since the epoch for an ISO timestamp, or None if it would not round-trip"""
+    if type(value) is not str:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        return None
+    micros = (moment - _EPOCH) // _MICROSECOND
+    return micros if (_EPOCH + timedelta(microseconds=micros)).isoformat() == value else None
+
+class CompactEntry:
+    """One CO₂ entry in slots: day ordinal, integer timestamp and interned codes
+
+    ``from_dict``/``to_dict`` convert losslessly to and from the stored
+    schema, key order included. Values that do not fit the compact form
+    (odd dates, unknown keys, non-string labels) are kept as they are in
+    ``extra``.
+    """
+
+    __slots__ = (
+        "shape", "date", "activity", "category", "co2_amount", "quantity",
+        "distance", "duration", "notes", "entry_type", "timestamp", "factor_version", "extra"
+    )
+
+    @classmethod
+    def from_dict(cls, entry):
+        """Build a compact entry from a schema dict"""
+        self = cls.__new__(cls)
+        codes = ENTRY_CODES
+        extra = None
+        self.shape = codes.code(tuple(entry))
+
+        self.date = _encode_date(entry.get("date"))
+        if self.date is None and "date" in entry:
+            extra = {"date": entry["date"]}
+        self.timestamp = _encode_timestamp(entry.get("timestamp"))
+        if self.timestamp is None and "timestamp" in entry:
+            extra = extra or {}
+            extra["timestamp"] = entry["timestamp"]
+
+        for field in ("activity", "category", "entry_type"):
+            value = entry.get(field)
+            if type(value) is str:
+                setattr(self, field, codes.code(value))
+            else:
+                setattr(self, field, None)
+                if field in entry:
+                    extra = extra or {}
+                    extra[field] = value
+
+        self.co2_amount = entry.get("co2_amount")
+        self.quantity = entry.get("quantity")
+        self.distance = entry.get("distance")
+        self.duration = entry.get("duration")
+        self.notes = entry.get("notes")
+        self.factor_version = entry.get("factor_version")
+
+        for key in entry:
+            if key not in ENTRY_FIELDS:
+                extra = extra or {}
+                extra[key] = entry[key]
+        self.extra = extra
+        return self
+
+    def to_dict(self):
+        """Get the entry back as a schema dict"""
+        codes = ENTRY_CODES
+        extra = self.extra
+        entry = {}
+        for key in codes.value(self.shape):
+            if extra is not None and key in extra:
+                entry[key] = extra[key]
+            elif key == "date":
+                entry[key] = date.fromordinal(self.date).isoformat()
+            elif key == "timestamp":
+                entry[key] = (_EPOCH + timedelta(microseconds=self.timestamp)).isoformat()
+            elif key in ("activity", "category", "entry_type"):
+                entry[key] = codes.value(getattr(self, key))
+            else:
+                entry[key] = getattr(self, key)
+        return entry
+
+    def get_date(self):
+        """Get the entry date as an ISO string"""
+        if self.date is not None:
+            return date.fromordinal(self.date).isoformat()
+        return str(self.extra["date"])
+
+    def get_category(self):
+        """Get the category string"""
+        if self.category is not None:
+            return ENTRY_CODES.value(self.category)
+        return self.extra.get("category") if self.extra else None
+
+    def _key(self):
+        """Get the slot values compared by ``==``; like dicts, key order does not matter"""
+        return (ENTRY_CODES.key_set(self.shape), self.date, self.activity, self.category, self.co2_amount,
+                self.quantity, self.distance, self.duration, self.notes, self.entry_type, self.timestamp, self.factor_version, self.extra)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactEntry):
+            return NotImplemented
+        return self._key() == other._key()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"CompactEntry({self.to_dict()!r})"
+
+
+def compact_entries(entries):
+    """Convert schema dicts to compact entries"""
+    return [CompactEntry.from_dict(entry) for entry in entries]
+
+def expand_entries(entries):
+    """Convert compact entries back to schema dicts"""
+    return [entry.to_dict() for entry in entries]
+
+def measure_entry_memory(codec, entries, per=100_000):
+    """Measure heap bytes per ``per`` entries as parsed dicts and as compact entries
+
+    The dicts are parsed from the codec's serialized form so their strings
+    are separate objects, as they are after loading a real file.
+    """
+    buffer = io.BytesIO() if codec.binary else io.StringIO()
+    codec.dump(entries, buffer)
+    serialized = buffer.getvalue()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        parsed = codec.load(io.BytesIO(serialized) if codec.binary else io.StringIO(serialized))
+        dict_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+        # Codes interned by earlier entries are shared, so count the table as it grows here
+        baseline = tracemalloc.get_traced_memory()[0]
+        compact = compact_entries(parsed)
+        compact_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    if expand_entries(compact) != parsed:
+        raise ValueError("Compact entries did not convert back to the parsed entries")
+    scale = per / len(parsed)
+    return {
+        "entries": len(parsed),
+        "dict_bytes_per_entry": dict_bytes / len(parsed),
+        "compact_bytes_per_entry": compact_bytes / len(parsed),
+        f"dict_mb_per_{per}": dict_bytes * scale / 1e6,
+        f"compact_mb_per_{per}": compact_bytes * scale / 1e6,
+        "ratio": compact_bytes / dict_bytes if dict_bytes else 0.0,
+    }
@@ -1,57 +1,58 @@
 import streamlit as st
 import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
-from datetime import datetime, timedelta
+from datetime import date
 from co2_tracker import CO2Tracker
+from chart_figures import CHART_RANGES, RESOLUTION_LABELS, emissions_series, get_figure_cache
 
 class Dashboard:
-    def __init__(self):
-        self.co2_tracker = CO2Tracker()
+    def __init__(self, co2_tracker=None):
+        self.co2_tracker = co2_tracker or CO2Tracker()
+        self.figure_cache = get_figure_cache()
+        self.metrics = self.co2_tracker.metrics
     
     def show_dashboard(self, username):
         """Display the main dashboard"""
         st.title("📊 CO₂ Emissions Dashboard")
         st.markdown(f"**Personal carbon footprint overview for {username}**")
         
-        # Load user data
-        user_data = self.co2_tracker.load_user_data(username)
+        # Headline figures come from the write-time rollups, charts from the entry index
+        rollups = self.co2_tracker.get_rollups(username)
         
-        if not user_data:
+        if not rollups['count']:
             st.info("🌱 Welcome to your CO₂ tracker! Start by adding your first emission entry in the 'Track CO₂' section.")
             self.show_getting_started()
             return
         
-        # Convert to DataFrame for easier analysis
-        df = pd.DataFrame(user_data)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
+        # Date-sorted index whose columns and frames are rebuilt only when the entries change
+        index = self.co2_tracker.get_entry_index(username)
+        columns = index.columns()
         
-        # Key metrics
-        self.show_key_metrics(df)
+        # Key metrics, with the last 30 days compared against the 30 before
+        comparison = index.compare_periods(date.today(), 30)
+        self.show_key_metrics(rollups, comparison)
         
         # Suggestions based on highest emission category
-        self.show_reduction_suggestions(df)
+        self.show_reduction_suggestions(rollups)
         
         # Charts
         col1, col2 = st.columns(2)
         
         with col1:
-            self.show_emissions_over_time(df)
-            self.show_category_breakdown(df)
+            self.show_emissions_over_time(username, columns)
+            self.show_category_breakdown(username, columns)
         
         with col2:
-            self.show_monthly_comparison(df)
-            self.show_recent_activities(df)
+            self.show_monthly_comparison(username, columns)
+            self.show_recent_activities(username)
     
-    def show_key_metrics(self, df):
+    def show_key_metrics(self, rollups, comparison):
         """Display key metrics cards"""
         st.subheader("📈 Key Metrics")
         
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2, col3, col4, col5 = st.columns(5)
         
         # Total emissions
-        total_emissions = df['co2_amount'].sum()
+        total_emissions = rollups['total']
         with col1:
             st.metric(
                 label="Total CO₂ Emissions",
@@ -60,8 +61,8 @@ class Dashboard:
             )
         
         # Average daily emissions
-        if len(df) > 0:
-            days_tracked = (df['date'].max() - df['date'].min()).days + 1
+        if rollups['count'] > 0:
+            days_tracked = (date.fromisoformat(rollups['max_date']) - date.fromisoformat(rollups['min_date'])).days + 1
             avg_daily = total_emissions / max(days_tracked, 1)
         else:
             avg_daily = 0
@@ -77,13 +78,13 @@ class Dashboard:
         with col3:
             st.metric(
                 label="Total Entries",
-                value=len(df),
+                value=rollups['count'],
                 delta=None
             )
         
-        # Most common category
-        if len(df) > 0:
-            most_common = df['category'].mode().iloc[0] if not df['category'].mode().empty else "N/A"
+        # Most common category (ties go to the alphabetically first, like Series.mode)
+        if rollups['categories']:
+            most_common = min(rollups['categories'].items(), key=lambda item: (-item[1][1], item[0]))[0]
         else:
             most_common = "N/A"
         
@@ -93,78 +94,93 @@ class Dashboard:
                 value=most_common,
                 delta=None
             )
+        
+        # Last 30 days vs the previous 30 days (lower is better)
+        current_period, previous_period = comparison
+        with col5:
+            st.metric(
+                label="Last 30 Days",
+                value=f"{current_period:.2f} kg",
+                delta=f"{current_period - previous_period:+.2f} kg vs previous 30",
+                delta_color="inverse"
+            )
     
-    def show_emissions_over_time(self, df):
+    def show_emissions_over_time(self, username, columns):
         """Show emissions trend over time"""
         st.subheader("📅 Emissions Over Time")
         
-        # Group by date and sum emissions
-        daily_emissions = df.groupby('date')['co2_amount'].sum().reset_index()
-        
-        fig = px.line(
-            daily_emissions,
-            x='date',
-            y='co2_amount',
-            title='Daily CO₂ Emissions',
-            labels={'co2_amount': 'CO₂ Emissions (kg)', 'date': 'Date'}
-        )
-        
-        fig.update_layout(
-            xaxis_title="Date",
-            yaxis_title="CO₂ Emissions (kg)",
-            showlegend=False
-        )
+        range_name = st.selectbox("Range", list(CHART_RANGES), index=len(CHART_RANGES) - 1, key="emissions_range")
+        today = date.today()
+        
+        def build():
+            # Long ranges are drawn per week or month and capped at a point budget
+            dates, totals, resolution = emissions_series(columns, CHART_RANGES[range_name], today)
+            fig = px.line(
+                x=dates,
+                y=totals,
+                title=f'{RESOLUTION_LABELS[resolution]} CO₂ Emissions',
+                labels={'y': 'CO₂ Emissions (kg)', 'x': 'Date'}
+            )
+            fig.update_layout(
+                xaxis_title="Date",
+                yaxis_title="CO₂ Emissions (kg)",
+                showlegend=False
+            )
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        # The range is relative to today, so the day is part of its key
+        with self.metrics.timed("chart.emissions"):
+            fig = self.figure_cache.get(username, columns.version, "emissions", (range_name, today.isoformat()), build)
+            st.plotly_chart(fig, use_container_width=True)
     
-    def show_category_breakdown(self, df):
+    def show_category_breakdown(self, username, columns):
         """Show emissions by category"""
         st.subheader("🏷️ Emissions by Category")
         
-        category_emissions = df.groupby('category')['co2_amount'].sum().reset_index()
-        
-        fig = px.pie(
-            category_emissions,
-            values='co2_amount',
-            names='category',
-            title='CO₂ Emissions by Category'
-        )
+        def build():
+            return px.pie(
+                columns.by_category(),
+                values='co2_amount',
+                names='category',
+                title='CO₂ Emissions by Category'
+            )
         
-        st.plotly_chart(fig, use_container_width=True)
+        with self.metrics.timed("chart.categories"):
+            fig = self.figure_cache.get(username, columns.version, "categories", None, build)
+            st.plotly_chart(fig, use_container_width=True)
     
-    def show_monthly_comparison(self, df):
+    def show_monthly_comparison(self, username, columns):
         """Show monthly emissions comparison"""
         st.subheader("📆 Monthly Comparison")
         
-        # Add month-year column
-        df['month_year'] = df['date'].dt.to_period('M').astype(str)
-        monthly_emissions = df.groupby('month_year')['co2_amount'].sum().reset_index()
-        
-        fig = px.bar(
-            monthly_emissions,
-            x='month_year',
-            y='co2_amount',
-            title='Monthly CO₂ Emissions',
-            labels={'co2_amount': 'CO₂ Emissions (kg)', 'month_year': 'Month'}
-        )
-        
-        fig.update_layout(
-            xaxis_title="Month",
-            yaxis_title="CO₂ Emissions (kg)",
-            showlegend=False
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        def build():
+            fig = px.bar(
+                columns.monthly(),
+                x='month_year',
+                y='co2_amount',
+                title='Monthly CO₂ Emissions',
+                labels={'co2_amount': 'CO₂ Emissions (kg)', 'month_year': 'Month'}
+            )
+            fig.update_layout(
+                xaxis_title="Month",
+                yaxis_title="CO₂ Emissions (kg)",
+                showlegend=False
+            )
+            return fig
+        
+        with self.metrics.timed("chart.monthly"):
+            fig = self.figure_cache.get(username, columns.version, "monthly", None, build)
+            st.plotly_chart(fig, use_container_width=True)
     
-    def show_recent_activities(self, df):
+    def show_recent_activities(self, username):
         """Show recent activities"""
         st.subheader("🕒 Recent Activities")
         
-        # Get last 5 entries
-        recent_df = df.tail(5).sort_values('date', ascending=False)
+        # Get last 5 entries by date without sorting the whole history
+        recent = self.co2_tracker.get_recent_entries(username, 5)
         
-        if len(recent_df) > 0:
-            for _, row in recent_df.iterrows():
+        if recent:
+            for row in recent:
                 with st.container():
                     col1, col2, col3 = st.columns([2, 1, 1])
                     with col1:
@@ -173,7 +189,7 @@ class Dashboard:
                     with col2:
                         st.write(f"{row['co2_amount']:.2f} kg")
                     with col3:
-                        st.write(row['date'].strftime('%m/%d/%Y'))
+                        st.write(date.fromisoformat(row['date']).strftime('%m/%d/%Y'))
                     st.divider()
         else:
             st.info("No recent activities found.")
@@ -205,20 +221,16 @@ class Dashboard:
         
         st.info("💡 Tip: Start by tracking your daily commute and energy usage. These are usually the biggest contributors to personal carbon footprints!")
     
-    def show_reduction_suggestions(self, df):
+    def show_reduction_suggestions(self, rollups):
         """Show personalized suggestions to reduce carbon footprint"""
         st.subheader("💡 Personalized Reduction Suggestions")
         
-        # Calculate emissions by category
-        category_emissions = df.groupby('category')['co2_amount'].sum().sort_values(ascending=False)
-        
-        if len(category_emissions) == 0:
+        if not rollups['categories']:
             return
         
         # Get the highest contributing category
-        top_category = category_emissions.index[0]
-        top_emissions = category_emissions.iloc[0]
-        total_emissions = df['co2_amount'].sum()
+        top_category, (top_emissions, _) = max(rollups['categories'].items(), key=lambda item: item[1][0])
+        total_emissions = rollups['total']
         percentage = (top_emissions / total_emissions) * 100
         
         # Suggestion mappings for each category
@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+
+class UserDataCache:
+    """Process-wide LRU cache of parsed per-user entry lists
+
+    Every cached list is stored with the storage version token it was read at
+    (file mtime/size for YAML, row id/count for SQLite), so a lookup with a
+    different token is a miss. Eviction keeps both the number of cached users
+    and the total number of cached entries under budget.
+    """
+
+    def __init__(self, max_users=1000, max_entries=200_000):
+        self.max_users = max_users
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._entry_total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        """Create a cache sized by CO2_CACHE_MAX_USERS / CO2_CACHE_MAX_ENTRIES"""
+        return cls(
+            max_users=int(os.environ.get("CO2_CACHE_MAX_USERS", 1000)),
+            max_entries=int(os.environ.get("CO2_CACHE_MAX_ENTRIES", 200_000))
+        )
+
+    def get(self, username, version):
+        """Get a copy of a user's cached entries if they are still at ``version``"""
+        with self._lock:
+            item = self._items.get(username)
+            if item is None or item[0] != version:
+                self.misses += 1
+                return None
+            self._items.move_to_end(username)
+            self.hits += 1
+            return list(item[1])
+
+    def put(self, username, version, entries):
+        """Cache a user's entries at ``version``"""
+        entries = list(entries)
+        with self._lock:
+            self._discard(username)
+            if len(entries) > self.max_entries:
+                return
+            self._items[username] = (version, entries)
+            self._entry_total += len(entries)
+            self._evict()
+
+    def update(self, username, old_version, new_version, change):
+        """Apply ``change`` to a user's cached list if it is still at ``old_version``"""
+        with self._lock:
+            item = self._items.get(username)
+            if item is None or item[0] != old_version:
+                self._discard(username)
+                return
+            entries = item[1]
+            before = len(entries)
+            change(entries)
+            self._items[username] = (new_version, entries)
+            self._items.move_to_end(username)
+            self._entry_total += len(entries) - before
+            self._evict()
+
+    def invalidate(self, username):
+        """Drop a user's cached entries"""
+        with self._lock:
+            self._discard(username)
+
+    def clear(self):
+        """Drop everything"""
+        with self._lock:
+            self._items.clear()
+            self._entry_total = 0
+
+    def stats(self):
+        """Get hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "users": len(self._items),
+                "entries": self._entry_total,
+                "max_users": self.max_users,
+                "max_entries": self.max_entries
+            }
+
+    def _discard(self, username):
+        """Remove a user's item; caller holds the lock"""
+        item = self._items.pop(username, None)
+        if item is not None:
+            self._entry_total -= len(item[1])
+
+    def _evict(self):
+        """Evict least recently used users until within budget; caller holds the lock"""
+        while self._items and (len(self._items) > self.max_users or self._entry_total > self.max_entries):
+            _, (_, entries) = self._items.popitem(last=False)
+            self._entry_total -= len(entries)
+            self.evictions += 1
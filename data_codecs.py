@@ -0,0 +1,273 @@
+import os
+import queue
+import logging
+import threading
+from datetime import date, datetime
+import yaml
+from file_lock import atomic_write
+from metrics import get_metrics
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for CO2_CODEC=msgpack
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# libyaml's loader and dumper read and write the same YAML as the pure-Python ones
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+class YamlCodec:
+    """Human-readable YAML, parsed and emitted by libyaml when it is installed"""
+
+    name = "yaml"
+    extension = ".yaml"
+    binary = False
+
+    def load(self, f):
+        """Read one document"""
+        return yaml.load(f, Loader=YamlLoader)
+
+    def dump(self, data, f):
+        """Write one document"""
+        yaml.dump(data, f, Dumper=YamlDumper)
+
+    def dump_records(self, records):
+        """Serialize records for appending to a journal file"""
+        # A YAML block sequence stays valid when another one is appended to it
+        return yaml.dump(records, Dumper=YamlDumper)
+
+    def load_records(self, f):
+        """Read every record appended to a journal file"""
+        return self.load(f) or []
+
+
+class MsgpackCodec:
+    """Compact binary MessagePack; a journal file is a stream of packed record lists"""
+
+    name = "msgpack"
+    extension = ".msgpack"
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("The msgpack codec needs the msgpack package; install it or set CO2_CODEC=yaml")
+
+    @staticmethod
+    def _default(value):
+        """Store dates the way the YAML files spell them"""
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+    def _pack(self, data):
+        """Pack one value"""
+        return msgpack.packb(data, default=self._default, use_bin_type=True)
+
+    def load(self, f):
+        data = f.read()
+        return msgpack.unpackb(data, raw=False) if data else None
+
+    def dump(self, data, f):
+        f.write(self._pack(data))
+
+    def dump_records(self, records):
+        return self._pack(records)
+
+    def load_records(self, f):
+        records = []
+        # Stops at a trailing partial write instead of failing the whole read
+        for chunk in msgpack.Unpacker(f, raw=False):
+            records.extend(chunk)
+        return records
+
+
+CODECS = {
+    "yaml": YamlCodec,
+    "msgpack": MsgpackCodec,
+}
+
+class CodecFiles:
+    """Reads and writes data files in one codec, picking up files left in another
+
+    Stores name files by their path without an extension (the "base"); the
+    codec adds its own. Reads fall back to a file in another known format
+    when the current one does not exist yet and queue it for conversion;
+    writes always produce the current format and drop the older file.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.legacy_codecs = []
+        for name, codec_class in CODECS.items():
+            if name != codec.name:
+                try:
+                    self.legacy_codecs.append(codec_class())
+                except RuntimeError:
+                    pass
+        self.migrator = CodecMigrator(self)
+
+    def path(self, base):
+        """Get the current-format file path for a base path"""
+        return base + self.codec.extension
+
+    def find(self, base):
+        """Get (path, codec) of the file holding a base path's data, or (None, None)"""
+        path = self.path(base)
+        if os.path.exists(path):
+            return path, self.codec
+        for codec in self.legacy_codecs:
+            legacy_path = base + codec.extension
+            if os.path.exists(legacy_path):
+                return legacy_path, codec
+        return None, None
+
+    def exists(self, base):
+        """Check whether a base path has data in any format"""
+        return self.find(base)[0] is not None
+
+    def version(self, base):
+        """Identify the current version of a base path's file, or None if it has none"""
+        path, _ = self.find(base)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read(self, path, codec, records):
+        """Read a file with a codec"""
+        with open(path, "rb" if codec.binary else "r") as f:
+            get_metrics().add_bytes(read=os.fstat(f.fileno()).st_size)
+            return codec.load_records(f) if records else codec.load(f)
+
+    def read(self, base, lock=None, records=False):
+        """Read a base path's data, or None if there is none
+
+        ``lock`` is a callable returning the context manager that guards the
+        file; when given, a file found in an older format is queued for
+        conversion under that lock.
+        """
+        path, codec = self.find(base)
+        if path is None:
+            return None
+        try:
+            data = self._read(path, codec, records)
+        except FileNotFoundError:
+            # Converted or removed between find() and open(); look again
+            return self.read(base, lock, records)
+        if codec is not self.codec and lock is not None:
+            self.migrator.schedule(base, lock, records)
+        return data
+
+    def read_records(self, base, lock=None):
+        """Read every record appended to a journal base path"""
+        return self.read(base, lock, records=True) or []
+
+    def _remove_legacy(self, base):
+        """Remove older-format files for a base path"""
+        for codec in self.legacy_codecs:
+            legacy_path = base + codec.extension
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+    def write(self, base, data, records=False):
+        """Replace a base path's data in the current format; caller holds its lock"""
+        codec = self.codec
+        if records:
+            atomic_write(self.path(base), lambda f: f.write(codec.dump_records(data)), binary=codec.binary)
+        else:
+            atomic_write(self.path(base), lambda f: codec.dump(data, f), binary=codec.binary)
+        get_metrics().add_bytes(written=os.path.getsize(self.path(base)))
+        self._remove_legacy(base)
+
+    def append_records(self, base, records):
+        """Append records to a journal base path; caller holds its lock"""
+        if not os.path.exists(self.path(base)):
+            self.migrate(base, records=True)
+        with open(self.path(base), "ab" if self.codec.binary else "a") as f:
+            # Written in one call so a crash cannot leave half a record
+            size = os.fstat(f.fileno()).st_size
+            f.write(self.codec.dump_records(records))
+            f.flush()
+            os.fsync(f.fileno())
+            get_metrics().add_bytes(written=os.fstat(f.fileno()).st_size - size)
+
+    def remove(self, base):
+        """Remove a base path's data in every format; caller holds its lock"""
+        if os.path.exists(self.path(base)):
+            os.remove(self.path(base))
+        self._remove_legacy(base)
+
+    def migrate(self, base, records=False):
+        """Convert a base path's older-format file to the current format; caller holds its lock"""
+        path, codec = self.find(base)
+        if path is None:
+            return False
+        if codec is self.codec:
+            # Left over from a conversion interrupted after the new file landed
+            self._remove_legacy(base)
+            return False
+        self.write(base, self._read(path, codec, records), records)
+        return True
+
+
+class CodecMigrator:
+    """Background thread converting files found in an older format to the current one"""
+
+    def __init__(self, files):
+        self.files = files
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._guard = threading.Lock()
+        self._thread = None
+        self.converted = 0
+
+    def schedule(self, base, lock, records=False):
+        """Queue a base path for conversion under ``lock()``"""
+        with self._guard:
+            if base in self._pending:
+                return
+            self._pending.add(base)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((base, lock, records))
+
+    def _run(self):
+        """Convert queued files one at a time"""
+        while True:
+            base, lock, records = self._queue.get()
+            try:
+                with lock():
+                    if self.files.migrate(base, records):
+                        self.converted += 1
+            except Exception:
+                # The old file still works; the next read queues it again
+                logger.exception("Could not convert %s to %s", base, self.files.codec.name)
+            finally:
+                with self._guard:
+                    self._pending.discard(base)
+                self._queue.task_done()
+
+    def wait(self):
+        """Block until every queued conversion has finished"""
+        self._queue.join()
+
+
+_files = None
+_files_guard = threading.Lock()
+
+def get_codec_files():
+    """Get the process-wide data files for the codec chosen by ``CO2_CODEC``"""
+    global _files
+    with _files_guard:
+        if _files is None:
+            name = os.environ.get("CO2_CODEC", "yaml").lower()
+            if name not in CODECS:
+                raise ValueError(f"Unknown codec '{name}', expected one of {sorted(CODECS)}")
+            _files = CodecFiles(CODECS[name]())
+        return _files
@@ -0,0 +1,70 @@
+import os
+import threading
+import yaml
+from activity_catalog import ActivityCatalog
+
+# Quick entries saved before factors were versioned were priced with this version
+LEGACY_FACTOR_VERSION = 1
+
+class EmissionFactors:
+    """Versioned catalogs of CO₂ factors for the quick-entry activities
+
+    ``emission_factors.yaml`` lists every published version. A version
+    holds ``activities`` inline (label -> category and kg CO₂ per unit)
+    and/or a ``catalog`` CSV next to the YAML file, and becomes one
+    ``ActivityCatalog``. Quick entries record the version they were
+    priced with, so a later version can be applied to history by
+    ``factor_recompute``.
+    """
+
+    def __init__(self, catalogs):
+        self.catalogs = catalogs
+        self.latest_version = max(catalogs)
+
+    @classmethod
+    def load(cls, path):
+        """Load every version's catalog from a YAML file"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+        catalogs = {}
+        for version in data["versions"]:
+            catalog = ActivityCatalog.from_rows(
+                dict(factor, activity=activity) for activity, factor in (version.get("activities") or {}).items()
+            )
+            if version.get("catalog"):
+                catalog_path = os.path.join(os.path.dirname(os.path.abspath(path)), version["catalog"])
+                catalog = catalog.merged(ActivityCatalog.load_csv(catalog_path))
+            catalogs[int(version["version"])] = catalog
+        return cls(catalogs)
+
+    def catalog(self, version=None):
+        """Get a version's catalog (default: latest)"""
+        return self.catalogs[version or self.latest_version]
+
+    def factor(self, activity, version=None):
+        """Get an activity's kg CO₂ per unit in a version, or None if it has no factor there"""
+        catalog = self.catalogs.get(version or self.latest_version)
+        return catalog.factor(activity) if catalog is not None else None
+
+
+def price_quick_entry(factor, quantity):
+    """Get the stored CO₂ amount for a quick entry"""
+    return round(factor * quantity, 2)
+
+
+_factors = None
+_factors_key = None
+_factors_guard = threading.Lock()
+
+def get_emission_factors():
+    """Get the factor table from CO2_FACTORS_FILE, reloaded when the file changes"""
+    global _factors, _factors_key
+    path = os.environ.get("CO2_FACTORS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "emission_factors.yaml"))
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _factors_guard:
+        if key != _factors_key:
+            _factors = EmissionFactors.load(path)
+            _factors_key = key
+        return _factors
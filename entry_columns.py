@@ -0,0 +1,84 @@
+import threading
+from datetime import date
+import numpy as np
+
+# Day ordinal of 1970-01-01, to turn ordinals into datetime64 days
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+class EntryColumns:
+    """A user's entries as NumPy columns sorted by date, ready to hand to pandas
+
+    Built on first use by the user's ``EntryIndex`` from its date-sorted
+    run: day ordinals, CO₂ amounts and dense category codes. Frames are
+    built from the arrays on first use and reused until the user's data
+    changes, so callers must not modify them.
+    """
+
+    def __init__(self, run, version=None):
+        self.version = version
+        count = len(run.keys)
+        self.ordinals = np.fromiter((ordinal for ordinal, _ in run.keys), dtype=np.int64, count=count)
+        self.amounts = np.fromiter((entry.co2_amount or 0 for entry in run.entries), dtype=np.float64, count=count)
+        labels = [entry.get_category() for entry in run.entries]
+        self.categories = sorted({label for label in labels if label is not None})
+        codes = {category: code for code, category in enumerate(self.categories)}
+        self.category_codes = np.fromiter((codes.get(label, -1) for label in labels), dtype=np.int32, count=count)
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def _dates(self, ordinals):
+        """Convert day ordinals to datetime64 days"""
+        return (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]")
+
+    def _frame(self, name, build):
+        """Get a cached frame, building it on first use"""
+        with self._lock:
+            frame = self._frames.get(name)
+            if frame is None:
+                frame = self._frames[name] = build()
+            return frame
+
+    def monthly(self):
+        """Get CO₂ totals per ``YYYY-MM`` month, oldest first"""
+        import pandas as pd
+
+        def build():
+            months = self._dates(self.ordinals).astype("datetime64[M]")
+            month_keys, starts = np.unique(months, return_index=True)
+            totals = np.add.reduceat(self.amounts, starts) if len(starts) else np.zeros(0)
+            return pd.DataFrame({"month_year": month_keys.astype(str), "co2_amount": totals}, copy=False)
+
+        return self._frame("monthly", build)
+
+    def by_category(self):
+        """Get CO₂ totals per category, sorted by category"""
+        import pandas as pd
+
+        def build():
+            known = self.category_codes >= 0
+            totals = np.bincount(self.category_codes[known], weights=self.amounts[known],
+                                 minlength=len(self.categories))
+            return pd.DataFrame({"category": self.categories, "co2_amount": totals}, copy=False)
+
+        return self._frame("categories", build)
+
+    def series(self, start_date=None, end_date=None, resolution="day"):
+        """Get (period start dates, CO₂ totals) per day, week or month within [start_date, end_date]
+
+        Weeks start on Monday; only periods with entries are included.
+        """
+        lo = 0 if start_date is None else int(np.searchsorted(self.ordinals, start_date.toordinal(), "left"))
+        hi = len(self.ordinals) if end_date is None else int(np.searchsorted(self.ordinals, end_date.toordinal(), "right"))
+        ordinals = self.ordinals[lo:hi]
+        if resolution == "week":
+            # Ordinal 1 (0001-01-01) was a Monday
+            ordinals = ordinals - (ordinals - 1) % 7
+        elif resolution != "day":
+            months = self._dates(ordinals).astype("datetime64[M]")
+            ordinals = (months.astype("datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL) if len(ordinals) else ordinals
+        periods, starts = np.unique(ordinals, return_index=True)
+        totals = np.add.reduceat(self.amounts[lo:hi], starts) if len(starts) else np.zeros(0)
+        return self._dates(periods), totals
@@ -0,0 +1,149 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+
+class _SortedRun:
+    """Entries sorted by (day ordinal, -sequence) with cumulative CO₂ sums"""
+
+    def __init__(self, items):
+        # items are (key, entry) tuples already in key order
+        self.keys = [key for key, _ in items]
+        self.entries = [entry for _, entry in items]
+        self.prefix = [0.0]
+        total = 0.0
+        for entry in self.entries:
+            total += entry.co2_amount or 0
+            self.prefix.append(total)
+
+    def position(self, i):
+        """Get the (date, sequence) cursor position of the i-th entry"""
+        ordinal, negative_sequence = self.keys[i]
+        return date.fromordinal(ordinal).isoformat(), -negative_sequence
+
+    def bounds(self, start_ordinal=None, end_ordinal=None):
+        """Get the [lo, hi) slice of entries dated within the range"""
+        lo = 0 if start_ordinal is None else bisect_left(self.keys, (start_ordinal, float('-inf')))
+        hi = len(self.keys) if end_ordinal is None else bisect_right(self.keys, (end_ordinal, float('inf')))
+        return lo, max(lo, hi)
+
+
+class EntryIndex:
+    """Date-sorted view of a user's entries with prefix sums, overall and per category
+
+    Range totals are two bisects and a subtraction, and a history page is a
+    bisect plus a slice. Positions are ``(date, sequence)`` like the storage
+    history cursors, with sequence following insertion order. Entries are
+    held as ``CompactEntry`` objects and only the ones on a page are turned
+    back into dicts. The NumPy columns the charts use are built from the
+    same sorted run on first use.
+    """
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        self._columns = None
+        self._columns_lock = threading.Lock()
+        items = []
+        for sequence, entry in enumerate(entries):
+            ordinal = entry.date if entry.date is not None else date.fromisoformat(entry.get_date()).toordinal()
+            # Newest first reads the run backwards; -sequence keeps equal dates
+            # in insertion order when doing so
+            items.append(((ordinal, -sequence), entry))
+        items.sort(key=lambda item: item[0])
+
+        self.all = _SortedRun(items)
+        by_category = {}
+        for item in items:
+            by_category.setdefault(item[1].get_category(), []).append(item)
+        self.by_category = {category: _SortedRun(run) for category, run in by_category.items()}
+
+    def __len__(self):
+        return len(self.all.keys)
+
+    def _run(self, category):
+        """Get the run for a category, or the overall run"""
+        if category is None:
+            return self.all
+        return self.by_category.get(category)
+
+    @staticmethod
+    def _ordinal(value):
+        """Convert an ISO date string or date to an ordinal"""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        return value.toordinal()
+
+    def categories(self):
+        """Get the sorted categories present"""
+        return sorted(self.by_category)
+
+    def min_date(self):
+        """Get the earliest entry date as a date, or None"""
+        return date.fromordinal(self.all.keys[0][0]) if self.all.keys else None
+
+    def max_date(self):
+        """Get the latest entry date as a date, or None"""
+        return date.fromordinal(self.all.keys[-1][0]) if self.all.keys else None
+
+    def range_total(self, start_date=None, end_date=None, category=None):
+        """Get (total CO₂, count) for entries dated within [start_date, end_date]"""
+        run = self._run(category)
+        if run is None:
+            return 0.0, 0
+        lo, hi = run.bounds(self._ordinal(start_date), self._ordinal(end_date))
+        return run.prefix[hi] - run.prefix[lo], hi - lo
+
+    def page(self, start_date=None, end_date=None, category=None, limit=25, after=None):
+        """Get up to ``limit`` (position, entry), newest date first, after a cursor position"""
+        run = self._run(category)
+        if run is None:
+            return []
+        lo, hi = run.bounds(self._ordinal(start_date), self._ordinal(end_date))
+        if after is not None:
+            hi = max(lo, min(hi, bisect_left(run.keys, (self._ordinal(after[0]), -after[1]))))
+        start = max(lo, hi - limit)
+        return [(run.position(i), run.entries[i].to_dict()) for i in range(hi - 1, start - 1, -1)]
+
+    def columns(self):
+        """Get the entries as date-sorted NumPy columns, built on first use"""
+        with self._columns_lock:
+            if self._columns is None:
+                # NumPy is only imported once a page needs columns
+                from entry_columns import EntryColumns
+                self._columns = EntryColumns(self.all, self.version)
+            return self._columns
+
+    def compare_periods(self, end_date, days, category=None):
+        """Get (current, previous) totals for the ``days`` up to end_date and the ``days`` before"""
+        end_ordinal = self._ordinal(end_date)
+        current = self.range_total(date.fromordinal(end_ordinal - days + 1), date.fromordinal(end_ordinal), category)
+        previous = self.range_total(
+            date.fromordinal(end_ordinal - 2 * days + 1), date.fromordinal(end_ordinal - days), category
+        )
+        return current[0], previous[0]
+
+
+class EntryIndexCache:
+    """LRU of per-user entry indexes, each tagged with the entries version it was built from"""
+
+    def __init__(self, max_users=256):
+        self.max_users = max_users
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username, version, load_entries):
+        """Get a user's index, rebuilding it when their entries changed"""
+        with self._lock:
+            item = self._items.get(username)
+            if item is not None and item[0] == version:
+                self._items.move_to_end(username)
+                return item[1]
+        index = EntryIndex(load_entries(username), version)
+        with self._lock:
+            self._items[username] = (version, index)
+            self._items.move_to_end(username)
+            while len(self._items) > self.max_users:
+                self._items.popitem(last=False)
+        return index
@@ -0,0 +1,164 @@
+import threading
+from file_lock import locked
+from data_codecs import get_codec_files
+from user_layout import get_user_layout
+from jobs import PRIORITY_MAINTENANCE, get_job_queue
+
+class EntryJournal:
+    """Append-only per-user journal of CO₂ entry changes.
+
+    Each user has a snapshot file (``<user>_co2_data.yaml``, the historical
+    layout) and a journal file (``<user>_co2_journal.yaml``), with the
+    extension of whichever codec the deployment uses, in the user's
+    directory from the ``UserLayout``. Adding an entry
+    appends one ``add`` record to the journal, deleting one appends a ``delete``
+    tombstone. Reads replay the journal on top of the snapshot, and once the
+    journal grows past ``compact_threshold`` records it is folded back into the
+    snapshot by a background job.
+    """
+
+    def __init__(self, data_dir, compact_threshold=500, files=None):
+        self.data_dir = data_dir
+        self.compact_threshold = compact_threshold
+        self.files = files or get_codec_files()
+        self.layout = get_user_layout(data_dir)
+        self._record_counts = {}
+
+    def get_snapshot_base(self, username, write=False):
+        """Get the snapshot file path, without its codec extension, for a specific user"""
+        return self.layout.base(username, "co2_data", write)
+
+    def get_journal_base(self, username, write=False):
+        """Get the journal file path, without its codec extension, for a specific user"""
+        return self.layout.base(username, "co2_journal", write)
+
+    def get_snapshot_file(self, username):
+        """Get the snapshot file path for a specific user"""
+        return self.files.path(self.get_snapshot_base(username))
+
+    def get_journal_file(self, username):
+        """Get the journal file path for a specific user"""
+        return self.files.path(self.get_journal_base(username))
+
+    def version(self, username):
+        """Identify the current state of a user's snapshot and journal"""
+        return (self.files.version(self.get_snapshot_base(username)),
+                self.files.version(self.get_journal_base(username)))
+
+    def _lock_for(self, username):
+        """Get the lock guarding a user's snapshot and journal, across threads and processes"""
+        return locked(self.layout.lock_path(username, "co2_data"))
+
+    def _read_snapshot(self, username):
+        """Read the compacted snapshot for a user"""
+        data = self.files.read(self.get_snapshot_base(username), lambda: self._lock_for(username))
+        return data if data else []
+
+    def _read_journal(self, username):
+        """Read the pending journal records for a user"""
+        return self.files.read_records(self.get_journal_base(username), lambda: self._lock_for(username))
+
+    def _append_records(self, username, records):
+        """Append records to a user's journal without rewriting it"""
+        snapshot_base = self.get_snapshot_base(username, write=True)
+        # Keep a snapshot file around so the user shows up in directory scans
+        if not self.files.exists(snapshot_base):
+            self.files.write(snapshot_base, [])
+
+        self.files.append_records(self.get_journal_base(username, write=True), records)
+
+        # Counts are per process and only steer when to compact, so a user
+        # first seen here starts from what this process appended
+        self._record_counts[username] = self._record_counts.get(username, 0) + len(records)
+
+    @staticmethod
+    def _apply(data, records):
+        """Apply journal records to a list of entries in place"""
+        for record in records:
+            if record.get("op") == "add":
+                data.append(record["entry"])
+            elif record.get("op") == "delete":
+                # Same semantics as list.remove: drop the first matching entry
+                try:
+                    data.remove(record["entry"])
+                except ValueError:
+                    pass
+        return data
+
+    def replay(self, username):
+        """Load a user's entries by replaying the journal over the snapshot; returns (version, entries)"""
+        with self._lock_for(username):
+            data = self._read_snapshot(username)
+            records = self._read_journal(username)
+            self._record_counts[username] = len(records)
+            # Read under the same lock as the files, so the version matches the entries
+            return self.version(username), self._apply(data, records)
+
+    def append(self, username, entry):
+        """Record a new entry for a user; returns the versions before and after"""
+        return self.append_many(username, [entry])
+
+    def append_many(self, username, entries):
+        """Record several new entries for a user in a single append; returns the versions before and after"""
+        return self._append_changes(username, [{"op": "add", "entry": entry} for entry in entries])
+
+    def delete(self, username, entry):
+        """Record a tombstone removing an entry for a user; returns the versions before and after"""
+        return self._append_changes(username, [{"op": "delete", "entry": entry}])
+
+    def _append_changes(self, username, records):
+        """Append change records under the user's lock; returns the versions before and after"""
+        with self._lock_for(username):
+            old_version = self.version(username)
+            if not records:
+                return old_version, old_version
+            self._append_records(username, records)
+            new_version = self.version(username)
+        self._maybe_schedule_compaction(username)
+        return old_version, new_version
+
+    def replace(self, username, data):
+        """Replace all of a user's entries with a fresh snapshot; returns the new version"""
+        with self._lock_for(username):
+            self.files.write(self.get_snapshot_base(username, write=True), data)
+            self.files.remove(self.get_journal_base(username))
+            self._record_counts[username] = 0
+            return self.version(username)
+
+    def clear(self, username):
+        """Remove a user's snapshot and journal"""
+        with self._lock_for(username):
+            self.files.remove(self.get_snapshot_base(username))
+            self.files.remove(self.get_journal_base(username))
+            self._record_counts[username] = 0
+
+    def compact(self, username):
+        """Fold a user's journal into their snapshot"""
+        with self._lock_for(username):
+            records = self._read_journal(username)
+            if not records:
+                return
+            data = self._apply(self._read_snapshot(username), records)
+
+            self.files.write(self.get_snapshot_base(username), data)
+            self.files.remove(self.get_journal_base(username))
+            self._record_counts[username] = 0
+
+    def _maybe_schedule_compaction(self, username):
+        """Queue a background compaction once the journal is large enough"""
+        if self._record_counts.get(username, 0) < self.compact_threshold:
+            return
+        # The queue drops the request while the same compaction is pending
+        get_job_queue(self.data_dir).submit(
+            "compact_journal", {"data_dir": self.data_dir, "username": username}, PRIORITY_MAINTENANCE
+        )
+
+_journals = {}
+_journals_guard = threading.Lock()
+
+def get_journal(data_dir):
+    """Get the process-wide journal for a data directory"""
+    with _journals_guard:
+        if data_dir not in _journals:
+            _journals[data_dir] = EntryJournal(data_dir)
+        return _journals[data_dir]
@@ -0,0 +1,97 @@
+import math
+from datetime import date, datetime
+
+# Categories offered by the detailed entry form
+ENTRY_CATEGORIES = ["Transportation", "Energy", "Food", "Shopping", "Home", "Work", "Other"]
+
+ENTRY_TYPES = ["quick", "detailed"]
+
+def _finite_float(value, field):
+    """Parse a number, rejecting NaN and infinity"""
+    number = float(value)
+    # float() accepts "nan" and "inf", which would poison totals and rankings
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+def _optional_float(value, field):
+    """Parse an optional positive number; blank and zero mean unset"""
+    if value in (None, ""):
+        return None
+    number = _finite_float(value, field)
+    if number < 0:
+        raise ValueError(f"{field} cannot be negative")
+    return number if number > 0 else None
+
+def normalize_entry(row):
+    """Validate a raw row and build an entry with the same fields the forms save
+
+    Returns ``(entry, None)`` on success or ``(None, error message)``.
+    """
+    try:
+        entry_date = row.get("date")
+        if isinstance(entry_date, (date, datetime)):
+            entry_date = entry_date.isoformat()[:10]
+        entry_date = date.fromisoformat(str(entry_date).strip()).isoformat()
+
+        activity = str(row.get("activity") or "").strip()
+        if not activity:
+            raise ValueError("activity is required")
+
+        category = str(row.get("category") or "").strip()
+        if category not in ENTRY_CATEGORIES:
+            raise ValueError(f"unknown category '{category}'")
+
+        co2_amount = _finite_float(row.get("co2_amount"), "co2_amount")
+        if co2_amount <= 0:
+            raise ValueError("co2_amount must be greater than 0")
+
+        entry_type = str(row.get("entry_type") or "detailed").strip().lower()
+        if entry_type not in ENTRY_TYPES:
+            raise ValueError(f"unknown entry_type '{entry_type}'")
+
+        timestamp = row.get("timestamp") or datetime.now().isoformat()
+        timestamp = datetime.fromisoformat(str(timestamp).strip()).isoformat()
+
+        notes = row.get("notes")
+        notes = "" if notes is None else str(notes)
+    except (TypeError, ValueError) as e:
+        return None, str(e)
+
+    if entry_type == "quick":
+        try:
+            quantity = _optional_float(row.get("quantity"), "quantity") or 1.0
+            factor_version = row.get("factor_version")
+            factor_version = int(factor_version) if factor_version not in (None, "") else None
+        except (TypeError, ValueError) as e:
+            return None, str(e)
+        entry = {
+            "date": entry_date,
+            "activity": activity,
+            "category": category,
+            "co2_amount": round(co2_amount, 2),
+            "quantity": quantity,
+            "notes": notes,
+            "entry_type": "quick",
+            "timestamp": timestamp
+        }
+        if factor_version is not None:
+            entry["factor_version"] = factor_version
+        return entry, None
+
+    try:
+        distance = _optional_float(row.get("distance"), "distance")
+        duration = _optional_float(row.get("duration"), "duration")
+    except (TypeError, ValueError) as e:
+        return None, str(e)
+    return {
+        "date": entry_date,
+        "activity": activity,
+        "category": category,
+        "co2_amount": round(co2_amount, 2),
+        "distance": distance,
+        "duration": duration,
+        "notes": notes,
+        "entry_type": "detailed",
+        "timestamp": timestamp
+    }, None
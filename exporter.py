@@ -0,0 +1,90 @@
+import csv
+import json
+
+EXPORT_FORMATS = ["csv", "ndjson", "parquet"]
+
+EXPORT_FIELDS = [
+    "username", "date", "activity", "category", "co2_amount", "quantity",
+    "distance", "duration", "notes", "entry_type", "timestamp", "factor_version"
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def iter_export_rows(storage, usernames=None, start_date=None, end_date=None):
+    """Yield flat export rows, one user at a time, for the given users (default: all)"""
+    if usernames is None:
+        usernames = sorted(storage.list_entry_users())
+    for username in usernames:
+        for entry in storage.stream_entries(username, start_date, end_date):
+            row = {field: entry.get(field) for field in EXPORT_FIELDS}
+            row["username"] = username
+            yield row
+
+def write_csv(rows, f):
+    """Stream rows to a text file as CSV; returns the row count"""
+    writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+def write_ndjson(rows, f):
+    """Stream rows to a text file as newline-delimited JSON; returns the row count"""
+    count = 0
+    for row in rows:
+        f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        count += 1
+    return count
+
+def write_parquet(rows, sink, batch_size=50_000):
+    """Stream rows to a Parquet file one row group per batch; returns the row count"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow; install it or export CSV/NDJSON instead")
+
+    schema = pa.schema([
+        ("username", pa.string()),
+        ("date", pa.string()),
+        ("activity", pa.string()),
+        ("category", pa.string()),
+        ("co2_amount", pa.float64()),
+        ("quantity", pa.float64()),
+        ("distance", pa.float64()),
+        ("duration", pa.float64()),
+        ("notes", pa.string()),
+        ("entry_type", pa.string()),
+        ("timestamp", pa.string()),
+        ("factor_version", pa.int64()),
+    ])
+    count = 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+def export_entries(storage, fmt, sink, usernames=None, start_date=None, end_date=None):
+    """Export entries to ``sink`` (a text file for CSV/NDJSON, a path or binary file for Parquet)"""
+    rows = iter_export_rows(storage, usernames, start_date, end_date)
+    if fmt == "csv":
+        return write_csv(rows, sink)
+    if fmt == "ndjson":
+        return write_ndjson(rows, sink)
+    if fmt == "parquet":
+        return write_parquet(rows, sink)
+    raise ValueError(f"Unknown export format '{fmt}', expected one of {EXPORT_FORMATS}")
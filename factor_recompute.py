@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from contextlib import ExitStack
+from multiprocessing import get_context
+from file_lock import locked
+from emission_factors import LEGACY_FACTOR_VERSION, get_emission_factors
+
+_tracker = None
+
+def _worker_tracker():
+    """Get this worker process's tracker"""
+    global _tracker
+    if _tracker is None:
+        from co2_tracker import CO2Tracker
+        _tracker = CO2Tracker()
+    return _tracker
+
+def reprice_entries(entries, factors, version):
+    """Reprice quick entries in place to a factor version; returns the indexes of the entries updated
+
+    Every quick entry of the batch is priced in one vectorized step. An
+    entry's amount changes when its activity's factor differs between the
+    version it was priced with and ``version``; otherwise only its
+    recorded version moves on.
+    """
+    import numpy as np
+
+    rows, activities, quantities = [], [], []
+    rows_by_version = {}
+    for index, entry in enumerate(entries):
+        if entry.get("entry_type") != "quick":
+            continue
+        priced_with = entry.get("factor_version") or LEGACY_FACTOR_VERSION
+        if priced_with == version:
+            continue
+        rows_by_version.setdefault(priced_with, []).append(len(rows))
+        rows.append(index)
+        activities.append(entry.get("activity"))
+        quantities.append(entry.get("quantity") or 1.0)
+    if not rows:
+        return rows
+
+    # One basket lookup for the target version, one per version the entries were priced with
+    new_factors = factors.catalog(version).factors_for(activities)
+    old_factors = new_factors.copy()
+    for priced_with, positions in rows_by_version.items():
+        if priced_with in factors.catalogs:
+            old_factors[positions] = factors.catalog(priced_with).factors_for([activities[p] for p in positions])
+    # Entries whose activity had no factor in their version keep the amount they were saved with
+    old_factors = np.where(np.isnan(old_factors), new_factors, old_factors)
+    amounts = new_factors * np.asarray(quantities, dtype=np.float64)
+    # Activities missing from the target version keep their last price and version
+    known = ~np.isnan(new_factors)
+    repriced = known & (old_factors != new_factors)
+    updated = []
+    for index, amount, found, changed in zip(rows, amounts.tolist(), known.tolist(), repriced.tolist()):
+        if not found:
+            continue
+        entry = entries[index]
+        if changed:
+            # Float products match price_quick_entry, which the form uses
+            entry["co2_amount"] = round(amount, 2)
+        entry["factor_version"] = version
+        updated.append(index)
+    return updated
+
+def _recompute_batch(args):
+    """Reprice a batch of users in a worker process; returns (usernames, updated entries, updated users)"""
+    work_dir, usernames, version = args
+    os.chdir(work_dir)
+    tracker = _worker_tracker()
+    factors = get_emission_factors()
+    updated_entries = updated_users = 0
+    # Locks are taken in username order, as the write coalescer does, so they cannot deadlock
+    with ExitStack() as stack:
+        for username in sorted(usernames):
+            stack.enter_context(tracker.storage.lock_user(username))
+        entries_by_user = {username: tracker.load_user_data(username) for username in usernames}
+        batch, owners = [], []
+        for username, entries in entries_by_user.items():
+            batch.extend(entries)
+            owners.extend([username] * len(entries))
+        updated = {}
+        for index in reprice_entries(batch, factors, version):
+            updated[owners[index]] = updated.get(owners[index], 0) + 1
+        for username, count in updated.items():
+            # Rewrites the entries and refreshes the rollups and leaderboard
+            tracker.save_user_data(username, entries_by_user[username])
+            updated_entries += count
+            updated_users += 1
+    return usernames, updated_entries, updated_users
+
+
+class FactorRecompute:
+    """Resumable repricing of every user's quick entries to a factor version
+
+    Users are handed to a process pool in batches. Each finished batch is
+    appended to ``factor_recompute.journal`` in the data directory, so a
+    run that stops part-way picks up where it left off when started again
+    for the same version. The journal is removed when a run completes.
+    """
+
+    def __init__(self, storage, data_dir="user_data", workers=None, batch_size=100):
+        self.storage = storage
+        self.data_dir = data_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.base = os.path.join(data_dir, "factor_recompute")
+        self.journal_file = self.base + ".journal"
+
+    def _read_checkpoint(self, version):
+        """Get the users a previous run for this version already finished"""
+        done = set()
+        try:
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return done
+        if not lines or json.loads(lines[0]).get("version") != version:
+            return done
+        for line in lines[1:]:
+            try:
+                done.update(json.loads(line)["done"])
+            except ValueError:
+                # A line cut short by a crash; its batch runs again
+                continue
+        return done
+
+    def _checkpoint(self, record, mode="a"):
+        """Append a record to the checkpoint journal"""
+        with open(self.journal_file, mode, encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, version=None, progress=None):
+        """Reprice every user to ``version`` (default: latest), calling ``progress(report)`` after each batch"""
+        version = version or get_emission_factors().latest_version
+        with locked(self.base):
+            done = self._read_checkpoint(version)
+            if not done:
+                self._checkpoint({"version": version}, mode="w")
+            users = sorted(set(self.storage.list_entry_users()) - done)
+            report = {
+                "version": version,
+                "users": len(users) + len(done),
+                "done_users": len(done),
+                "resumed_users": len(done),
+                "updated_users": 0,
+                "updated_entries": 0,
+                "seconds": 0.0,
+            }
+            started = time.perf_counter()
+            batches = [
+                (os.path.abspath(os.getcwd()), users[start:start + self.batch_size], version)
+                for start in range(0, len(users), self.batch_size)
+            ]
+            if batches:
+                # Spawned workers, because the app server calling this runs threads
+                with get_context("spawn").Pool(min(self.workers, len(batches))) as pool:
+                    for usernames, updated_entries, updated_users in pool.imap_unordered(_recompute_batch, batches):
+                        self._checkpoint({"done": usernames})
+                        report["done_users"] += len(usernames)
+                        report["updated_users"] += updated_users
+                        report["updated_entries"] += updated_entries
+                        report["seconds"] = time.perf_counter() - started
+                        if progress is not None:
+                            progress(dict(report))
+            report["seconds"] = time.perf_counter() - started
+            os.remove(self.journal_file)
+            return report
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+class _PathLock:
+    """Lock for one data file: a thread lock plus an flock on a sidecar lock file"""
+
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+    def acquire(self):
+        """Take the lock; re-entrant within a thread"""
+        self.thread_lock.acquire()
+        self.depth += 1
+        if self.depth == 1 and fcntl is not None:
+            self.fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def release(self):
+        """Release the lock"""
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.thread_lock.release()
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def _lock_file_for(path):
+    """Get the sidecar lock file for a data file, under a .locks directory next to it"""
+    directory, name = os.path.split(os.path.abspath(path))
+    lock_dir = os.path.join(directory, ".locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    return os.path.join(lock_dir, name + ".lock")
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive lock on a data file, across threads and processes"""
+    key = os.path.abspath(path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = _PathLock(_lock_file_for(key))
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+def atomic_write(path, write, binary=False):
+    """Write a file by calling ``write(f)`` on a temp file and renaming it into place
+
+    Readers see either the old or the new contents, never a partial file.
+    ``binary`` opens the temp file in bytes mode.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600 files; keep the permissions the file already had
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,364 @@
+import os
+import json
+import heapq
+import time
+import uuid
+import logging
+import threading
+from file_lock import locked, atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: a user waiting on the page, then admin requests, then housekeeping
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ADMIN = 5
+PRIORITY_MAINTENANCE = 9
+
+# A job is "queued", then "running", then one of the finished states
+FINISHED_STATES = ("done", "failed", "interrupted")
+
+class Job:
+    """One unit of background work and its status"""
+
+    __slots__ = ("id", "kind", "params", "priority", "key", "state", "submitted",
+                 "started", "finished", "progress", "result", "error", "pid")
+
+    def __init__(self, kind, params, priority, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.key = key
+        self.state = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.pid = os.getpid()
+
+    @property
+    def done(self):
+        """Whether the job has finished, successfully or not"""
+        return self.state in FINISHED_STATES
+
+    def to_record(self):
+        """Get the job as a journal record"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild a job from its latest journal record"""
+        job = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(job, name, record.get(name))
+        return job
+
+
+class JobQueue:
+    """Priority queue of background jobs run by a small pool of worker threads
+
+    ``submit(kind, params)`` returns a job id at once; pages keep the id
+    and poll ``get(job_id)`` instead of running heavy work in the script.
+    A job identical to one still queued or running (same kind and params)
+    is not queued twice: ``submit`` returns the existing id.
+
+    Every state change is appended to ``jobs.journal`` as the job's JSON
+    record, so statuses outlive the process that ran the job. Jobs a dead
+    process left queued or running are marked ``interrupted`` on start.
+    The journal is rewritten with the newest ``keep`` jobs once it holds
+    twice that many. Export files hold copies of users' histories, so any
+    older than ``export_ttl`` seconds are deleted on start and whenever a
+    job finishes.
+    """
+
+    def __init__(self, data_dir, handlers, workers=2, keep=200, export_ttl=3600):
+        self.data_dir = data_dir
+        self.handlers = handlers
+        self.workers = workers
+        self.keep = keep
+        self.export_ttl = export_ttl
+        self.base = os.path.join(data_dir, "jobs")
+        self.journal_file = self.base + ".journal"
+        self.export_dir = os.path.join(data_dir, "exports")
+        self._jobs = {}
+        self._active = {}
+        self._heap = []
+        self._unpushed = set()
+        self._sequence = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._load()
+
+    @classmethod
+    def from_env(cls, data_dir, handlers):
+        """Create a queue sized by CO2_JOB_WORKERS / CO2_JOB_KEEP / CO2_EXPORT_TTL"""
+        return cls(
+            data_dir,
+            handlers,
+            workers=int(os.environ.get("CO2_JOB_WORKERS", 2)),
+            keep=int(os.environ.get("CO2_JOB_KEEP", 200)),
+            export_ttl=int(os.environ.get("CO2_EXPORT_TTL", 3600))
+        )
+
+    def _read_journal(self):
+        """Read every job's latest record from the journal, oldest first"""
+        jobs = {}
+        try:
+            with open(self.journal_file, "r") as f:
+                for line in f:
+                    # A line cut short by a crash is skipped
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    jobs.pop(record["id"], None)
+                    jobs[record["id"]] = Job.from_record(record)
+        except FileNotFoundError:
+            pass
+        return jobs
+
+    def _load(self):
+        """Load past jobs and mark the ones a dead process left unfinished"""
+        with locked(self.base):
+            self._jobs = self._read_journal()
+            for job in self._jobs.values():
+                if not job.done and job.pid != os.getpid() and not _process_alive(job.pid):
+                    job.state = "interrupted"
+                    job.error = "The process running the job stopped"
+                    self._write(job)
+            if len(self._jobs) > 2 * self.keep:
+                jobs = list(self._jobs.values())
+                for job in jobs[:-self.keep]:
+                    # Drop the files of exports nobody can look up any more
+                    path = (job.result or {}).get("path")
+                    if path and os.path.exists(path):
+                        os.remove(path)
+                self._jobs = {job.id: job for job in jobs[-self.keep:]}
+                lines = "".join(json.dumps(job.to_record()) + "\n" for job in self._jobs.values())
+                atomic_write(self.journal_file, lambda f: f.write(lines))
+        self._expire_exports()
+
+    def _expire_exports(self):
+        """Delete export files older than ``export_ttl``, whichever process wrote them"""
+        cutoff = time.time() - self.export_ttl
+        try:
+            names = os.listdir(self.export_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.export_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                # Another process expired it first
+                continue
+
+    def _write(self, job):
+        """Append a job's current record to the journal; caller holds the journal lock"""
+        with open(self.journal_file, "a") as f:
+            f.write(json.dumps(job.to_record()) + "\n")
+
+    def _persist(self, job):
+        """Record a job's state change"""
+        try:
+            with locked(self.base):
+                self._write(job)
+        except OSError:
+            # The status in memory is still right; only its history is lost
+            logger.exception("Could not record job %s", job.id)
+
+    def submit(self, kind, params=None, priority=PRIORITY_ADMIN):
+        """Queue a job and return its id, or the id of an identical unfinished job"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}', expected one of {sorted(self.handlers)}")
+        params = params or {}
+        key = (kind, json.dumps(params, sort_keys=True, default=str))
+        with self._cond:
+            existing = self._active.get(key)
+            if existing is not None:
+                # A more urgent duplicate moves the queued job up; one not on
+                # the heap yet goes on with the new priority
+                if priority < existing.priority and existing.state == "queued":
+                    existing.priority = priority
+                    if existing.id not in self._unpushed:
+                        self._push(existing)
+                return existing.id
+            job = Job(kind, params, priority, key[1])
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._unpushed.add(job.id)
+        # Recorded before a worker can take it, so the journal keeps the order
+        # of states; the file lock and disk write stay outside the condition
+        self._persist(job)
+        with self._cond:
+            self._unpushed.discard(job.id)
+            self._push(job)
+            self._start_workers()
+            self._cond.notify()
+        return job.id
+
+    def _push(self, job):
+        """Put a job on the heap; caller holds the condition"""
+        self._sequence += 1
+        heapq.heappush(self._heap, (job.priority, self._sequence, job))
+
+    def _start_workers(self):
+        """Start the worker threads on first use; caller holds the condition"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _take(self):
+        """Wait for the most urgent queued job; caller holds the condition"""
+        while True:
+            while not self._heap:
+                self._cond.wait()
+            priority, _, job = heapq.heappop(self._heap)
+            # Skip stale heap entries left behind by a priority bump
+            if job.state == "queued" and priority == job.priority:
+                job.state = "running"
+                job.started = time.time()
+                return job
+
+    def _run(self):
+        """Run jobs until the process exits"""
+        while True:
+            with self._cond:
+                job = self._take()
+            self._persist(job)
+            try:
+                result = self.handlers[job.kind](job)
+                state, error = "done", None
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job.id, job.kind)
+                result, state, error = None, "failed", str(e)
+            with self._cond:
+                job.result = result
+                job.error = error
+                job.finished = time.time()
+                job.state = state
+                self._active.pop((job.kind, job.key), None)
+                self._cond.notify_all()
+            self._persist(job)
+            self._expire_exports()
+
+    def get(self, job_id):
+        """Get a job by id, including jobs other processes recorded; None if unknown"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            with locked(self.base):
+                job = self._read_journal().get(job_id)
+        return job
+
+    def jobs(self, limit=50):
+        """Get the newest jobs this process knows of, newest first"""
+        with self._cond:
+            jobs = list(self._jobs.values())
+        return sorted(jobs, key=lambda job: job.submitted, reverse=True)[:limit]
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job finishes; returns the job, or None on timeout"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or not self._cond.wait_for(lambda: job.done, timeout):
+                return None
+            return job
+
+
+def _process_alive(pid):
+    """Check whether a process id belongs to a running process"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def rebuild_leaderboard_job(job):
+    """Rebuild the leaderboard index from stored entries"""
+    from co2_tracker import CO2Tracker
+    return {"ranked": CO2Tracker().rebuild_leaderboard_index()}
+
+def recompute_rewards_job(job):
+    """Rebuild every logged user's streaks and badges from the login event log"""
+    from rewards import RewardsManager
+    return {"users": RewardsManager().recompute_rewards()}
+
+def compact_journal_job(job):
+    """Fold a user's entry journal into their snapshot"""
+    from entry_journal import get_journal
+    get_journal(job.params["data_dir"]).compact(job.params["username"])
+    return {"username": job.params["username"]}
+
+def recompute_emissions_job(job):
+    """Reprice every user's quick entries to the latest emission factors"""
+    from factor_recompute import FactorRecompute
+    from storage import get_storage
+
+    def progress(report):
+        # Shown on the admin page while the job runs; not persisted until it finishes
+        job.progress = f"{report['done_users']}/{report['users']} users"
+
+    return FactorRecompute(get_storage(), job.params.get("data_dir", "user_data")).run(progress=progress)
+
+def export_job(job):
+    """Export entries to a file under ``exports/`` in the data directory"""
+    import io
+    from exporter import export_entries
+    from storage import get_storage
+    params = job.params
+    export_dir = os.path.join(params["data_dir"], "exports")
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, f"{job.id}.{params['format']}")
+    with open(path, "wb") as f:
+        if params["format"] == "parquet":
+            count = export_entries(get_storage(), "parquet", f, params["usernames"], params["start"], params["end"])
+        else:
+            text = io.TextIOWrapper(f, encoding="utf-8", newline="", write_through=True)
+            count = export_entries(get_storage(), params["format"], text, params["usernames"],
+                                   params["start"], params["end"])
+            text.detach()
+    return {"count": count, "path": path}
+
+JOB_HANDLERS = {
+    "rebuild_leaderboard": rebuild_leaderboard_job,
+    "recompute_rewards": recompute_rewards_job,
+    "compact_journal": compact_journal_job,
+    "recompute_emissions": recompute_emissions_job,
+    "export": export_job,
+}
+
+
+def show_job_progress(queue, job_id, message):
+    """Show a job's progress on a page, polling until it finishes and then rerunning the page"""
+    import streamlit as st
+
+    @st.fragment(run_every=1)
+    def poll():
+        job = queue.get(job_id)
+        if job is None or job.done:
+            st.rerun()
+        st.info(f"⏳ {message} ({job.state} for {time.time() - job.submitted:.0f}s)")
+
+    poll()
+
+
+_queues = {}
+_queues_guard = threading.Lock()
+
+def get_job_queue(data_dir="user_data"):
+    """Get the process-wide job queue for a data directory"""
+    with _queues_guard:
+        if data_dir not in _queues:
+            os.makedirs(data_dir, exist_ok=True)
+            _queues[data_dir] = JobQueue.from_env(data_dir, JOB_HANDLERS)
+        return _queues[data_dir]
@@ -0,0 +1,207 @@
+import os
+import json
+import threading
+from bisect import bisect_left, insort
+from file_lock import locked
+from data_codecs import get_codec_files
+
+class LeaderboardIndex:
+    """Persisted per-user CO₂ sum/count index backing the leaderboard
+
+    The index lives in ``leaderboard_index.yaml`` (a snapshot of
+    ``{username: [total, count]}``, in the deployment's codec) plus
+    ``leaderboard_index.journal``, where
+    every entry change appends one JSON line. Each process keeps the totals
+    in memory together with a list of ``(average, username)`` kept sorted, so
+    the top N is a slice and a user's rank is a bisect; before answering it
+    reads whatever other processes appended to the journal since last time.
+    """
+
+    def __init__(self, data_dir, compact_threshold=5000, files=None):
+        self.data_dir = data_dir
+        self.compact_threshold = compact_threshold
+        self.files = files or get_codec_files()
+        # The index is derived data: a snapshot left in another format is
+        # simply rebuilt from storage rather than converted
+        self.snapshot_base = os.path.join(data_dir, "leaderboard_index")
+        self.snapshot_file = self.files.path(self.snapshot_base)
+        self.journal_file = os.path.join(data_dir, "leaderboard_index.journal")
+        self._totals = {}
+        self._ranking = []
+        self._snapshot_stat = None
+        self._journal_ino = None
+        self._journal_offset = 0
+        self._journal_records = 0
+
+    @staticmethod
+    def _stat_key(file_path):
+        """Identify a file version by inode, mtime and size"""
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _set(self, username, total, count):
+        """Set a user's totals and keep the ranking sorted"""
+        old = self._totals.get(username)
+        if old is not None and old[1] > 0:
+            position = bisect_left(self._ranking, (old[0] / old[1], username))
+            if position < len(self._ranking) and self._ranking[position][1] == username:
+                del self._ranking[position]
+        if count > 0:
+            self._totals[username] = (total, count)
+            insort(self._ranking, (total / count, username))
+        else:
+            self._totals.pop(username, None)
+
+    def _apply(self, record):
+        """Apply one journal record to the in-memory index"""
+        username = record["u"]
+        if "set" in record:
+            total, count = record["set"]
+        else:
+            total, count = self._totals.get(username, (0.0, 0))
+            total += record["t"]
+            count += record["c"]
+        self._set(username, total, count)
+
+    def _reload(self):
+        """Load the snapshot and replay the whole journal"""
+        self._totals = {}
+        self._ranking = []
+        snapshot = self.files.read(self.snapshot_base) or {}
+        for username, (total, count) in snapshot.items():
+            self._totals[username] = (total, count)
+            if count > 0:
+                self._ranking.append((total / count, username))
+        self._ranking.sort()
+        self._snapshot_stat = self._stat_key(self.snapshot_file)
+        self._journal_ino = None
+        self._journal_offset = 0
+        self._journal_records = 0
+        self._read_journal_tail()
+
+    def _read_journal_tail(self):
+        """Apply records appended to the journal since the last read"""
+        try:
+            f = open(self.journal_file, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            ino = os.fstat(f.fileno()).st_ino
+            if ino != self._journal_ino:
+                self._journal_ino = ino
+                self._journal_offset = 0
+            f.seek(self._journal_offset)
+            chunk = f.read()
+        # Only consume complete lines; a concurrent writer may be mid-append
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+                self._journal_records += 1
+        self._journal_offset += end
+
+    def _refresh(self):
+        """Bring the in-memory index up to date with the files on disk"""
+        if not os.path.exists(self.snapshot_file):
+            raise FileNotFoundError(self.snapshot_file)
+        snapshot_stat = self._stat_key(self.snapshot_file)
+        journal_stat = self._stat_key(self.journal_file)
+        if (snapshot_stat != self._snapshot_stat
+                or (journal_stat and journal_stat[0] != self._journal_ino and self._journal_ino is not None)
+                or (journal_stat and journal_stat[2] < self._journal_offset)):
+            self._reload()
+        else:
+            self._read_journal_tail()
+
+    def _append(self, *records):
+        """Persist records with one write and fsync and apply them in memory"""
+        with locked(self.snapshot_base):
+            self._refresh()
+            with open(self.journal_file, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            self._read_journal_tail()
+            if self._journal_records >= self.compact_threshold:
+                self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Fold the current totals into a fresh snapshot and drop the journal"""
+        snapshot = {username: [total, count] for username, (total, count) in self._totals.items()}
+        self.files.write(self.snapshot_base, snapshot)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._snapshot_stat = self._stat_key(self.snapshot_file)
+        self._journal_ino = None
+        self._journal_offset = 0
+        self._journal_records = 0
+
+    def record_change(self, username, total_delta, count_delta):
+        """Record entries added (positive deltas) or removed (negative deltas)"""
+        self._append({"u": username, "t": total_delta, "c": count_delta})
+
+    def record_changes(self, changes):
+        """Record (username, total delta, count delta) for several users in one journal write"""
+        if changes:
+            self._append(*({"u": username, "t": total, "c": count} for username, total, count in changes))
+
+    def set_user(self, username, total, count):
+        """Record a user's totals after their entries were replaced or cleared"""
+        self._append({"u": username, "set": [total, count]})
+
+    def rebuild(self, load_user_totals):
+        """Rebuild the whole index from ``load_user_totals()``, which gives (username, total, count) tuples"""
+        with locked(self.snapshot_base):
+            # Totals are read under the lock: the snapshot replaces the journal,
+            # so a delta appended before the lock but after the read would be lost
+            self._totals = {}
+            self._ranking = []
+            for username, total, count in load_user_totals():
+                self._set(username, total, count)
+            self._write_snapshot()
+            return len(self._totals)
+
+    def ensure_built(self, storage):
+        """Build the index from storage if it has never been built"""
+        with locked(self.snapshot_base):
+            if not os.path.exists(self.snapshot_file):
+                self.rebuild(storage.get_user_totals)
+
+    def top(self, n):
+        """Get the best ``n`` users as (rank, username, average, count)"""
+        with locked(self.snapshot_base):
+            self._refresh()
+            return [
+                (rank, username, average, self._totals[username][1])
+                for rank, (average, username) in enumerate(self._ranking[:n], start=1)
+            ]
+
+    def rank_of(self, username):
+        """Get (rank, average, count) for a user, or None if they have no entries"""
+        with locked(self.snapshot_base):
+            self._refresh()
+            totals = self._totals.get(username)
+            if totals is None:
+                return None
+            average = totals[0] / totals[1]
+            return bisect_left(self._ranking, (average, username)) + 1, average, totals[1]
+
+    def size(self):
+        """Get the number of ranked users"""
+        with locked(self.snapshot_base):
+            self._refresh()
+            return len(self._ranking)
+
+
+_indexes = {}
+_indexes_guard = threading.Lock()
+
+def get_leaderboard_index(data_dir):
+    """Get the process-wide leaderboard index for a data directory"""
+    with _indexes_guard:
+        if data_dir not in _indexes:
+            _indexes[data_dir] = LeaderboardIndex(data_dir)
+        return _indexes[data_dir]
@@ -0,0 +1,228 @@
+import os
+import json
+import threading
+from array import array
+from datetime import date, timedelta
+from file_lock import locked
+
+# Badges in award priority: a login whose streak hits several milestones earns only the first
+BADGE_RULES = [
+    ("Monthly Mavericks", 30),
+    ("Habit Builder", 21),
+    ("Fortniter", 14),
+    ("Weekly Champions", 7),
+]
+
+def badge_for_streak(streak, rules=BADGE_RULES):
+    """Get the badge a login with this streak earns, or None"""
+    for name, length in rules:
+        if streak >= length and streak % length == 0:
+            return name
+    return None
+
+class LoginEventLog:
+    """Append-only log of daily logins that rewards are derived from
+
+    ``login_events.journal`` holds one JSON line per event:
+
+    - ``{"u": username, "d": day ordinal}``: the user logged in that day
+    - ``{"u": username, "base": {"total_logins": n, "badges": {...}}}``:
+      logins and badges the user had before their history was logged
+
+    Rewards documents are the incrementally maintained result; replaying
+    the log rebuilds them, so badge rules can change retroactively.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.base = os.path.join(data_dir, "login_events")
+        self.journal_file = self.base + ".journal"
+
+    def lock(self):
+        """Lock the log for appending"""
+        return locked(self.base)
+
+    def append(self, records):
+        """Append events in one write"""
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self.lock():
+            with open(self.journal_file, "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_login(self, username, day):
+        """Record that a user logged in on a day"""
+        self.append([{"u": username, "d": day.toordinal()}])
+
+    def seed(self, username, rewards, rules=BADGE_RULES):
+        """Log a user's existing rewards as a baseline plus their current streak run
+
+        The days of the current streak are logged as logins so later streaks
+        continue it; everything earned before that run becomes the baseline.
+        """
+        streak = rewards.get("login_streak") or 0
+        last_login = rewards.get("last_login")
+        badges = dict(rewards.get("badges") or {})
+        days = []
+        if last_login and streak:
+            last_day = date.fromisoformat(str(last_login)[:10])
+            days = [last_day - timedelta(days=offset) for offset in range(streak - 1, -1, -1)]
+        for run_streak in range(1, len(days) + 1):
+            badge = badge_for_streak(run_streak, rules)
+            if badge is not None and badges.get(badge, 0) > 0:
+                badges[badge] -= 1
+        records = [{"u": username, "base": {
+            "total_logins": max((rewards.get("total_logins") or 0) - len(days), 0),
+            "badges": badges
+        }}]
+        records.extend({"u": username, "d": day.toordinal()} for day in days)
+        self.append(records)
+
+    def read_into(self, columns, offset=0, chunk_size=1 << 20):
+        """Add the complete events after a byte offset to ``columns``; returns (usernames, next offset)
+
+        The log is read a chunk at a time, so memory grows with the columns
+        rather than with one parsed dict per event.
+        """
+        usernames = set()
+        try:
+            f = open(self.journal_file, "rb")
+        except FileNotFoundError:
+            return usernames, offset
+        with f:
+            f.seek(offset)
+            tail = b""
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                chunk = tail + chunk
+                # A concurrent writer may be mid-append; only complete lines count
+                end = chunk.rfind(b"\n") + 1
+                for line in chunk[:end].splitlines():
+                    if line.strip():
+                        usernames.add(columns.add(json.loads(line)))
+                offset += end
+                tail = chunk[end:]
+        return usernames, offset
+
+
+class LoginColumns:
+    """Login events held as parallel columns of user codes and day ordinals, plus baselines"""
+
+    def __init__(self):
+        self.codes = {}
+        self.usernames = []
+        self.users = array("q")
+        self.days = array("q")
+        self.baselines = {}
+
+    def add(self, event):
+        """Add one event; returns its username"""
+        username = event["u"]
+        code = self.codes.get(username)
+        if code is None:
+            code = self.codes[username] = len(self.usernames)
+            self.usernames.append(username)
+        if "base" in event:
+            self.baselines[username] = event["base"]
+        else:
+            self.users.append(code)
+            self.days.append(event["d"])
+        return username
+
+
+def apply_login(rewards, day, rules=BADGE_RULES):
+    """Advance a rewards document by one login on ``day`` in place; returns False if already counted"""
+    last_login = rewards.get("last_login")
+    if last_login:
+        last_day = date.fromisoformat(str(last_login)[:10])
+        if last_day >= day:
+            return False
+        rewards["login_streak"] = rewards["login_streak"] + 1 if last_day == day - timedelta(days=1) else 1
+    else:
+        rewards["login_streak"] = 1
+    rewards["last_login"] = day.isoformat()
+    rewards["total_logins"] = (rewards.get("total_logins") or 0) + 1
+    badge = badge_for_streak(rewards["login_streak"], rules)
+    if badge is not None:
+        rewards["badges"][badge] = rewards["badges"].get(badge, 0) + 1
+    return True
+
+def evaluate_logins(columns, badge_names, rules=BADGE_RULES, usernames=None):
+    """Derive users' rewards from the logged events in one vectorized pass
+
+    Returns ``{username: rewards}`` for ``usernames``, or for every user
+    with events when it is None.
+    """
+    # NumPy is only needed by the batch job
+    import numpy as np
+
+    user_count = len(columns.usernames)
+    users = np.array(columns.users, dtype=np.int64)
+    days = np.array(columns.days, dtype=np.int64)
+    if usernames is None:
+        usernames = columns.usernames
+    else:
+        # Only the selected users' rows take part; streaks never cross users
+        keep = np.isin(users, [columns.codes[username] for username in usernames])
+        users, days = users[keep], days[keep]
+
+    # Sort by user then day and drop repeated logins on the same day
+    order = np.lexsort((days, users))
+    users, days = users[order], days[order]
+    if len(days):
+        keep = np.ones(len(days), dtype=bool)
+        keep[1:] = (users[1:] != users[:-1]) | (days[1:] != days[:-1])
+        users, days = users[keep], days[keep]
+    count = len(days)
+
+    # A streak restarts at each user's first login and after every missed day
+    positions = np.arange(count)
+    run_starts = np.ones(count, dtype=bool)
+    run_starts[1:] = (users[1:] != users[:-1]) | (days[1:] - days[:-1] != 1)
+    streaks = positions - np.maximum.accumulate(np.where(run_starts, positions, 0)) + 1
+
+    awarded = np.zeros(count, dtype=bool)
+    badge_counts = {}
+    for name, length in rules:
+        hits = (streaks % length == 0) & ~awarded
+        awarded |= hits
+        badge_counts[name] = np.bincount(users[hits], minlength=user_count)
+
+    logins = np.bincount(users, minlength=user_count)
+    # Each user's last row is where the next user (or the array) starts
+    last_rows = np.full(user_count, -1)
+    if count:
+        ends = np.flatnonzero(np.append(users[1:] != users[:-1], True))
+        last_rows[users[ends]] = ends
+
+    results = {}
+    for username in usernames:
+        code = columns.codes[username]
+        base = columns.baselines.get(username, {})
+        base_badges = base.get("badges", {})
+        row = last_rows[code]
+        badges = {name: int(base_badges.get(name, 0)) for name in badge_names}
+        for name, counts in badge_counts.items():
+            badges[name] = badges.get(name, 0) + int(counts[code])
+        results[username] = {
+            "login_streak": int(streaks[row]) if row >= 0 else 0,
+            "last_login": date.fromordinal(int(days[row])).isoformat() if row >= 0 else None,
+            "total_logins": int(base.get("total_logins", 0)) + int(logins[code]),
+            "badges": badges,
+            "event_log": True
+        }
+    return results
+
+
+_logs = {}
+_logs_guard = threading.Lock()
+
+def get_login_event_log(data_dir):
+    """Get the process-wide login event log for a data directory"""
+    with _logs_guard:
+        if data_dir not in _logs:
+            _logs[data_dir] = LoginEventLog(data_dir)
+        return _logs[data_dir]
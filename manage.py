@@ -0,0 +1,284 @@
+import argparse
+import sys
+from storage import YamlStorage, SQLiteStorage, migrate_yaml_to_sqlite, migrate_to_sharded_layout
+from co2_tracker import CO2Tracker
+
+def migrate_to_sqlite(args):
+    """Import the YAML user_data/ tree and users.yaml into SQLite"""
+    yaml_storage = YamlStorage(data_dir=args.data_dir, user_file=args.users_file)
+    sqlite_storage = SQLiteStorage(args.db)
+    counts = migrate_yaml_to_sqlite(yaml_storage, sqlite_storage)
+    print(f"Migrated {counts['users']} users, {counts['entries']} entries and "
+          f"{counts['rewards']} rewards records into {args.db}")
+
+def shard_user_data(args):
+    """Move flat user_data/ files into hash-prefix shard directories"""
+    counts = migrate_to_sharded_layout(YamlStorage(data_dir=args.data_dir, user_file=args.users_file))
+    print(f"Moved {counts['files']} files of {counts['users']} users into shards under {args.data_dir}")
+
+def rebuild_leaderboard(args):
+    """Rebuild the leaderboard index from stored entries"""
+    ranked = CO2Tracker().rebuild_leaderboard_index()
+    print(f"Rebuilt leaderboard index with {ranked} ranked users")
+
+def recompute_rewards(args):
+    """Rebuild every logged user's streaks and badges from the login event log"""
+    from rewards import RewardsManager
+    users = RewardsManager().recompute_rewards()
+    print(f"Recomputed rewards for {users} users from the login event log")
+
+def recompute_emissions(args):
+    """Reprice every user's quick entries to a version of the emission factors"""
+    from factor_recompute import FactorRecompute
+    from storage import get_storage
+
+    def progress(report):
+        print(f"  {report['done_users']}/{report['users']} users, "
+              f"{report['updated_entries']} entries repriced ({report['seconds']:.1f}s)")
+
+    report = FactorRecompute(get_storage(), workers=args.workers, batch_size=args.batch_size).run(
+        args.version, progress
+    )
+    if report['resumed_users']:
+        print(f"Resumed after {report['resumed_users']} users finished by an earlier run")
+    print(f"Repriced {report['updated_entries']} entries of {report['updated_users']} users "
+          f"to factor version {report['version']} in {report['seconds']:.2f}s")
+
+def stress_writes(args):
+    """Run concurrent writers against a scratch data directory and check for lost writes"""
+    from write_stress import run_write_stress
+    result = run_write_stress(args.processes, args.threads, args.entries, args.users)
+    print(f"{result['writes']} writes from {args.processes} processes x {args.threads} threads "
+          f"in {result['seconds']:.2f}s ({result['work_dir']})")
+    for problem in result['problems']:
+        print(f"LOST WRITE: {problem}")
+    return 1 if result['problems'] else 0
+
+def import_entries_command(args):
+    """Stream a CSV/NDJSON file of historical entries into storage"""
+    from bulk_import import detect_format, iter_rows, import_entries
+    fmt = args.format or detect_format(args.file)
+    with open(args.file, "r", encoding="utf-8-sig", newline="") as f:
+        report = import_entries(CO2Tracker(), iter_rows(f, fmt), username=args.user, batch_size=args.batch_size)
+    print(f"Imported {report.imported} of {report.rows} rows for {len(report.users)} users "
+          f"in {report.seconds:.2f}s ({report.rows_per_second:,.0f} rows/s)")
+    if report.error:
+        print(f"Stopped after a failed write ({report.failed} rows not saved): {report.error}")
+    if report.rejects:
+        print(f"Rejected {report.rejected} rows:" if not report.failed else
+              f"Rejected {report.rejected} rows, failed to save {report.failed}:")
+        for line_number, error in report.rejects[:args.show_rejects]:
+            print(f"  line {line_number}: {error}")
+    return 1 if report.rejected or report.failed else 0
+
+def export_command(args):
+    """Stream entries for some or all users to CSV, NDJSON or Parquet"""
+    from exporter import export_entries
+    from storage import get_storage
+    storage = get_storage()
+    if args.format == "parquet":
+        if args.output == "-":
+            print("Parquet export needs --output FILE")
+            return 1
+        count = export_entries(storage, "parquet", args.output, args.user, args.start, args.end)
+    elif args.output == "-":
+        count = export_entries(storage, args.format, sys.stdout, args.user, args.start, args.end)
+    else:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            count = export_entries(storage, args.format, f, args.user, args.start, args.end)
+    print(f"Exported {count} entries", file=sys.stderr)
+    return 0
+
+def generate_data(args):
+    """Write a synthetic user_data/ tree (and users file) under a directory"""
+    import os
+    from synthetic_data import SyntheticDataGenerator
+    os.makedirs(args.dir, exist_ok=True)
+    os.chdir(args.dir)
+    generator = SyntheticDataGenerator(seed=args.seed, days=args.days, recent_bias=args.recent_bias)
+    tracker = CO2Tracker()
+    usernames = generator.populate(tracker.storage, args.users, args.entries_per_user)
+    tracker.rebuild_leaderboard_index()
+    print(f"Generated {len(usernames)} users with {args.entries_per_user} entries each in {args.dir}")
+
+def generate_catalog(args):
+    """Write a synthetic activity catalog CSV for trying out a large catalog"""
+    import csv
+    from synthetic_data import generate_activity_catalog
+    rows = generate_activity_catalog(args.count, args.seed)
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["activity", "category", "unit", "co2"])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote {len(rows)} activities to {args.output}")
+
+def benchmark_catalog(args):
+    """Time activity search and basket pricing on a synthetic catalog"""
+    from benchmarks import run_catalog_benchmark
+    result = run_catalog_benchmark(args.count, args.queries, seed=args.seed)
+    print(f"{result['items']} activities built in {result['build_seconds']:.2f}s, {result['catalog_mb']:.1f} MB")
+    print(f"search p50 {result['search_p50_ms']:.3f} ms, p95 {result['search_p95_ms']:.3f} ms, "
+          f"max {result['search_max_ms']:.3f} ms")
+    print(f"priced a {result['basket_items']}-item basket in {result['basket_ms']:.3f} ms")
+
+def benchmark(args):
+    """Time the app's data paths on synthetic data and write JSON results"""
+    import json
+    from benchmarks import run_benchmarks, parse_size
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = run_benchmarks(sizes, users=args.users, repeat=args.repeat, seed=args.seed, keep=args.keep)
+    for result in results["results"]:
+        print(f"{result['benchmark']:<28} {result['entries']:>9} entries  "
+              f"median {result['median'] * 1000:10.2f} ms  min {result['min'] * 1000:10.2f} ms")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+def benchmark_startup(args):
+    """Time the app's cold start and reruns and write JSON results"""
+    import json
+    from benchmarks import run_startup_benchmark
+    results = run_startup_benchmark(args.app_dir, users=args.users, entries_per_user=args.entries_per_user,
+                                    reruns=args.reruns, seed=args.seed)
+    for result in results["results"]:
+        print(f"{result['benchmark']:<28} median {result['median'] * 1000:10.2f} ms  "
+              f"min {result['min'] * 1000:10.2f} ms")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+def entry_memory(args):
+    """Measure memory per 100k entries as parsed dicts and as compact entries"""
+    from compact_entry import measure_entry_memory
+    from data_codecs import get_codec_files
+    from synthetic_data import SyntheticDataGenerator
+    generator = SyntheticDataGenerator(seed=args.seed)
+    entries = []
+    for username in generator.usernames(args.users):
+        entries.extend(generator.generate_entries(username, args.entries // args.users))
+    result = measure_entry_memory(get_codec_files().codec, entries)
+    print(f"{result['entries']} entries: dicts {result['dict_bytes_per_entry']:.0f} B/entry "
+          f"({result['dict_mb_per_100000']:.1f} MB per 100k), compact {result['compact_bytes_per_entry']:.0f} B/entry "
+          f"({result['compact_mb_per_100000']:.1f} MB per 100k), ratio {result['ratio']:.2f}")
+
+def benchmark_compare(args):
+    """Compare two benchmark result files"""
+    from benchmarks import load_results, compare_results
+    rows = compare_results(load_results(args.old), load_results(args.new), args.statistic)
+    for name, entries, before, after, ratio in rows:
+        print(f"{name:<28} {entries:>9} entries  {before * 1000:10.2f} ms -> {after * 1000:10.2f} ms  x{ratio:.2f}")
+    regressions = [row for row in rows if row[4] > args.threshold]
+    return 1 if regressions else 0
+
+def build_parser():
+    """Build the command line parser"""
+    parser = argparse.ArgumentParser(description="CO₂ Tracker maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate-to-sqlite", help="Import YAML data into a SQLite database")
+    migrate.add_argument("--data-dir", default="user_data", help="YAML user data directory")
+    migrate.add_argument("--users-file", default="users.yaml", help="YAML users file")
+    migrate.add_argument("--db", default="user_data/footprint.db", help="SQLite database to write")
+    migrate.set_defaults(func=migrate_to_sqlite)
+
+    shard = subparsers.add_parser("shard-user-data", help="Move flat user_data/ files into shard directories")
+    shard.add_argument("--data-dir", default="user_data", help="YAML data directory")
+    shard.add_argument("--users-file", default="users.yaml", help="YAML users file")
+    shard.set_defaults(func=shard_user_data)
+
+    rebuild = subparsers.add_parser("rebuild-leaderboard", help="Rebuild the leaderboard index from scratch")
+    rebuild.set_defaults(func=rebuild_leaderboard)
+
+    recompute = subparsers.add_parser("recompute-rewards", help="Rebuild streaks and badges from the login event log")
+    recompute.set_defaults(func=recompute_rewards)
+
+    reprice = subparsers.add_parser("recompute-emissions", help="Reprice quick entries to new emission factors")
+    reprice.add_argument("--version", type=int, help="Factor version to apply (default: latest)")
+    reprice.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    reprice.add_argument("--batch-size", type=int, default=100, help="Users per worker batch")
+    reprice.set_defaults(func=recompute_emissions)
+
+    importer = subparsers.add_parser("import-entries", help="Bulk import historical entries from CSV or NDJSON")
+    importer.add_argument("file", help="CSV or NDJSON file to import")
+    importer.add_argument("--user", help="Import every row for this user instead of a 'username' column")
+    importer.add_argument("--format", choices=["csv", "ndjson"], help="Input format (default: from the file name)")
+    importer.add_argument("--batch-size", type=int, default=5000, help="Rows validated and committed per batch")
+    importer.add_argument("--show-rejects", type=int, default=20, help="Rejected rows to print")
+    importer.set_defaults(func=import_entries_command)
+
+    exporter = subparsers.add_parser("export", help="Stream entries to CSV, NDJSON or Parquet")
+    exporter.add_argument("--format", choices=["csv", "ndjson", "parquet"], default="csv")
+    exporter.add_argument("--output", default="-", help="Output file (default: stdout)")
+    exporter.add_argument("--user", action="append", help="Export only this user (repeatable; default: all users)")
+    exporter.add_argument("--start", help="First date to include (YYYY-MM-DD)")
+    exporter.add_argument("--end", help="Last date to include (YYYY-MM-DD)")
+    exporter.set_defaults(func=export_command)
+
+    generate = subparsers.add_parser("generate-data", help="Write a deterministic synthetic user_data/ tree")
+    generate.add_argument("dir", help="Directory to create user_data/ and users.yaml in")
+    generate.add_argument("--users", type=int, default=100)
+    generate.add_argument("--entries-per-user", type=int, default=1000)
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--days", type=int, default=730, help="Days of history the entries span")
+    generate.add_argument("--recent-bias", type=float, default=1.0, help="Above 1 skews dates towards today")
+    generate.set_defaults(func=generate_data)
+
+    catalog = subparsers.add_parser("generate-catalog", help="Write a synthetic activity catalog CSV")
+    catalog.add_argument("output", help="CSV file to write")
+    catalog.add_argument("--count", type=int, default=50_000)
+    catalog.add_argument("--seed", type=int, default=0)
+    catalog.set_defaults(func=generate_catalog)
+
+    catalog_bench = subparsers.add_parser("benchmark-catalog", help="Time activity search on a synthetic catalog")
+    catalog_bench.add_argument("--count", type=int, default=50_000, help="Activities in the catalog")
+    catalog_bench.add_argument("--queries", type=int, default=2_000, help="Search queries to time")
+    catalog_bench.add_argument("--seed", type=int, default=0)
+    catalog_bench.set_defaults(func=benchmark_catalog)
+
+    bench = subparsers.add_parser("benchmark", help="Benchmark the data paths on synthetic data")
+    bench.add_argument("--sizes", default="1k,100k,1m", help="Comma-separated total entry counts")
+    bench.add_argument("--users", type=int, default=100, help="Users the entries are spread over")
+    bench.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    bench.add_argument("--keep", action="store_true", help="Keep the generated data directories")
+    bench.set_defaults(func=benchmark)
+
+    startup = subparsers.add_parser("benchmark-startup", help="Time the app's cold start and per-page reruns")
+    startup.add_argument("--app-dir", help="Checkout whose app.py to measure (default: this one)")
+    startup.add_argument("--users", type=int, default=10)
+    startup.add_argument("--entries-per-user", type=int, default=1000)
+    startup.add_argument("--reruns", type=int, default=10, help="Timed reruns per page")
+    startup.add_argument("--seed", type=int, default=0)
+    startup.add_argument("--output", default="startup_results.json", help="JSON results file")
+    startup.set_defaults(func=benchmark_startup)
+
+    memory = subparsers.add_parser("entry-memory", help="Measure entry memory as dicts and as compact entries")
+    memory.add_argument("--entries", type=int, default=100_000)
+    memory.add_argument("--users", type=int, default=10, help="Users the entries are generated for")
+    memory.add_argument("--seed", type=int, default=0)
+    memory.set_defaults(func=entry_memory)
+
+    compare = subparsers.add_parser("benchmark-compare", help="Compare two benchmark result files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--statistic", choices=["min", "median", "mean", "max"], default="median")
+    compare.add_argument("--threshold", type=float, default=1.2, help="Ratio above which to exit non-zero")
+    compare.set_defaults(func=benchmark_compare)
+
+    stress = subparsers.add_parser("stress-writes", help="Check that concurrent writers never lose updates")
+    stress.add_argument("--processes", type=int, default=4)
+    stress.add_argument("--threads", type=int, default=4)
+    stress.add_argument("--entries", type=int, default=50, help="Entries added per thread")
+    stress.add_argument("--users", type=int, default=3, help="Users the entries are spread over")
+    stress.set_defaults(func=stress_writes)
+
+    return parser
+
+def main(argv=None):
+    """Run a maintenance command"""
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
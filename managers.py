@@ -0,0 +1,35 @@
+import streamlit as st
+from auth import AuthManager
+from co2_tracker import CO2Tracker
+
+# Managers are created once per process and shared by every session and rerun.
+# They live in a module rather than app.py because the app script runs again
+# on every interaction, and re-decorating the functions each time re-hashes them.
+
+@st.cache_resource(show_spinner=False)
+def get_auth_manager():
+    """Get the shared authentication manager"""
+    return AuthManager()
+
+@st.cache_resource(show_spinner=False)
+def get_co2_tracker():
+    """Get the shared CO₂ tracker"""
+    return CO2Tracker()
+
+@st.cache_resource(show_spinner=False)
+def get_dashboard():
+    """Get the shared dashboard; pandas and plotly load on first use"""
+    from dashboard import Dashboard
+    return Dashboard(get_co2_tracker())
+
+@st.cache_resource(show_spinner=False)
+def get_rewards_manager():
+    """Get the shared rewards manager"""
+    from rewards import RewardsManager
+    return RewardsManager(get_co2_tracker())
+
+@st.cache_resource(show_spinner=False)
+def get_admin_page():
+    """Get the shared admin metrics page"""
+    from admin import AdminPage
+    return AdminPage()
@@ -0,0 +1,260 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from file_lock import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the timing histogram buckets; +Inf is implied
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Label for work done outside a page render (background threads, CLI)
+NO_PAGE = "none"
+
+class _Timing:
+    """Histogram counts, sum and byte totals for one (operation, page)"""
+
+    __slots__ = ("buckets", "count", "total", "bytes_read", "bytes_written")
+
+    def __init__(self):
+        self.buckets = [0] * (len(TIMING_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class Metrics:
+    """Process-wide timing histograms, call counts and I/O bytes per operation and page
+
+    ``timed`` wraps a hot path; the page label comes from ``set_page``,
+    which the app calls at the start of every rerun on the script thread.
+    Bytes read and written by the data files are charged to the innermost
+    timed operation on the same thread. Recording one call is a clock read,
+    a bisect and a few additions under a lock, cheap enough to leave on.
+    """
+
+    def __init__(self):
+        self._timings = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def set_page(self, page):
+        """Label this thread's following operations with a page"""
+        self._local.page = page
+
+    def _page(self):
+        """Get this thread's page label"""
+        return getattr(self._local, "page", NO_PAGE)
+
+    def _stack(self):
+        """Get this thread's stack of running operations"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _timing(self, operation, page):
+        """Get the timing for (operation, page); caller holds the lock"""
+        key = (operation, page)
+        timing = self._timings.get(key)
+        if timing is None:
+            timing = self._timings[key] = _Timing()
+        return timing
+
+    def observe(self, operation, seconds, page=None):
+        """Record one call of an operation"""
+        bucket = bisect_left(TIMING_BUCKETS, seconds)
+        with self._lock:
+            timing = self._timing(operation, page or self._page())
+            timing.buckets[bucket] += 1
+            timing.count += 1
+            timing.total += seconds
+
+    def add_bytes(self, read=0, written=0):
+        """Charge bytes read or written to the running operation"""
+        stack = self._stack()
+        operation = stack[-1] if stack else "other"
+        with self._lock:
+            timing = self._timing(operation, self._page())
+            timing.bytes_read += read
+            timing.bytes_written += written
+
+    @contextmanager
+    def timed(self, operation):
+        """Time a block as one call of an operation"""
+        stack = self._stack()
+        stack.append(operation)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(operation, time.perf_counter() - started)
+            stack.pop()
+
+    def register_collector(self, name, collect):
+        """Add gauges from ``collect()``, a dict of {metric name: value}, to every export"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def snapshot(self):
+        """Get a copy of every timing as {(operation, page): dict}"""
+        with self._lock:
+            return {
+                key: {
+                    "buckets": list(timing.buckets),
+                    "count": timing.count,
+                    "total": timing.total,
+                    "bytes_read": timing.bytes_read,
+                    "bytes_written": timing.bytes_written,
+                }
+                for key, timing in self._timings.items()
+            }
+
+    def collect_gauges(self):
+        """Get the registered gauges as {metric name: value}"""
+        with self._lock:
+            collectors = list(self._collectors.values())
+        gauges = {}
+        for collect in collectors:
+            try:
+                gauges.update(collect())
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return gauges
+
+    @staticmethod
+    def _labels(operation, page, **extra):
+        """Format Prometheus labels"""
+        labels = {"operation": operation, "page": page, **extra}
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP co2_operation_seconds Time spent in instrumented operations",
+            "# TYPE co2_operation_seconds histogram",
+        ]
+        for (operation, page), timing in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(TIMING_BUCKETS + ("+Inf",), timing["buckets"]):
+                cumulative += count
+                lines.append(f"co2_operation_seconds_bucket{self._labels(operation, page, le=bound)} {cumulative}")
+            lines.append(f"co2_operation_seconds_sum{self._labels(operation, page)} {timing['total']}")
+            lines.append(f"co2_operation_seconds_count{self._labels(operation, page)} {timing['count']}")
+        for direction in ("read", "written"):
+            lines.append(f"# HELP co2_operation_bytes_{direction}_total Data file bytes {direction} by operation")
+            lines.append(f"# TYPE co2_operation_bytes_{direction}_total counter")
+            for (operation, page), timing in sorted(snapshot.items()):
+                value = timing[f"bytes_{direction}"]
+                if value:
+                    lines.append(f"co2_operation_bytes_{direction}_total{self._labels(operation, page)} {value}")
+        for name, value in sorted(self.collect_gauges().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Get one row per (operation, page) with count, mean, estimated p50/p95 and bytes"""
+        rows = []
+        for (operation, page), timing in sorted(self.snapshot().items()):
+            count = timing["count"]
+            rows.append({
+                "operation": operation,
+                "page": page,
+                "calls": count,
+                "mean_ms": timing["total"] / count * 1000 if count else 0.0,
+                "p50_ms": _bucket_quantile(timing["buckets"], count, 0.5) * 1000,
+                "p95_ms": _bucket_quantile(timing["buckets"], count, 0.95) * 1000,
+                "bytes_read": timing["bytes_read"],
+                "bytes_written": timing["bytes_written"],
+            })
+        return rows
+
+    def write_file(self, path):
+        """Write the Prometheus text to a file, e.g. for node_exporter's textfile collector"""
+        text = self.render_prometheus()
+        atomic_write(path, lambda f: f.write(text))
+
+
+def _escape(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _bucket_quantile(buckets, count, quantile):
+    """Estimate a quantile as the upper bound of the bucket it falls in"""
+    if not count:
+        return 0.0
+    rank = quantile * count
+    seen = 0
+    for bound, bucket_count in zip(TIMING_BUCKETS, buckets):
+        seen += bucket_count
+        if seen >= rank:
+            return bound
+    return TIMING_BUCKETS[-1]
+
+def _serve(metrics, port):
+    """Serve the Prometheus text on 127.0.0.1:port/metrics"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _write_periodically(metrics, path, interval):
+    """Rewrite the metrics file every ``interval`` seconds"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.write_file(path)
+            except OSError:
+                logger.exception("Could not write metrics to %s", path)
+    threading.Thread(target=run, daemon=True).start()
+
+
+_metrics = None
+_metrics_guard = threading.Lock()
+
+def get_metrics():
+    """Get the process-wide metrics
+
+    The first call also starts the exports the environment asks for:
+    CO2_METRICS_PORT serves ``/metrics`` on localhost, and CO2_METRICS_FILE
+    is rewritten every CO2_METRICS_INTERVAL seconds (default 15).
+    """
+    global _metrics
+    with _metrics_guard:
+        if _metrics is None:
+            _metrics = Metrics()
+            port = os.environ.get("CO2_METRICS_PORT")
+            if port:
+                try:
+                    _serve(_metrics, int(port))
+                except OSError:
+                    # Another process of the same deployment already serves the port
+                    logger.warning("Metrics port %s is in use; not serving metrics from this process", port)
+            path = os.environ.get("CO2_METRICS_FILE")
+            if path:
+                _write_periodically(_metrics, path, float(os.environ.get("CO2_METRICS_INTERVAL", 15)))
+        return _metrics
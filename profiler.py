@@ -0,0 +1,235 @@
+import os
+import io
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from file_lock import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Rows kept in a capture's summary
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+# Frames recorded per allocation while tracing
+TRACE_FRAMES = 10
+
+class RerunProfiler:
+    """On-demand cProfile and tracemalloc captures of whole app reruns
+
+    A rerun is captured when an admin armed its session for a number of
+    reruns, or when sampling is on and it is the ``sample_every``-th rerun
+    of the process. Each capture writes three artifacts under
+    ``artifact_dir``, named ``<capture id>.<ext>``:
+
+    - ``.prof``: cProfile stats, for ``pstats`` or snakeviz
+    - ``.tracemalloc``: a tracemalloc snapshot of what the rerun allocated
+      and still held at its end
+    - ``.json``: the summary the admin page shows (top functions by
+      cumulative time, top allocation sites, wall time and peak memory)
+
+    tracemalloc is process-wide, so one rerun is captured at a time; a
+    rerun arriving during another capture runs unprofiled and an armed
+    session keeps its remaining count. Only the newest ``keep`` captures
+    are kept.
+    """
+
+    def __init__(self, artifact_dir, sample_every=0, keep=50):
+        self.artifact_dir = artifact_dir
+        self.sample_every = sample_every
+        self.keep = keep
+        self._armed = {}
+        self._sessions = {}
+        self._reruns = 0
+        self._guard = threading.Lock()
+        self._capturing = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Create a profiler configured by CO2_PROFILE_DIR / CO2_PROFILE_EVERY / CO2_PROFILE_KEEP"""
+        return cls(
+            os.environ.get("CO2_PROFILE_DIR", "profiles"),
+            sample_every=int(os.environ.get("CO2_PROFILE_EVERY", 0)),
+            keep=int(os.environ.get("CO2_PROFILE_KEEP", 50))
+        )
+
+    def arm(self, session_id, reruns=1):
+        """Capture the next ``reruns`` reruns of a session"""
+        with self._guard:
+            self._armed[session_id] = reruns
+
+    def disarm(self, session_id):
+        """Stop capturing a session"""
+        with self._guard:
+            self._armed.pop(session_id, None)
+
+    def armed(self):
+        """Get {session id: reruns left to capture}"""
+        with self._guard:
+            return dict(self._armed)
+
+    def sessions(self):
+        """Get the sessions seen recently as {session id: (username, page, last seen)}, newest first"""
+        with self._guard:
+            return dict(sorted(self._sessions.items(), key=lambda item: item[1][2], reverse=True))
+
+    def _should_capture(self, session_id):
+        """Count a rerun and decide whether to capture it; caller holds the guard"""
+        self._reruns += 1
+        if self._armed.get(session_id):
+            return "armed"
+        if self.sample_every and self._reruns % self.sample_every == 0:
+            return "sampled"
+        return None
+
+    @contextmanager
+    def capture(self, session_id, username, describe_page):
+        """Run a rerun, profiling it if it was armed or sampled
+
+        ``describe_page()`` is called when the rerun ends to label the
+        capture, since the page is only known once the script has run.
+        """
+        with self._guard:
+            reason = self._should_capture(session_id)
+        if reason is None or not self._capturing.acquire(blocking=False):
+            try:
+                yield
+            finally:
+                self._seen(session_id, username, describe_page)
+            return
+
+        try:
+            if reason == "armed":
+                with self._guard:
+                    if self._armed.get(session_id):
+                        self._armed[session_id] -= 1
+                        if not self._armed[session_id]:
+                            del self._armed[session_id]
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start(TRACE_FRAMES)
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.take_snapshot()
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                seconds = time.perf_counter() - started
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                if not tracing:
+                    tracemalloc.stop()
+                page = self._seen(session_id, username, describe_page)
+                try:
+                    self._save(profile, baseline, snapshot, {
+                        "username": username,
+                        "session_id": session_id,
+                        "page": page,
+                        "reason": reason,
+                        "seconds": seconds,
+                        "peak_bytes": peak,
+                    })
+                except OSError:
+                    logger.exception("Could not save profile capture to %s", self.artifact_dir)
+        finally:
+            self._capturing.release()
+
+    def _seen(self, session_id, username, describe_page):
+        """Note a session's latest rerun and return its page label"""
+        try:
+            page = describe_page()
+        except Exception:
+            page = None
+        with self._guard:
+            self._sessions[session_id] = (username, page, time.time())
+            # Forget sessions idle for an hour
+            cutoff = time.time() - 3600
+            for stale in [key for key, (_, _, seen) in self._sessions.items() if seen < cutoff]:
+                del self._sessions[stale]
+        return page
+
+    def _save(self, profile, baseline, snapshot, info):
+        """Write a capture's artifacts and summary"""
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        started = datetime.now()
+        capture_id = f"{started:%Y%m%d-%H%M%S-%f}-{info['page'] or 'auth'}".replace(" ", "_").replace("/", "_")
+        path = os.path.join(self.artifact_dir, capture_id)
+
+        profile.dump_stats(path + ".prof")
+        snapshot.dump(path + ".tracemalloc")
+
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        functions = []
+        for (filename, line, name), (calls, primitive, own, cumulative, _) in stats.stats.items():
+            functions.append({
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "own_ms": own * 1000,
+                "cumulative_ms": cumulative * 1000,
+            })
+        functions.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+
+        # Allocations made during the rerun that were still held at its end
+        allocations = [
+            {
+                "site": str(difference.traceback[0]) if difference.traceback else "?",
+                "size_kb": difference.size_diff / 1024,
+                "count": difference.count_diff,
+            }
+            for difference in snapshot.compare_to(baseline, "lineno")[:TOP_ALLOCATIONS]
+        ]
+
+        summary = dict(info, id=capture_id, captured_at=started.isoformat(timespec="seconds"),
+                       functions=functions[:TOP_FUNCTIONS], allocations=allocations)
+        atomic_write(path + ".json", lambda f: json.dump(summary, f))
+        self._prune()
+
+    def _prune(self):
+        """Delete all but the newest ``keep`` captures"""
+        for capture_id in self.capture_ids()[self.keep:]:
+            for extension in (".json", ".prof", ".tracemalloc"):
+                try:
+                    os.remove(os.path.join(self.artifact_dir, capture_id + extension))
+                except FileNotFoundError:
+                    pass
+
+    def capture_ids(self):
+        """Get the ids of the stored captures, newest first"""
+        try:
+            names = os.listdir(self.artifact_dir)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-len(".json")] for name in names if name.endswith(".json")), reverse=True)
+
+    def load_summary(self, capture_id):
+        """Load a capture's summary, or None if it was pruned"""
+        try:
+            with open(os.path.join(self.artifact_dir, capture_id + ".json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def artifact_path(self, capture_id, extension):
+        """Get the path of one of a capture's artifacts"""
+        return os.path.join(self.artifact_dir, capture_id + extension)
+
+
+_profiler = None
+_profiler_guard = threading.Lock()
+
+def get_rerun_profiler():
+    """Get the process-wide rerun profiler"""
+    global _profiler
+    with _profiler_guard:
+        if _profiler is None:
+            _profiler = RerunProfiler.from_env()
+        return _profiler
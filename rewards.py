@@ -1,25 +1,20 @@
 import streamlit as st
-import yaml
-import os
-from datetime import datetime, date, timedelta
+from datetime import date
 from co2_tracker import CO2Tracker
-import pandas as pd
+from login_events import BADGE_RULES, LoginColumns, apply_login, evaluate_logins, get_login_event_log
 
 class RewardsManager:
-    def __init__(self):
-        self.rewards_dir = "user_data"
-        self.co2_tracker = CO2Tracker()
-        if not os.path.exists(self.rewards_dir):
-            os.makedirs(self.rewards_dir)
-    
-    def get_user_rewards_file(self, username):
-        """Get the rewards file path for a specific user"""
-        return os.path.join(self.rewards_dir, f"{username}_rewards.yaml")
+    def __init__(self, co2_tracker=None):
+        self.co2_tracker = co2_tracker or CO2Tracker()
+        self.storage = self.co2_tracker.storage
+        self.login_events = get_login_event_log(self.co2_tracker.data_dir)
+        # username -> (day, rewards version, rewards) once today's login is recorded
+        self._logged_in = {}
     
     def load_user_rewards(self, username):
         """Load rewards data for a specific user"""
-        file_path = self.get_user_rewards_file(username)
-        if not os.path.exists(file_path):
+        data = self.storage.load_rewards(username)
+        if data is None:
             return {
                 "login_streak": 0,
                 "last_login": None,
@@ -32,9 +27,7 @@ class RewardsManager:
                 }
             }
         
-        with open(file_path, "r") as f:
-            data = yaml.safe_load(f)
-            return data if data else self.get_default_rewards()
+        return data if data else self.get_default_rewards()
     
     def get_default_rewards(self):
         """Get default rewards structure"""
@@ -52,98 +45,100 @@ class RewardsManager:
     
     def save_user_rewards(self, username, data):
         """Save rewards data for a specific user"""
-        file_path = self.get_user_rewards_file(username)
-        with open(file_path, "w") as f:
-            yaml.dump(data, f)
+        self.storage.save_rewards(username, data)
     
     def update_daily_login(self, username):
         """Update user's daily login streak"""
+        today = date.today()
+        # After today's login is recorded, views only check the rewards version
+        cached = self._logged_in.get(username)
+        if cached is not None and cached[0] == today and cached[1] == self.storage.rewards_version(username):
+            return dict(cached[2], badges=dict(cached[2]["badges"]))
+        
+        # Concurrent sessions of the same user must not both bump the streak
+        with self.storage.lock_user(username):
+            rewards_data = self._update_daily_login(username, today)
+            self._logged_in[username] = (today, self.storage.rewards_version(username), rewards_data)
+        return dict(rewards_data, badges=dict(rewards_data["badges"]))
+    
+    def _update_daily_login(self, username, today):
+        """Log today's login and advance the derived rewards; caller holds the user's lock"""
         rewards_data = self.load_user_rewards(username)
-        today = date.today().isoformat()
-        last_login = rewards_data.get("last_login")
-        
-        # If first login or different day
-        if not last_login or last_login != today:
-            # Check if consecutive day
-            if last_login:
-                last_date = datetime.fromisoformat(last_login).date()
-                yesterday = date.today() - timedelta(days=1)
-                
-                if last_date == yesterday:
-                    # Consecutive login
-                    rewards_data["login_streak"] += 1
-                elif last_date == date.today():
-                    # Same day, no update needed
-                    return rewards_data
-                else:
-                    # Streak broken
-                    rewards_data["login_streak"] = 1
-            else:
-                # First login
-                rewards_data["login_streak"] = 1
-            
-            rewards_data["last_login"] = today
-            rewards_data["total_logins"] += 1
-            
-            # Check for badge achievements
-            self.check_and_award_badges(rewards_data)
-            
+        changed = False
+        
+        # Rewards from before logins were logged become the user's baseline
+        if not rewards_data.get("event_log"):
+            self.login_events.seed(username, rewards_data)
+            rewards_data["event_log"] = True
+            changed = True
+        
+        # The event is logged before the rewards are saved, so a replay never misses a login
+        if apply_login(rewards_data, today):
+            self.login_events.record_login(username, today)
+            changed = True
+        
+        if changed:
             self.save_user_rewards(username, rewards_data)
         
         return rewards_data
     
-    def check_and_award_badges(self, rewards_data):
-        """Check and award badges based on current streak"""
-        current_streak = rewards_data["login_streak"]
-        
-        # Award badges based on streak milestones
-        if current_streak >= 30 and current_streak % 30 == 0:
-            rewards_data["badges"]["Monthly Mavericks"] += 1
-        elif current_streak >= 21 and current_streak % 21 == 0:
-            rewards_data["badges"]["Habit Builder"] += 1
-        elif current_streak >= 14 and current_streak % 14 == 0:
-            rewards_data["badges"]["Fortniter"] += 1
-        elif current_streak >= 7 and current_streak % 7 == 0:
-            rewards_data["badges"]["Weekly Champions"] += 1
+    def recompute_rewards(self, rules=BADGE_RULES):
+        """Rebuild every logged user's streaks and badges from the login events
+
+        Runs in one pass over the whole log and overwrites the rewards
+        documents, so changed badge rules apply retroactively. Users who log
+        in while it runs are re-evaluated, alone, with the events they added.
+        """
+        badge_names = list(self.get_default_rewards()["badges"])
+        columns = LoginColumns()
+        pending, offset = self.login_events.read_into(columns)
+        users = set()
+        while pending:
+            results = evaluate_logins(columns, badge_names, rules, pending)
+            stale = set()
+            for username in pending:
+                # Logins are recorded under the user's lock, so catching up on
+                # the log while holding it shows whether this result is out of date
+                with self.storage.lock_user(username):
+                    touched, offset = self.login_events.read_into(columns, offset)
+                    stale |= touched
+                    if username not in stale:
+                        self.save_user_rewards(username, results[username])
+            users |= pending
+            pending = stale
+        return len(users)
     
-    def get_leaderboard(self):
+    def get_leaderboard(self, limit=None):
         """Generate leaderboard based on total CO2 emissions"""
         leaderboard = []
         
-        # Get all users from user_data directory
-        if not os.path.exists(self.rewards_dir):
-            return []
-        
-        for filename in os.listdir(self.rewards_dir):
-            if filename.endswith("_co2_data.yaml"):
-                username = filename.replace("_co2_data.yaml", "")
-                user_data = self.co2_tracker.load_user_data(username)
-                
-                if user_data:
-                    total_emissions = sum(entry.get('co2_amount', 0) for entry in user_data)/len(user_data)
-                    leaderboard.append({
-                        "username": username,
-                        "total_emissions": total_emissions,
-                        "entries_count": len(user_data)
-                    })
-        
-        # Sort by total emissions (ascending - lower is better)
-        leaderboard.sort(key=lambda x: x['total_emissions'])
-        
-        # Add rankings
-        for i, user in enumerate(leaderboard):
-            user["rank"] = i + 1
-            if i == 0:
-                user["medal"] = "🥇 Gold"
-            elif i == 1:
-                user["medal"] = "🥈 Silver"
-            elif i == 2:
-                user["medal"] = "🥉 Bronze"
-            else:
-                user["medal"] = ""
+        # Rankings come from the incrementally maintained leaderboard index
+        with self.co2_tracker.metrics.timed("get_leaderboard"):
+            index = self.co2_tracker.leaderboard_index
+            for rank, username, average, count in index.top(limit if limit is not None else index.size()):
+                leaderboard.append(self.make_leaderboard_row(rank, username, average, count))
         
         return leaderboard
     
+    def get_user_rank(self, username):
+        """Get a user's leaderboard row, or None if they have no entries"""
+        position = self.co2_tracker.leaderboard_index.rank_of(username)
+        if position is None:
+            return None
+        rank, average, count = position
+        return self.make_leaderboard_row(rank, username, average, count)
+    
+    def make_leaderboard_row(self, rank, username, average, count):
+        """Build a leaderboard row with its medal"""
+        medals = {1: "🥇 Gold", 2: "🥈 Silver", 3: "🥉 Bronze"}
+        return {
+            "username": username,
+            "total_emissions": average,
+            "entries_count": count,
+            "rank": rank,
+            "medal": medals.get(rank, "")
+        }
+    
     def show_rewards_page(self, username):
         """Display the rewards and leaderboard page"""
         st.title("🏆 Rewards & Achievements")
@@ -191,19 +186,15 @@ class RewardsManager:
         st.subheader("🏆 Global Leaderboard")
         st.markdown("*Rankings based on average CO₂ emissions per day")
         
-        leaderboard = self.get_leaderboard()
+        leaderboard = self.get_leaderboard(limit=10)
         
         if leaderboard:
             # Find current user's position
-            user_position = None
-            for user in leaderboard:
-                if user['username'] == username:
-                    user_position = user
-                    break
+            user_position = self.get_user_rank(username)
             
             # Display top 10
             st.write("**Top 10 Eco-Warriors:**")
-            for i, user in enumerate(leaderboard[:10]):
+            for i, user in enumerate(leaderboard):
                 if user['username'] == username:
                     # Highlight current user
                     st.markdown(f"**→ {user['rank']}. {user['medal']} {user['username']} - {user['total_emissions']:.2f} kg CO₂/day ({user['entries_count']} entries) ←**")
@@ -0,0 +1,177 @@
+import os
+import copy
+import threading
+from collections import OrderedDict
+
+class RollupStore:
+    """Per-user category rollups and overall figures kept up to date at write time
+
+    A user's rollups are one small document with:
+
+    - ``categories``: ``{category: [total, count]}``
+    - ``total``, ``count``, ``min_date`` and ``max_date``
+
+    so the dashboard's headline figures and suggestions need no pass over
+    the entries; its charts come from the entry index. The document does
+    not grow with the number of days tracked, so keeping it current costs
+    the same on every write.
+
+    Documents are cached per process in an LRU sized like the entry cache.
+    A cached document is shared with every session reading it and never
+    changed: updates work on a copy, which is cached only once saved.
+    """
+
+    KIND = "rollups"
+
+    def __init__(self, storage, max_users=1000):
+        self.storage = storage
+        self.max_users = max_users
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, storage):
+        """Create a store whose cache is sized by CO2_CACHE_MAX_USERS"""
+        return cls(storage, max_users=int(os.environ.get("CO2_CACHE_MAX_USERS", 1000)))
+
+    def _lock_for(self, username):
+        """Get the lock guarding a user's rollups"""
+        return self.storage.lock_user(username)
+
+    @staticmethod
+    def empty():
+        """Get rollups for a user with no entries"""
+        return {
+            "categories": {},
+            "total": 0.0,
+            "count": 0,
+            "min_date": None,
+            "max_date": None
+        }
+
+    @staticmethod
+    def apply(rollups, entries, sign):
+        """Add (sign=1) or remove (sign=-1) entries from rollups in place
+
+        Removing an entry dated on ``min_date`` or ``max_date`` leaves the
+        bounds as they were; ``_update`` refreshes them from storage.
+        """
+        # Documents written before the charts moved to the entry index carry per-day/month tables
+        rollups.pop("daily", None)
+        rollups.pop("monthly", None)
+        categories = rollups["categories"]
+
+        for entry in entries:
+            amount = sign * (entry.get('co2_amount', 0) or 0)
+            day = str(entry['date'])
+
+            category_total, category_count = categories.get(entry['category'], [0.0, 0])
+            category_count += sign
+            if category_count > 0:
+                categories[entry['category']] = [category_total + amount, category_count]
+            else:
+                categories.pop(entry['category'], None)
+
+            rollups["total"] += amount
+            rollups["count"] += sign
+            if sign > 0:
+                if rollups["min_date"] is None or day < rollups["min_date"]:
+                    rollups["min_date"] = day
+                if rollups["max_date"] is None or day > rollups["max_date"]:
+                    rollups["max_date"] = day
+
+        if rollups["count"] <= 0:
+            rollups.update(RollupStore.empty())
+        return rollups
+
+    @classmethod
+    def build(cls, entries):
+        """Build rollups from scratch for a list of entries"""
+        return cls.apply(cls.empty(), entries, 1)
+
+    def _load(self, username):
+        """Load a user's persisted rollups, or None if they were never built"""
+        version = self.storage.document_version(username, self.KIND)
+        with self._cache_lock:
+            cached = self._cache.get(username)
+            if cached is not None and version is not None and cached[0] == version:
+                self._cache.move_to_end(username)
+                return cached[1]
+        rollups = self.storage.load_document(username, self.KIND)
+        if rollups is not None:
+            self._remember(username, version, rollups)
+        return rollups
+
+    def _remember(self, username, version, rollups):
+        """Cache a user's rollups, evicting the least recently used users over budget"""
+        with self._cache_lock:
+            self._cache[username] = (version, rollups)
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+
+    def get(self, username):
+        """Get a user's rollups, building them from their entries if missing"""
+        rollups = self._load(username)
+        if rollups is None:
+            with self._lock_for(username):
+                rollups = self.build(self.storage.load_entries(username))
+                self._save(username, rollups)
+        return rollups
+
+    def _save(self, username, rollups):
+        """Persist a user's rollups and remember them in memory"""
+        # Cached only once saved, so a failed save leaves memory matching the disk
+        self.storage.save_document(username, self.KIND, rollups)
+        self._remember(username, self.storage.document_version(username, self.KIND), rollups)
+
+    def _update(self, username, entries, sign):
+        """Apply entries to a user's persisted rollups"""
+        with self._lock_for(username):
+            rollups = self._load(username)
+            if rollups is None:
+                # Missing rollups are rebuilt from the already-updated entries
+                rollups = self.build(self.storage.load_entries(username))
+            else:
+                # Readers in other sessions may be iterating the cached document
+                rollups = copy.deepcopy(rollups)
+                # Only removing an entry on a boundary day can move the bounds inwards
+                bounds_stale = sign < 0 and any(
+                    str(entry['date']) in (rollups["min_date"], rollups["max_date"]) for entry in entries
+                )
+                self.apply(rollups, entries, sign)
+                if bounds_stale and rollups["count"] > 0:
+                    summary = self.storage.get_entry_summary(username)
+                    rollups["min_date"], rollups["max_date"] = summary["min_date"], summary["max_date"]
+            self._save(username, rollups)
+
+    def add_entries(self, username, entries):
+        """Fold newly added entries into a user's rollups"""
+        self._update(username, entries, 1)
+
+    def remove_entry(self, username, entry):
+        """Take a deleted entry out of a user's rollups"""
+        self._update(username, [entry], -1)
+
+    def rebuild(self, username, entries):
+        """Replace a user's rollups after their entries were rewritten"""
+        with self._lock_for(username):
+            self._save(username, self.build(entries))
+
+    def clear(self, username):
+        """Drop a user's rollups"""
+        with self._lock_for(username):
+            self.storage.delete_document(username, self.KIND)
+            with self._cache_lock:
+                self._cache.pop(username, None)
+
+
+_stores = {}
+_stores_guard = threading.Lock()
+
+def get_rollup_store(storage):
+    """Get the process-wide rollup store for a storage backend"""
+    with _stores_guard:
+        if id(storage) not in _stores:
+            _stores[id(storage)] = RollupStore.from_env(storage)
+        return _stores[id(storage)]
@@ -0,0 +1,642 @@
+import os
+import json
+import heapq
+import sqlite3
+import threading
+from entry_journal import get_journal
+from file_lock import locked
+from data_codecs import CODECS, get_codec_files
+from user_layout import get_user_layout
+from data_cache import UserDataCache
+from entry_index import EntryIndexCache
+from compact_entry import CompactEntry, compact_entries, expand_entries
+
+class StorageBackend:
+    """Common interface for the places user, entry and rewards data can live
+
+    Backends implement the underscore entry methods; the public ones wrap them
+    with the shared parsed-entry cache so repeated reads skip parsing. The
+    cache holds ``CompactEntry`` objects, about a third of the memory of the
+    parsed dicts; ``load_entries`` turns them back into dicts.
+    """
+
+    def __init__(self):
+        self.entry_cache = UserDataCache.from_env()
+        self.index_cache = EntryIndexCache()
+
+    def load_users(self):
+        """Load all registered users as a dict keyed by username"""
+        raise NotImplementedError
+
+    def save_users(self, users):
+        """Replace the registered users"""
+        raise NotImplementedError
+
+    def users_version(self):
+        """Get a token that changes whenever the registered users change"""
+        raise NotImplementedError
+
+    def lock_users(self):
+        """Lock the registered users for a read-modify-write, across threads and processes"""
+        raise NotImplementedError
+
+    def lock_user(self, username):
+        """Lock one user's rewards and documents for a read-modify-write"""
+        raise NotImplementedError
+
+    def entries_version(self, username):
+        """Get a token that changes whenever a user's entries change"""
+        raise NotImplementedError
+
+    def _read_entries(self, username):
+        """Read a user's entries from the backend; returns (version, entries) read together"""
+        raise NotImplementedError
+
+    def _write_entries(self, username, entries):
+        """Replace a user's entries in the backend; returns the new version"""
+        raise NotImplementedError
+
+    def _append_entries(self, username, entries):
+        """Add entries for a user in the backend; returns the versions just before and after"""
+        raise NotImplementedError
+
+    def _delete_entry(self, username, entry):
+        """Delete one entry for a user in the backend; returns the versions just before and after"""
+        raise NotImplementedError
+
+    def _clear_entries(self, username):
+        """Delete all of a user's entries in the backend"""
+        raise NotImplementedError
+
+    def load_compact_entries(self, username):
+        """Load all CO₂ entries for a user in insertion order as compact entries"""
+        version = self.entries_version(username)
+        entries = self.entry_cache.get(username, version)
+        if entries is None:
+            # Cached under the version read with the entries: one read before
+            # them could predate a racing write the entries already include
+            version, entries = self._read_entries(username)
+            entries = compact_entries(entries)
+            self.entry_cache.put(username, version, entries)
+        return entries
+
+    def load_entries(self, username):
+        """Load all CO₂ entries for a user in insertion order"""
+        return expand_entries(self.load_compact_entries(username))
+
+    def has_entry(self, username, entry):
+        """Check whether a user has an entry equal to ``entry``"""
+        return CompactEntry.from_dict(entry) in self.load_compact_entries(username)
+
+    def save_entries(self, username, entries):
+        """Replace all CO₂ entries for a user"""
+        version = self._write_entries(username, entries)
+        self.entry_cache.put(username, version, compact_entries(entries))
+
+    def append_entries(self, username, entries):
+        """Add CO₂ entries for a user"""
+        # Both versions are read with the write, so no other write falls between them
+        old_version, new_version = self._append_entries(username, entries)
+        self.entry_cache.update(
+            username, old_version, new_version, lambda cached: cached.extend(compact_entries(entries))
+        )
+
+    def delete_entry(self, username, entry):
+        """Delete the first CO₂ entry equal to ``entry`` for a user"""
+        old_version, new_version = self._delete_entry(username, entry)
+        target = CompactEntry.from_dict(entry)
+
+        def remove(cached):
+            if target in cached:
+                cached.remove(target)
+
+        self.entry_cache.update(username, old_version, new_version, remove)
+
+    def clear_entries(self, username):
+        """Delete all CO₂ entries for a user"""
+        self._clear_entries(username)
+        self.entry_cache.invalidate(username)
+
+    def list_entry_users(self):
+        """List the users that have CO₂ data"""
+        raise NotImplementedError
+
+    def load_rewards(self, username):
+        """Load rewards data for a user, or None if they have none yet"""
+        raise NotImplementedError
+
+    def save_rewards(self, username, data):
+        """Save rewards data for a user"""
+        raise NotImplementedError
+
+    def rewards_version(self, username):
+        """Get a token that changes whenever a user's rewards change"""
+        raise NotImplementedError
+
+    def load_document(self, username, kind):
+        """Load a derived per-user document (e.g. rollups), or None if missing"""
+        raise NotImplementedError
+
+    def save_document(self, username, kind, data):
+        """Save a derived per-user document"""
+        raise NotImplementedError
+
+    def delete_document(self, username, kind):
+        """Delete a derived per-user document"""
+        raise NotImplementedError
+
+    def document_version(self, username, kind):
+        """Get a token that changes whenever a per-user document changes"""
+        raise NotImplementedError
+
+    def stream_entries(self, username, start_date=None, end_date=None):
+        """Yield a user's entries in the date range without filling the entry cache"""
+        # Exports walk every user once, so keep them from evicting hot users
+        version = self.entries_version(username)
+        cached = self.entry_cache.get(username, version)
+        entries = self._read_entries(username)[1] if cached is None else (entry.to_dict() for entry in cached)
+        for entry in entries:
+            if start_date is not None and entry['date'] < start_date:
+                continue
+            if end_date is not None and entry['date'] > end_date:
+                continue
+            yield entry
+
+    def get_entry_index(self, username):
+        """Get the date-sorted prefix-sum index of a user's entries"""
+        return self.index_cache.get(username, self.entries_version(username), self.load_compact_entries)
+
+    def latest_entries(self, username, limit):
+        """Get a user's ``limit`` latest entries by date, later-added first on the same date"""
+        entries = self.load_compact_entries(username)
+        latest = heapq.nlargest(limit, range(len(entries)), key=lambda i: (entries[i].get_date(), i))
+        return [entries[i].to_dict() for i in latest]
+
+    def query_entry_page(self, username, category=None, start_date=None, end_date=None, limit=25, after=None):
+        """Get one page of (position, entry), newest date first, after a cursor position"""
+        return self.get_entry_index(username).page(start_date, end_date, category, limit, after)
+
+    def sum_entries(self, username, category=None, start_date=None, end_date=None):
+        """Get (total CO₂, count) for a user's entries matching the filters"""
+        return self.get_entry_index(username).range_total(start_date, end_date, category)
+
+    def get_entry_summary(self, username):
+        """Get the categories and date bounds of a user's entries"""
+        index = self.get_entry_index(username)
+        if not len(index):
+            return {"categories": [], "min_date": None, "max_date": None}
+        return {
+            "categories": index.categories(),
+            "min_date": index.min_date().isoformat(),
+            "max_date": index.max_date().isoformat()
+        }
+
+    def get_user_totals(self):
+        """Get (username, total CO₂, entry count) for every user with entries"""
+        totals = []
+        for username in self.list_entry_users():
+            entries = self.load_compact_entries(username)
+            if entries:
+                totals.append((username, sum(entry.co2_amount or 0 for entry in entries), len(entries)))
+        return totals
+
+
+class YamlStorage(StorageBackend):
+    """Storage backed by files in ``user_data/`` plus ``users.yaml``
+
+    Files are YAML by default; ``CO2_CODEC`` picks another codec for the
+    whole deployment, and files still in the old format are converted on
+    first access.
+    """
+
+    def __init__(self, data_dir="user_data", user_file="users.yaml", files=None):
+        super().__init__()
+        self.data_dir = data_dir
+        self.user_file = user_file
+        self.files = files or get_codec_files()
+        self.users_base = os.path.splitext(user_file)[0]
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        self.layout = get_user_layout(self.data_dir)
+        self.journal = get_journal(self.data_dir)
+
+    def get_user_rewards_base(self, username, write=False):
+        """Get the rewards file path, without its codec extension, for a specific user"""
+        return self.layout.base(username, "rewards", write)
+
+    def get_user_rewards_file(self, username):
+        """Get the rewards file path for a specific user"""
+        return self.files.path(self.get_user_rewards_base(username))
+
+    def load_users(self):
+        return self.files.read(self.users_base, self.lock_users) or {}
+
+    def save_users(self, users):
+        with self.lock_users():
+            self.files.write(self.users_base, users)
+
+    def lock_users(self):
+        return locked(self.user_file)
+
+    def lock_user(self, username):
+        return locked(os.path.join(self.layout.shard_dir(username), username))
+
+    def users_version(self):
+        return self.files.version(self.users_base)
+
+    def entries_version(self, username):
+        return self.journal.version(username)
+
+    def _read_entries(self, username):
+        return self.journal.replay(username)
+
+    def _write_entries(self, username, entries):
+        return self.journal.replace(username, entries)
+
+    def _append_entries(self, username, entries):
+        return self.journal.append_many(username, entries)
+
+    def _delete_entry(self, username, entry):
+        return self.journal.delete(username, entry)
+
+    def _clear_entries(self, username):
+        self.journal.clear(username)
+
+    def list_entry_users(self):
+        if not os.path.exists(self.data_dir):
+            return []
+        # Sharded users come from the manifest; only users not yet migrated need a scan
+        users = {
+            username for username in self.layout.sharded_users()
+            if self.files.exists(self.journal.get_snapshot_base(username))
+        }
+        suffixes = tuple(f"_co2_data{codec_class.extension}" for codec_class in CODECS.values())
+        users.update(
+            filename.rsplit("_co2_data", 1)[0]
+            for filename in os.listdir(self.data_dir)
+            if filename.endswith(suffixes)
+        )
+        return sorted(users)
+
+    def load_rewards(self, username):
+        return self.layout.read(username, "rewards", lambda base: self.files.read(base, lambda: self.lock_user(username)))
+
+    def save_rewards(self, username, data):
+        with self.lock_user(username):
+            self.files.write(self.get_user_rewards_base(username, write=True), data)
+
+    def rewards_version(self, username):
+        return self.files.version(self.get_user_rewards_base(username))
+
+    def get_document_base(self, username, kind, write=False):
+        """Get the file path, without its codec extension, of a derived per-user document"""
+        return self.layout.base(username, kind, write)
+
+    def get_document_file(self, username, kind):
+        """Get the file path of a derived per-user document"""
+        return self.files.path(self.get_document_base(username, kind))
+
+    def load_document(self, username, kind):
+        return self.layout.read(username, kind, lambda base: self.files.read(base, lambda: self.lock_user(username)))
+
+    def save_document(self, username, kind, data):
+        with self.lock_user(username):
+            self.files.write(self.get_document_base(username, kind, write=True), data)
+
+    def delete_document(self, username, kind):
+        with self.lock_user(username):
+            self.files.remove(self.get_document_base(username, kind))
+
+    def document_version(self, username, kind):
+        return self.files.version(self.get_document_base(username, kind))
+
+
+class SQLiteStorage(StorageBackend):
+    """Storage backed by an embedded SQLite database
+
+    Entries keep their full YAML-schema dict in a JSON ``payload`` column; the
+    username, date, category and CO₂ amount are copied into indexed columns so
+    history filters and leaderboard totals run as SQL queries.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            payload TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            co2_amount REAL NOT NULL DEFAULT 0,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_user_date_category
+            ON entries (username, date, category);
+        CREATE TABLE IF NOT EXISTS rewards (
+            username TEXT PRIMARY KEY,
+            payload TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS documents (
+            username TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (username, kind)
+        );
+    """
+
+    def __init__(self, db_path="user_data/footprint.db"):
+        super().__init__()
+        self.db_path = db_path
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Get this thread's connection to the database"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _encode(value):
+        """Serialize a dict for a payload column"""
+        return json.dumps(value, sort_keys=True, default=str)
+
+    @classmethod
+    def _entry_row(cls, username, entry):
+        """Build an entries row for an entry dict"""
+        return (username, str(entry['date']), entry['category'], entry.get('co2_amount', 0) or 0, cls._encode(entry))
+
+    def load_users(self):
+        rows = self._connect().execute("SELECT username, payload FROM users")
+        return {username: json.loads(payload) for username, payload in rows}
+
+    def save_users(self, users):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM users")
+            conn.executemany(
+                "INSERT INTO users (username, payload) VALUES (?, ?)",
+                [(username, self._encode(user)) for username, user in users.items()]
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('users_version', 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+            )
+
+    def lock_users(self):
+        return locked(self.db_path + "-users")
+
+    def lock_user(self, username):
+        return locked(f"{self.db_path}-user-{username}")
+
+    def users_version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'users_version'").fetchone()
+        return row[0] if row else 0
+
+    def entries_version(self, username):
+        # Ids are never reused, so every insert raises the max id and every
+        # delete lowers the count
+        return tuple(self._connect().execute(
+            "SELECT MAX(id), COUNT(*) FROM entries WHERE username = ?", (username,)
+        ).fetchone())
+
+    def _read_entries(self, username):
+        rows = self._connect().execute(
+            "SELECT id, payload FROM entries WHERE username = ? ORDER BY id", (username,)
+        ).fetchall()
+        # The version is taken from the rows themselves, as entries_version would compute it
+        version = (rows[-1][0] if rows else None, len(rows))
+        return version, [json.loads(payload) for _, payload in rows]
+
+    def _write_entries(self, username, entries):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM entries WHERE username = ?", (username,))
+            conn.executemany(
+                "INSERT INTO entries (username, date, category, co2_amount, payload) VALUES (?, ?, ?, ?, ?)",
+                [self._entry_row(username, entry) for entry in entries]
+            )
+            return self.entries_version(username)
+
+    def _append_entries(self, username, entries):
+        with self._connect() as conn:
+            # Holding the write lock from the start keeps other writers out between the version reads
+            conn.execute("BEGIN IMMEDIATE")
+            old_version = self.entries_version(username)
+            conn.executemany(
+                "INSERT INTO entries (username, date, category, co2_amount, payload) VALUES (?, ?, ?, ?, ?)",
+                [self._entry_row(username, entry) for entry in entries]
+            )
+            return old_version, self.entries_version(username)
+
+    def _delete_entry(self, username, entry):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old_version = self.entries_version(username)
+            conn.execute(
+                "DELETE FROM entries WHERE id = ("
+                "SELECT id FROM entries WHERE username = ? AND date = ? AND payload = ? ORDER BY id LIMIT 1)",
+                (username, str(entry['date']), self._encode(entry))
+            )
+            return old_version, self.entries_version(username)
+
+    def _clear_entries(self, username):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE username = ?", (username,))
+
+    def list_entry_users(self):
+        rows = self._connect().execute("SELECT DISTINCT username FROM entries")
+        return [username for (username,) in rows]
+
+    def load_rewards(self, username):
+        row = self._connect().execute(
+            "SELECT payload FROM rewards WHERE username = ?", (username,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_rewards(self, username, data):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rewards (username, payload) VALUES (?, ?)",
+                (username, self._encode(data))
+            )
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('rewards_version', 1) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+            )
+
+    def rewards_version(self, username):
+        # One counter for every user's rewards; a change to anyone's only costs a re-read
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'rewards_version'").fetchone()
+        return row[0] if row else 0
+
+    def load_document(self, username, kind):
+        row = self._connect().execute(
+            "SELECT payload FROM documents WHERE username = ? AND kind = ?", (username, kind)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_document(self, username, kind, data):
+        with self._connect() as conn:
+            conn.execute(
+                # Versions come from one table-wide sequence so a document that
+                # is deleted and re-created never reuses an old version
+                "INSERT INTO documents (username, kind, version, payload) "
+                "VALUES (?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM documents), ?) "
+                "ON CONFLICT (username, kind) DO UPDATE SET version = excluded.version, payload = excluded.payload",
+                (username, kind, self._encode(data))
+            )
+
+    def delete_document(self, username, kind):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents WHERE username = ? AND kind = ?", (username, kind))
+
+    def document_version(self, username, kind):
+        row = self._connect().execute(
+            "SELECT version FROM documents WHERE username = ? AND kind = ?", (username, kind)
+        ).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _filter_clause(category, start_date, end_date):
+        """Build the WHERE clause shared by the filtered entry queries"""
+        query = "username = ?"
+        params = []
+        if start_date is not None:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND date <= ?"
+            params.append(end_date)
+        if category is not None:
+            query += " AND category = ?"
+            params.append(category)
+        return query, params
+
+    def stream_entries(self, username, start_date=None, end_date=None):
+        where, params = self._filter_clause(None, start_date, end_date)
+        # A dedicated cursor streams rows instead of fetching them all
+        rows = self._connect().cursor().execute(
+            f"SELECT payload FROM entries WHERE {where} ORDER BY date, id", [username] + params
+        )
+        for (payload,) in rows:
+            yield json.loads(payload)
+
+    def latest_entries(self, username, limit):
+        rows = self._connect().execute(
+            "SELECT payload FROM entries WHERE username = ? ORDER BY date DESC, id DESC LIMIT ?", (username, limit)
+        )
+        return [json.loads(payload) for (payload,) in rows]
+
+    def query_entry_page(self, username, category=None, start_date=None, end_date=None, limit=25, after=None):
+        where, params = self._filter_clause(category, start_date, end_date)
+        params = [username] + params
+        if after is not None:
+            where += " AND (date < ? OR (date = ? AND id > ?))"
+            params += [after[0], after[0], after[1]]
+        rows = self._connect().execute(
+            f"SELECT date, id, payload FROM entries WHERE {where} ORDER BY date DESC, id LIMIT ?",
+            params + [limit]
+        )
+        return [((entry_date, entry_id), json.loads(payload)) for entry_date, entry_id, payload in rows]
+
+    def sum_entries(self, username, category=None, start_date=None, end_date=None):
+        where, params = self._filter_clause(category, start_date, end_date)
+        total, count = self._connect().execute(
+            f"SELECT COALESCE(SUM(co2_amount), 0), COUNT(*) FROM entries WHERE {where}", [username] + params
+        ).fetchone()
+        return total, count
+
+    def get_entry_summary(self, username):
+        conn = self._connect()
+        min_date, max_date = conn.execute(
+            "SELECT MIN(date), MAX(date) FROM entries WHERE username = ?", (username,)
+        ).fetchone()
+        categories = [
+            category for (category,) in conn.execute(
+                "SELECT DISTINCT category FROM entries WHERE username = ? ORDER BY category", (username,)
+            )
+        ]
+        return {"categories": categories, "min_date": min_date, "max_date": max_date}
+
+    def get_user_totals(self):
+        rows = self._connect().execute(
+            "SELECT username, SUM(co2_amount), COUNT(*) FROM entries GROUP BY username"
+        )
+        return [(username, total, count) for username, total, count in rows]
+
+
+def migrate_yaml_to_sqlite(yaml_storage, sqlite_storage):
+    """Bulk import every YAML user, entry and rewards file into SQLite"""
+    users = yaml_storage.load_users()
+    sqlite_storage.save_users(users)
+
+    usernames = set(yaml_storage.list_entry_users())
+    entry_count = 0
+    with sqlite_storage._connect() as conn:
+        for username in usernames:
+            entries = yaml_storage.load_entries(username)
+            conn.execute("DELETE FROM entries WHERE username = ?", (username,))
+            conn.executemany(
+                "INSERT INTO entries (username, date, category, co2_amount, payload) VALUES (?, ?, ?, ?, ?)",
+                [sqlite_storage._entry_row(username, entry) for entry in entries]
+            )
+            entry_count += len(entries)
+
+    rewards_count = 0
+    for username in usernames | set(users):
+        rewards = yaml_storage.load_rewards(username)
+        if rewards:
+            sqlite_storage.save_rewards(username, rewards)
+            rewards_count += 1
+
+    return {"users": len(users), "entries": entry_count, "rewards": rewards_count}
+
+
+def migrate_to_sharded_layout(yaml_storage):
+    """Move every flat-layout user's files into their shard while the app keeps running"""
+    layout = yaml_storage.layout
+    users = files = 0
+    for username in sorted(layout.flat_users()):
+        # Take every lock on the user's files so no writer sees them mid-move
+        with yaml_storage.lock_user(username), yaml_storage.journal._lock_for(username):
+            if layout.is_sharded(username):
+                continue
+            files += layout.migrate_user(username)
+            users += 1
+    return {"users": users, "files": files}
+
+
+STORAGE_BACKENDS = {
+    "yaml": YamlStorage,
+    "sqlite": SQLiteStorage,
+}
+
+_storage = None
+_storage_guard = threading.Lock()
+
+def get_storage():
+    """Get the process-wide storage backend chosen by ``CO2_STORAGE_BACKEND``"""
+    global _storage
+    with _storage_guard:
+        if _storage is None:
+            backend = os.environ.get("CO2_STORAGE_BACKEND", "yaml").lower()
+            if backend not in STORAGE_BACKENDS:
+                raise ValueError(f"Unknown storage backend '{backend}', expected one of {sorted(STORAGE_BACKENDS)}")
+            if backend == "sqlite":
+                _storage = SQLiteStorage(os.environ.get("CO2_SQLITE_PATH", "user_data/footprint.db"))
+            else:
+                _storage = YamlStorage()
+        return _storage
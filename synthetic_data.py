@@ -0,0 +1,172 @@
+import random
+from datetime import date, datetime, timedelta
+from passlib.hash import pbkdf2_sha256
+
+# Activities per category with a typical CO₂ amount (kg), matching the quick entry form
+SYNTHETIC_ACTIVITIES = {
+    "Transportation": [("🚗 Car trip (10 km)", 2.31), ("🚌 Bus trip (10 km)", 0.89),
+                       ("🚊 Train trip (10 km)", 0.41), ("✈️ Domestic flight (1000 km)", 254.0)],
+    "Energy": [("💡 Home electricity (1 day avg)", 6.8), ("🔥 Natural gas heating (1 day)", 5.3)],
+    "Food": [("🥩 Beef meal", 6.61), ("🐔 Chicken meal", 1.57), ("🌱 Vegetarian meal", 0.38)],
+    "Shopping": [("🛒 Grocery shopping", 3.2), ("Clothes", 12.0), ("Electronics", 45.0)],
+    "Home": [("Laundry", 0.6), ("Dishwasher", 0.4)],
+    "Work": [("Office day", 3.5), ("Video calls", 0.2)],
+    "Other": [("Misc", 1.0)],
+}
+
+# Relative frequency of each category in generated entries
+DEFAULT_CATEGORY_WEIGHTS = {
+    "Transportation": 30, "Energy": 20, "Food": 30, "Shopping": 10, "Home": 5, "Work": 4, "Other": 1,
+}
+
+# Every synthetic user shares one password so generating users stays fast
+SYNTHETIC_PASSWORD = "synthetic"
+
+class SyntheticDataGenerator:
+    """Deterministic generator of users, entries and rewards for benchmarks
+
+    The same seed and settings always give the same data. Dates are spread
+    over the ``days`` before ``end_date``; ``recent_bias`` above 1 skews them
+    towards recent days the way active users' histories look.
+    """
+
+    def __init__(self, seed=0, days=730, end_date=None, category_weights=None,
+                 recent_bias=1.0, quick_ratio=0.7):
+        self.seed = seed
+        self.days = days
+        self.end_date = end_date or date.today()
+        self.category_weights = category_weights or DEFAULT_CATEGORY_WEIGHTS
+        self.recent_bias = recent_bias
+        self.quick_ratio = quick_ratio
+
+    def usernames(self, users):
+        """Get the synthetic usernames"""
+        return [f"user{i:05d}" for i in range(users)]
+
+    def generate_entries(self, username, count):
+        """Generate ``count`` entries for one user"""
+        rng = random.Random(f"{self.seed}:{username}")
+        categories = list(self.category_weights)
+        weights = [self.category_weights[category] for category in categories]
+        entries = []
+        for category in rng.choices(categories, weights, k=count):
+            activity, co2 = rng.choice(SYNTHETIC_ACTIVITIES[category])
+            days_ago = int(self.days * rng.random() ** self.recent_bias)
+            entry_date = self.end_date - timedelta(days=days_ago)
+            timestamp = datetime.combine(entry_date, datetime.min.time()) + timedelta(seconds=rng.randrange(86400))
+            if rng.random() < self.quick_ratio:
+                quantity = rng.choice([0.5, 1.0, 1.0, 1.0, 2.0, 3.0])
+                entries.append({
+                    "date": entry_date.isoformat(),
+                    "activity": activity,
+                    "category": category,
+                    "co2_amount": round(co2 * quantity, 2),
+                    "quantity": quantity,
+                    "notes": "",
+                    "entry_type": "quick",
+                    "timestamp": timestamp.isoformat()
+                })
+            else:
+                entries.append({
+                    "date": entry_date.isoformat(),
+                    "activity": activity,
+                    "category": category,
+                    "co2_amount": round(max(co2 * rng.lognormvariate(0, 0.5), 0.01), 2),
+                    "distance": round(rng.uniform(1, 50), 1) if category == "Transportation" else None,
+                    "duration": round(rng.uniform(0.1, 8), 1) if category == "Work" else None,
+                    "notes": rng.choice(["", "", "commute", "weekend", "estimated"]),
+                    "entry_type": "detailed",
+                    "timestamp": timestamp.isoformat()
+                })
+        return entries
+
+    def generate_rewards(self, username):
+        """Generate a plausible login streak for one user"""
+        rng = random.Random(f"{self.seed}:{username}:rewards")
+        streak = rng.randrange(0, 40)
+        return {
+            "login_streak": streak,
+            "last_login": (self.end_date - timedelta(days=rng.choice([0, 1, 1, 2, 10]))).isoformat(),
+            "total_logins": streak + rng.randrange(0, 300),
+            "badges": {
+                "Habit Builder": streak // 21,
+                "Fortniter": streak // 14,
+                "Weekly Champions": streak // 7,
+                "Monthly Mavericks": streak // 30
+            }
+        }
+
+    def populate(self, storage, users, entries_per_user):
+        """Write users, entries and rewards through a storage backend; returns the usernames"""
+        usernames = self.usernames(users)
+        password_hash = pbkdf2_sha256.hash(SYNTHETIC_PASSWORD)
+        created = self.end_date.isoformat()
+        with storage.lock_users():
+            accounts = storage.load_users()
+            for username in usernames:
+                accounts[username] = {"password": password_hash, "created_at": created}
+            storage.save_users(accounts)
+        for username in usernames:
+            storage.save_entries(username, self.generate_entries(username, entries_per_user))
+            storage.save_rewards(username, self.generate_rewards(username))
+        return usernames
+
+# Building blocks for a synthetic activity catalog: (category, unit, label parts, kg CO₂ range)
+CATALOG_FAMILIES = [
+    ("Transportation", "km", [
+        ["Car", "Van", "SUV", "Motorbike", "Taxi", "Pickup"],
+        ["petrol", "diesel", "hybrid", "plug-in hybrid", "electric", "LPG"],
+        ["small", "medium", "large", "executive", "sports", "compact"],
+    ], (0.02, 0.35)),
+    ("Transportation", "passenger km", [
+        ["Bus", "Coach", "Tram", "Metro", "Regional train", "High-speed train", "Ferry",
+         "Domestic flight", "Short-haul flight", "Long-haul flight"],
+        ["economy", "business", "first", "off-peak", "peak"],
+    ], (0.005, 0.3)),
+    ("Food", "serving", [
+        ["Beef", "Lamb", "Pork", "Chicken", "Turkey", "Salmon", "Cod", "Prawns", "Tofu", "Tempeh",
+         "Lentils", "Chickpeas", "Rice", "Pasta", "Bread", "Cheese", "Eggs", "Milk", "Oat milk",
+         "Almond milk", "Potatoes", "Tomatoes", "Avocado", "Bananas", "Apples", "Chocolate", "Coffee", "Tea"],
+        ["fresh", "frozen", "canned", "organic", "imported", "local", "processed", "air-freighted"],
+        ["burger", "stew", "salad", "curry", "sandwich", "soup", "stir fry", "bake", "wrap", "bowl"],
+    ], (0.05, 8.0)),
+    ("Shopping", "item", [
+        ["T-shirt", "Jeans", "Jacket", "Shoes", "Smartphone", "Laptop", "Tablet", "Television",
+         "Headphones", "Sofa", "Chair", "Table", "Mattress", "Kettle", "Toaster", "Washing machine",
+         "Fridge", "Bicycle", "Book", "Toy"],
+        ["new", "refurbished", "second-hand", "recycled"],
+        ["budget", "mid-range", "premium"],
+    ], (0.5, 400.0)),
+    ("Energy", "kWh", [
+        ["Electricity", "Heat pump", "Electric heating", "EV charging"],
+        ["Norway", "Sweden", "France", "Germany", "Poland", "Spain", "Italy", "United Kingdom",
+         "Ireland", "Netherlands", "Belgium", "Austria", "Switzerland", "Denmark", "Finland",
+         "Portugal", "Greece", "Czechia", "Hungary", "Romania", "United States", "Canada", "Mexico",
+         "Brazil", "Argentina", "Chile", "India", "China", "Japan", "South Korea", "Australia",
+         "New Zealand", "South Africa", "Nigeria", "Egypt", "Turkey", "Indonesia", "Vietnam"],
+        ["grid", "green tariff", "night tariff"],
+    ], (0.01, 0.9)),
+]
+
+def generate_activity_catalog(count, seed=0):
+    """Generate ``count`` catalog rows (activity, category, unit, co2) deterministically"""
+    rng = random.Random(f"{seed}:catalog")
+    combinations = []
+    for category, unit, parts, (low, high) in CATALOG_FAMILIES:
+        labels = [[]]
+        for options in parts:
+            labels = [label + [option] for label in labels for option in options]
+        combinations.extend((category, unit, " ".join(label), low, high) for label in labels)
+    rng.shuffle(combinations)
+    rows = []
+    variant = 0
+    while len(rows) < count:
+        for category, unit, label, low, high in combinations:
+            if len(rows) >= count:
+                break
+            # Later rounds add numbered variants once the base labels run out
+            name = f"{label} ({unit})" if not variant else f"{label} v{variant} ({unit})"
+            rows.append({"activity": name, "category": category, "unit": unit,
+                         "co2": round(rng.uniform(low, high), 4)})
+        variant += 1
+    return rows
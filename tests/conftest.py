@@ -0,0 +1,25 @@
+import pytest
+
+
+def make_entry(day, category="Food", co2_amount=1.0, activity="meal"):
+    """Build an entry in the stored schema"""
+    return {
+        "date": day,
+        "activity": activity,
+        "category": category,
+        "co2_amount": co2_amount,
+        "distance": None,
+        "duration": None,
+        "notes": "",
+        "entry_type": "detailed",
+        "timestamp": f"{day}T12:00:00"
+    }
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A fresh user_data directory, with the working directory moved next to it"""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "user_data"
+    path.mkdir()
+    return str(path)
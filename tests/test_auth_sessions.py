@@ -0,0 +1,67 @@
+from auth_sessions import SessionTokens
+
+
+class StaticUsers:
+    """User index over a fixed dict"""
+
+    def __init__(self, users):
+        self.users = users
+
+    def get_user(self, username):
+        return self.users.get(username)
+
+
+def test_issued_token_verifies():
+    tokens = SessionTokens(b"secret")
+    users = StaticUsers({"alice": {"password": "hash-a"}})
+
+    assert tokens.verify(tokens.issue("alice", "hash-a"), users) == "alice"
+
+
+def test_tampered_tokens_are_rejected():
+    tokens = SessionTokens(b"secret")
+    users = StaticUsers({"alice": {"password": "hash-a"}, "bob": {"password": "hash-b"}})
+    token = tokens.issue("alice", "hash-a")
+    encoded_user, expiry, nonce, signature = token.split(".")
+    bob = tokens.issue("bob", "hash-b").split(".")[0]
+
+    assert tokens.verify(".".join([bob, expiry, nonce, signature]), users) is None
+    assert tokens.verify(".".join([encoded_user, str(int(expiry) + 3600), nonce, signature]), users) is None
+    assert tokens.verify(token[:-1] + ("B" if token.endswith("A") else "A"), users) is None
+    assert tokens.verify("not a token", users) is None
+    assert tokens.verify("", users) is None
+
+
+def test_other_secret_is_rejected():
+    users = StaticUsers({"alice": {"password": "hash-a"}})
+    token = SessionTokens(b"secret").issue("alice", "hash-a")
+
+    assert SessionTokens(b"other").verify(token, users) is None
+
+
+def test_expired_token_is_rejected():
+    tokens = SessionTokens(b"secret", ttl_seconds=-1)
+    users = StaticUsers({"alice": {"password": "hash-a"}})
+
+    assert tokens.verify(tokens.issue("alice", "hash-a"), users) is None
+
+
+def test_password_change_and_removal_revoke_tokens():
+    tokens = SessionTokens(b"secret")
+    users = StaticUsers({"alice": {"password": "hash-a"}})
+    token = tokens.issue("alice", "hash-a")
+
+    users.users["alice"] = {"password": "hash-a2"}
+    assert tokens.verify(token, users) is None
+    users.users.clear()
+    assert tokens.verify(token, users) is None
+
+
+def test_secret_is_generated_once(tmp_path, monkeypatch):
+    monkeypatch.delenv("CO2_SESSION_SECRET", raising=False)
+    secret_file = str(tmp_path / "data" / ".session_secret")
+    users = StaticUsers({"alice": {"password": "hash-a"}})
+    token = SessionTokens.from_env(secret_file).issue("alice", "hash-a")
+
+    assert SessionTokens.from_env(secret_file).verify(token, users) == "alice"
+    assert (tmp_path / "data" / ".session_secret").stat().st_mode & 0o777 == 0o600
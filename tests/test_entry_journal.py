@@ -0,0 +1,67 @@
+import os
+from conftest import make_entry
+from entry_journal import EntryJournal
+from jobs import get_job_queue
+
+
+def test_append_and_replay(data_dir):
+    journal = EntryJournal(data_dir, compact_threshold=1000)
+    first, second = make_entry("2025-01-01"), make_entry("2025-01-02", "Transport", 2.5)
+    old_version, new_version = journal.append("alice", first)
+    assert old_version != new_version
+    journal.append_many("alice", [second])
+
+    version, entries = journal.replay("alice")
+    assert entries == [first, second]
+    assert version == journal.version("alice")
+    assert journal.replay("bob")[1] == []
+
+
+def test_delete_drops_first_match_only(data_dir):
+    journal = EntryJournal(data_dir, compact_threshold=1000)
+    entry = make_entry("2025-01-01")
+    journal.append_many("alice", [entry, entry, make_entry("2025-01-02")])
+    journal.delete("alice", entry)
+    journal.delete("alice", make_entry("2030-01-01"))
+
+    assert journal.replay("alice")[1] == [entry, make_entry("2025-01-02")]
+
+
+def test_compact_folds_journal_into_snapshot(data_dir):
+    journal = EntryJournal(data_dir, compact_threshold=1000)
+    entries = [make_entry(f"2025-01-{day:02d}") for day in range(1, 6)]
+    journal.append_many("alice", entries)
+    journal.delete("alice", entries[0])
+    before = journal.replay("alice")
+
+    journal.compact("alice")
+
+    assert not os.path.exists(journal.get_journal_file("alice"))
+    version, replayed = journal.replay("alice")
+    assert replayed == before[1] == entries[1:]
+    assert version != before[0]
+    # Appends after a compaction replay on top of the new snapshot
+    journal.append("alice", entries[0])
+    assert journal.replay("alice")[1] == entries[1:] + entries[:1]
+
+
+def test_replace_discards_journal(data_dir):
+    journal = EntryJournal(data_dir, compact_threshold=1000)
+    journal.append_many("alice", [make_entry("2025-01-01")])
+    journal.replace("alice", [make_entry("2024-06-01")])
+
+    assert journal.replay("alice")[1] == [make_entry("2024-06-01")]
+
+
+def test_compaction_is_scheduled_past_threshold(data_dir):
+    journal = EntryJournal(data_dir, compact_threshold=3)
+    entries = [make_entry(f"2025-02-{day:02d}") for day in range(1, 5)]
+    journal.append_many("alice", entries)
+
+    queue = get_job_queue(data_dir)
+    jobs = [job for job in queue.jobs() if job.kind == "compact_journal"]
+    assert len(jobs) == 1
+    assert queue.wait(jobs[0].id, timeout=30).state == "done"
+    # The job's own journal instance compacted the same files
+    assert not os.path.exists(journal.get_journal_file("alice"))
+    assert journal.replay("alice")[1] == entries
@@ -0,0 +1,82 @@
+import pytest
+from conftest import make_entry
+from compact_entry import compact_entries
+from entry_index import EntryIndex
+from storage import SQLiteStorage, YamlStorage
+
+ENTRIES = [
+    make_entry("2025-03-02", "Food", 1.0, "lunch"),
+    make_entry("2025-03-01", "Transport", 2.0, "bus"),
+    make_entry("2025-03-02", "Transport", 3.0, "train"),
+    make_entry("2025-03-05", "Food", 4.0, "dinner"),
+    make_entry("2025-02-27", "Energy", 5.0, "heating"),
+    make_entry("2025-03-02", "Food", 6.0, "breakfast"),
+    make_entry("2025-03-04", "Energy", 7.0, "lights"),
+]
+
+
+def newest_first(entries):
+    """Expected page order: newest date first, entries added earlier first within a day"""
+    order = sorted(range(len(entries)), key=lambda i: (entries[i]["date"], -i), reverse=True)
+    return [entries[i] for i in order]
+
+
+def walk(query, limit, after=None, **filters):
+    """Follow cursors from a position (default the first page) to the last page"""
+    pages = []
+    while True:
+        page = query(limit=limit, after=after, **filters)
+        if not page:
+            return pages
+        pages.append([entry for _, entry in page])
+        after = page[-1][0]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_index_pages_cover_every_entry_once(limit):
+    index = EntryIndex(compact_entries(ENTRIES))
+    pages = walk(index.page, limit)
+
+    assert [entry for page in pages for entry in page] == newest_first(ENTRIES)
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_index_pages_within_filters():
+    index = EntryIndex(compact_entries(ENTRIES))
+    filters = {"category": "Food", "start_date": "2025-03-01", "end_date": "2025-03-04"}
+    pages = walk(index.page, 1, **filters)
+
+    expected = [e for e in newest_first(ENTRIES)
+                if e["category"] == "Food" and "2025-03-01" <= e["date"] <= "2025-03-04"]
+    assert [entry for page in pages for entry in page] == expected
+    assert index.page(category="Unknown") == []
+
+
+def test_cursor_is_stable_across_appends():
+    index = EntryIndex(compact_entries(ENTRIES))
+    first = index.page(limit=3)
+    # A newer entry added after the first page was read does not shift the next ones
+    grown = EntryIndex(compact_entries(ENTRIES + [make_entry("2025-03-06")]))
+    rest = walk(grown.page, 3, after=first[-1][0])
+
+    assert [entry for _, entry in first] + [entry for page in rest for entry in page] == newest_first(ENTRIES)
+
+
+@pytest.fixture(params=["yaml", "sqlite"])
+def storage(request, data_dir):
+    if request.param == "sqlite":
+        return SQLiteStorage(f"{data_dir}/footprint.db")
+    return YamlStorage(data_dir, user_file="users.yaml")
+
+
+def test_storage_pages_match_index(storage):
+    storage.append_entries("alice", ENTRIES[:4])
+    storage.append_entries("alice", ENTRIES[4:])
+    storage.append_entries("bob", [make_entry("2025-03-03")])
+
+    pages = walk(lambda **kwargs: storage.query_entry_page("alice", **kwargs), 2)
+    assert [entry for page in pages for entry in page] == newest_first(ENTRIES)
+
+    transport = walk(lambda **kwargs: storage.query_entry_page("alice", **kwargs), 1, category="Transport")
+    assert [page[0]["activity"] for page in transport] == ["train", "bus"]
+    assert storage.sum_entries("alice", category="Food") == (11.0, 3)
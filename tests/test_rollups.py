@@ -0,0 +1,94 @@
+import copy
+import pytest
+from conftest import make_entry
+from rollups import RollupStore
+from storage import YamlStorage
+
+ENTRIES = [
+    make_entry("2025-01-03", "Food", 1.5),
+    make_entry("2025-01-01", "Transport", 2.25),
+    make_entry("2025-01-09", "Food", 3.0),
+    make_entry("2025-01-05", "Energy", 0.5),
+]
+
+
+def test_build_summarizes_entries():
+    rollups = RollupStore.build(ENTRIES)
+
+    assert rollups["categories"] == {"Food": [4.5, 2], "Transport": [2.25, 1], "Energy": [0.5, 1]}
+    assert rollups["total"] == pytest.approx(7.25)
+    assert rollups["count"] == 4
+    assert (rollups["min_date"], rollups["max_date"]) == ("2025-01-01", "2025-01-09")
+
+
+def test_add_then_remove_restores_rollups():
+    before = RollupStore.build(ENTRIES[:2])
+    rollups = copy.deepcopy(before)
+    RollupStore.apply(rollups, ENTRIES[2:], 1)
+    assert rollups == RollupStore.build(ENTRIES)
+
+    # Removing interior-dated entries needs no bounds refresh
+    RollupStore.apply(rollups, ENTRIES[2:], -1)
+    assert rollups["categories"] == before["categories"]
+    assert rollups["count"] == before["count"]
+    assert rollups["total"] == pytest.approx(before["total"])
+
+
+def test_removing_everything_resets_to_empty():
+    rollups = RollupStore.build(ENTRIES)
+    RollupStore.apply(rollups, ENTRIES, -1)
+
+    assert rollups == RollupStore.empty()
+
+
+def test_legacy_daily_and_monthly_tables_are_dropped():
+    rollups = dict(RollupStore.build(ENTRIES[:1]), daily={"2025-01-03": 1.5}, monthly={"2025-01": 1.5})
+    RollupStore.apply(rollups, ENTRIES[1:], 1)
+
+    assert rollups == RollupStore.build(ENTRIES)
+
+
+@pytest.fixture
+def store(data_dir):
+    storage = YamlStorage(data_dir, user_file="users.yaml")
+    return storage, RollupStore(storage, max_users=2)
+
+
+def test_store_matches_rebuild_after_adds_and_removes(store):
+    storage, rollups = store
+    for entry in ENTRIES:
+        storage.append_entries("alice", [entry])
+        rollups.add_entries("alice", [entry])
+    assert rollups.get("alice") == RollupStore.build(ENTRIES)
+
+    # Removing the entries on both boundary days moves the bounds inwards
+    for entry in (ENTRIES[1], ENTRIES[2]):
+        storage.delete_entry("alice", entry)
+        rollups.remove_entry("alice", entry)
+    remaining = [ENTRIES[0], ENTRIES[3]]
+    assert rollups.get("alice") == RollupStore.build(remaining)
+
+
+def test_updates_leave_cached_documents_untouched(store):
+    storage, rollups = store
+    storage.append_entries("alice", ENTRIES[:2])
+    rollups.add_entries("alice", ENTRIES[:2])
+    shared = rollups.get("alice")
+    snapshot = copy.deepcopy(shared)
+
+    storage.append_entries("alice", ENTRIES[2:])
+    rollups.add_entries("alice", ENTRIES[2:])
+
+    assert shared == snapshot
+    assert rollups.get("alice") == RollupStore.build(ENTRIES)
+
+
+def test_cache_evicts_least_recently_used(store):
+    storage, rollups = store
+    for username in ("alice", "bob", "carol"):
+        storage.append_entries(username, ENTRIES[:1])
+        rollups.get(username)
+
+    assert list(rollups._cache) == ["bob", "carol"]
+    # Evicted users are read back from storage
+    assert rollups.get("alice") == RollupStore.build(ENTRIES[:1])
@@ -0,0 +1,99 @@
+import time
+import threading
+import pytest
+from write_coalescer import WriteCoalescer
+
+
+class RecordingCommit:
+    """Commit callback that records each group and fails for chosen users"""
+
+    def __init__(self, failing=(), gate=None):
+        self.groups = []
+        self.failing = set(failing)
+        self.gate = gate
+
+    def __call__(self, records_by_user):
+        if self.gate is not None:
+            self.gate.wait()
+        self.groups.append({username: list(records) for username, records in records_by_user.items()})
+        return {username: OSError(f"disk full for {username}") for username in records_by_user
+                if username in self.failing}
+
+
+def test_concurrent_writes_share_a_group():
+    gate = threading.Event()
+    commit = RecordingCommit(gate=gate)
+    coalescer = WriteCoalescer(commit, max_delay=0.05)
+    # The first write holds the committer, so the rest queue up behind it
+    first = threading.Thread(target=coalescer.submit, args=("alice", [0]))
+    first.start()
+    writers = [threading.Thread(target=coalescer.submit, args=(f"user{i % 3}", [i])) for i in range(1, 10)]
+    for writer in writers:
+        writer.start()
+    deadline = time.monotonic() + 10
+    while coalescer.stats()["pending_records"] < 9 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    gate.set()
+    for thread in [first] + writers:
+        thread.join(10)
+
+    assert sorted(r for group in commit.groups for records in group.values() for r in records) == list(range(10))
+    assert len(commit.groups) < 10
+    stats = coalescer.stats()
+    assert stats["records"] == 10
+    assert stats["batches"] == len(commit.groups)
+    assert stats["failures"] == 0
+
+
+def test_max_records_closes_a_group_early():
+    commit = RecordingCommit()
+    coalescer = WriteCoalescer(commit, max_delay=60, max_records=2)
+    errors = coalescer.commit_many({"alice": [1, 2], "bob": [3]})
+
+    assert errors == {}
+    assert commit.groups == [{"alice": [1, 2], "bob": [3]}]
+
+
+def test_one_users_failure_does_not_fail_the_group():
+    commit = RecordingCommit(failing={"bob"})
+    coalescer = WriteCoalescer(commit, max_delay=0.001)
+    errors = coalescer.commit_many({"alice": [1], "bob": [2]})
+
+    assert list(errors) == ["bob"]
+    assert isinstance(errors["bob"], OSError)
+    with pytest.raises(OSError):
+        coalescer.submit("bob", [3])
+    coalescer.submit("alice", [4])
+    assert coalescer.stats()["failures"] == 2
+
+
+def test_commit_exception_fails_every_writer():
+    def commit(records_by_user):
+        raise RuntimeError("commit crashed")
+
+    coalescer = WriteCoalescer(commit, max_delay=0.001)
+    errors = coalescer.commit_many({"alice": [1], "bob": [2]})
+
+    assert set(errors) == {"alice", "bob"}
+    with pytest.raises(RuntimeError):
+        coalescer.submit("alice", [3])
+    # The committer thread survives a failed group and goes on to the next one
+    assert set(coalescer.commit_many({"carol": [4]})) == {"carol"}
+
+
+def test_async_writes_are_flushed():
+    commit = RecordingCommit(failing={"bob"})
+    coalescer = WriteCoalescer(commit, max_delay=0.01, durability="async")
+    coalescer.submit("alice", [1])
+    coalescer.submit("bob", [2])
+
+    assert coalescer.flush(timeout=10)
+    assert sorted(r for group in commit.groups for records in group.values() for r in records) == [1, 2]
+    assert coalescer.close(timeout=10)
+    with pytest.raises(RuntimeError):
+        coalescer.submit("alice", [3])
+
+
+def test_unknown_durability_is_rejected():
+    with pytest.raises(ValueError):
+        WriteCoalescer(lambda records_by_user: {}, durability="eventually")
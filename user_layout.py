@@ -0,0 +1,166 @@
+import os
+import json
+import hashlib
+import threading
+from file_lock import locked
+from data_codecs import CODECS, get_codec_files
+
+# Per-user file names (``<user>_<name>`` plus a codec extension) moved into shards
+USER_FILE_NAMES = ("co2_data", "co2_journal", "rewards", "rollups")
+
+class UserLayout:
+    """Where each user's files live: hash-prefix shard directories listed in a manifest
+
+    A user's files go in ``shards/<ab>/<cd>/`` under the data directory,
+    where ``abcd`` starts the SHA-1 of the username, so no directory holds
+    more than a sliver of the users. ``user_manifest.journal`` lists the
+    users that live in shards, one JSON string per line, so listing users
+    needs no directory scan.
+
+    Users from the older flat layout keep working from the data directory
+    until ``migrate_user`` moves them; new users start in their shard.
+    Locks are always taken in the shard, so they stay the same when a
+    user moves.
+    """
+
+    def __init__(self, data_dir, files=None):
+        self.data_dir = data_dir
+        self.files = files or get_codec_files()
+        self.manifest_base = os.path.join(data_dir, "user_manifest")
+        self.manifest_file = self.manifest_base + ".journal"
+        self._sharded = set()
+        self._manifest_offset = 0
+        self._guard = threading.Lock()
+
+    def shard_dir(self, username):
+        """Get the shard directory for a user"""
+        digest = hashlib.sha1(username.encode("utf-8")).hexdigest()
+        return os.path.join(self.data_dir, "shards", digest[:2], digest[2:4])
+
+    def lock_path(self, username, name):
+        """Get the path to lock for one of a user's files, wherever the file lives"""
+        return os.path.join(self.shard_dir(username), f"{username}_{name}")
+
+    def _refresh(self):
+        """Pick up users other processes added to the manifest; caller holds the guard"""
+        try:
+            with open(self.manifest_file, "rb") as f:
+                f.seek(self._manifest_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        # The manifest is only ever appended to; skip a line still being written
+        chunk = chunk[:chunk.rfind(b"\n") + 1]
+        for line in chunk.splitlines():
+            if line.strip():
+                self._sharded.add(json.loads(line))
+        self._manifest_offset += len(chunk)
+
+    def is_sharded(self, username):
+        """Check whether a user's files live in their shard"""
+        with self._guard:
+            if username not in self._sharded:
+                self._refresh()
+            return username in self._sharded
+
+    def has_flat_files(self, username):
+        """Check whether a user still has files in the flat data directory"""
+        return any(self.files.exists(os.path.join(self.data_dir, f"{username}_{name}"))
+                   for name in ("co2_data", "rewards"))
+
+    def _register(self, username):
+        """Add a user to the manifest"""
+        with locked(self.manifest_base):
+            with self._guard:
+                self._refresh()
+                if username in self._sharded:
+                    return
+            os.makedirs(self.shard_dir(username), exist_ok=True)
+            with open(self.manifest_file, "a") as f:
+                f.write(json.dumps(username) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            with self._guard:
+                self._refresh()
+
+    def user_dir(self, username, write=False):
+        """Get the directory holding a user's files
+
+        With ``write``, a user with no files anywhere is registered in their
+        shard first. Writers must hold the lock of the file they write.
+        """
+        if self.is_sharded(username):
+            return self.shard_dir(username)
+        if self.has_flat_files(username):
+            return self.data_dir
+        if write:
+            self._register(username)
+        return self.shard_dir(username)
+
+    def base(self, username, name, write=False):
+        """Get the path, without its codec extension, of one of a user's files"""
+        return os.path.join(self.user_dir(username, write), f"{username}_{name}")
+
+    def read(self, username, name, read):
+        """Call ``read(base)`` for one of a user's files, following the user if they moved meanwhile"""
+        sharded = self.is_sharded(username)
+        data = read(self.base(username, name))
+        if data is None and not sharded and self.is_sharded(username):
+            data = read(self.base(username, name))
+        return data
+
+    def sharded_users(self):
+        """Get every user listed in the manifest"""
+        with self._guard:
+            self._refresh()
+            return set(self._sharded)
+
+    def flat_users(self):
+        """Get the users that still have files in the flat data directory"""
+        suffixes = tuple(
+            f"_{name}{codec_class.extension}" for name in ("co2_data", "rewards") for codec_class in CODECS.values()
+        )
+        users = set()
+        for filename in os.listdir(self.data_dir):
+            for suffix in suffixes:
+                if filename.endswith(suffix):
+                    users.add(filename[:-len(suffix)])
+                    break
+        return users
+
+    def migrate_user(self, username):
+        """Move a flat user's files into their shard; caller holds every lock on the user's files
+
+        Files are hard-linked into the shard before the user is added to
+        the manifest and only then unlinked from the flat directory, so a
+        reader always finds them in one place or the other.
+        """
+        shard = self.shard_dir(username)
+        os.makedirs(shard, exist_ok=True)
+        moved = []
+        for name in USER_FILE_NAMES:
+            for codec_class in CODECS.values():
+                filename = f"{username}_{name}{codec_class.extension}"
+                source = os.path.join(self.data_dir, filename)
+                if not os.path.exists(source):
+                    continue
+                target = os.path.join(shard, filename)
+                if os.path.exists(target):
+                    os.remove(target)
+                os.link(source, target)
+                moved.append(source)
+        self._register(username)
+        for source in moved:
+            os.remove(source)
+        return len(moved)
+
+
+_layouts = {}
+_layouts_guard = threading.Lock()
+
+def get_user_layout(data_dir):
+    """Get the process-wide user layout for a data directory"""
+    with _layouts_guard:
+        if data_dir not in _layouts:
+            _layouts[data_dir] = UserLayout(data_dir)
+        return _layouts[data_dir]
@@ -0,0 +1,223 @@
+import os
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Durability modes: "sync" returns once the write is on disk, "async" once it is queued
+DURABILITY_MODES = ("sync", "async")
+
+class _Ticket:
+    """One submitted write, signalled once its group has been committed"""
+
+    __slots__ = ("username", "records", "submitted", "done", "error")
+
+    def __init__(self, username, records):
+        self.username = username
+        self.records = records
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.error = None
+
+
+class WriteCoalescer:
+    """Group commit for entry writes from many sessions
+
+    Writes are queued and a committer thread takes everything that arrived
+    within ``max_delay`` seconds of the first (or as soon as ``max_records``
+    are waiting) and hands the group to ``commit``, which gets
+    ``{username: records}`` and returns ``{username: exception}`` for the
+    users whose records failed. Each user's records in a group are written
+    with one append and one fsync, and shared files once for the group.
+
+    Durability:
+
+    - ``sync`` (default): ``submit`` returns after the group holding the
+      write is committed and fsynced, and raises if the write failed. A
+      write that returned survives a crash.
+    - ``async``: ``submit`` returns once the write is queued. Up to
+      ``max_delay`` of writes can be lost on a crash, and a user's own reads
+      may not see a write until its group commits. ``flush`` (also run at
+      interpreter exit) waits for everything queued.
+    """
+
+    def __init__(self, commit, max_delay=0.002, max_records=256, durability="sync", samples=1024):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability '{durability}', expected one of {DURABILITY_MODES}")
+        self.commit = commit
+        self.max_delay = max_delay
+        self.max_records = max_records
+        self.durability = durability
+        self._pending = []
+        self._pending_records = 0
+        self._committing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        # Recent samples for the metrics
+        self.batch_records = deque(maxlen=samples)
+        self.batch_users = deque(maxlen=samples)
+        self.commit_seconds = deque(maxlen=samples)
+        self.wait_seconds = deque(maxlen=samples)
+        self.batches = 0
+        self.records = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, commit):
+        """Create a coalescer configured by CO2_WRITE_DELAY_MS / CO2_WRITE_MAX_RECORDS / CO2_WRITE_DURABILITY"""
+        return cls(
+            commit,
+            max_delay=float(os.environ.get("CO2_WRITE_DELAY_MS", 2)) / 1000,
+            max_records=int(os.environ.get("CO2_WRITE_MAX_RECORDS", 256)),
+            durability=os.environ.get("CO2_WRITE_DURABILITY", "sync").lower()
+        )
+
+    def submit(self, username, records):
+        """Queue a user's records for the next group commit"""
+        self.submit_many({username: records})
+
+    def submit_many(self, records_by_user):
+        """Queue several users' records together so they land in the same group"""
+        tickets = self._enqueue(records_by_user)
+        if self.durability == "sync":
+            for ticket in tickets:
+                ticket.done.wait()
+            for ticket in tickets:
+                if ticket.error is not None:
+                    raise ticket.error
+
+    def commit_many(self, records_by_user):
+        """Queue several users' records and wait for their group whatever the durability
+
+        Returns ``{username: exception}`` for the users whose records failed;
+        everyone else's records are committed.
+        """
+        tickets = self._enqueue(records_by_user)
+        for ticket in tickets:
+            ticket.done.wait()
+        return {ticket.username: ticket.error for ticket in tickets if ticket.error is not None}
+
+    def _enqueue(self, records_by_user):
+        """Queue tickets for the committer thread and return them"""
+        tickets = [_Ticket(username, list(records)) for username, records in records_by_user.items() if records]
+        if not tickets:
+            return tickets
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The write coalescer has been closed")
+            self._pending.extend(tickets)
+            self._pending_records += sum(len(ticket.records) for ticket in tickets)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return tickets
+
+    def _take_group(self):
+        """Wait for writes and take the next group; caller holds the condition"""
+        while not self._pending:
+            self._cond.wait()
+        deadline = self._pending[0].submitted + self.max_delay
+        while self._pending_records < self.max_records and not self._closed:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        group, self._pending = self._pending, []
+        self._pending_records = 0
+        self._committing = True
+        return group
+
+    def _run(self):
+        """Commit groups until the process exits"""
+        while True:
+            with self._cond:
+                group = self._take_group()
+            self._commit_group(group)
+            with self._cond:
+                self._committing = False
+                self._cond.notify_all()
+
+    def _commit_group(self, group):
+        """Commit one group and signal its writers"""
+        by_user = {}
+        for ticket in group:
+            by_user.setdefault(ticket.username, []).extend(ticket.records)
+        started = time.perf_counter()
+        try:
+            errors = self.commit(by_user) or {}
+        except Exception as error:
+            errors = {username: error for username in by_user}
+        finished = time.perf_counter()
+
+        record_count = sum(len(ticket.records) for ticket in group)
+        with self._cond:
+            self.batches += 1
+            self.records += record_count
+            self.batch_records.append(record_count)
+            self.batch_users.append(len(by_user))
+            self.commit_seconds.append(finished - started)
+            for ticket in group:
+                self.wait_seconds.append(finished - ticket.submitted)
+                if errors.get(ticket.username) is not None:
+                    self.failures += 1
+        for ticket in group:
+            ticket.error = errors.get(ticket.username)
+            if ticket.error is not None:
+                if self.durability == "async":
+                    logger.error("Could not commit %d records for %s", len(ticket.records), ticket.username,
+                                 exc_info=ticket.error)
+            ticket.done.set()
+
+    def flush(self, timeout=None):
+        """Block until every queued write is committed; returns False on timeout"""
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._committing, timeout)
+
+    def close(self, timeout=None):
+        """Stop taking writes and commit what is queued"""
+        with self._cond:
+            self._closed = True
+        return self.flush(timeout)
+
+    def stats(self):
+        """Summarize batch sizes and commit latency over the recent groups"""
+        def summary(samples):
+            values = sorted(samples)
+            if not values:
+                return {"p50": 0, "p95": 0, "max": 0}
+            return {
+                "p50": values[len(values) // 2],
+                "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+                "max": values[-1],
+            }
+
+        with self._cond:
+            return {
+                "durability": self.durability,
+                "batches": self.batches,
+                "records": self.records,
+                "failures": self.failures,
+                "pending_records": self._pending_records,
+                "batch_records": summary(self.batch_records),
+                "batch_users": summary(self.batch_users),
+                "commit_seconds": summary(self.commit_seconds),
+                "wait_seconds": summary(self.wait_seconds),
+            }
+
+
+_coalescers = {}
+_coalescers_guard = threading.Lock()
+
+def get_write_coalescer(key, commit):
+    """Get the process-wide coalescer for a key, flushed when the interpreter exits"""
+    with _coalescers_guard:
+        if key not in _coalescers:
+            coalescer = _coalescers[key] = WriteCoalescer.from_env(commit)
+            atexit.register(coalescer.close)
+        return _coalescers[key]
@@ -0,0 +1,82 @@
+import os
+import time
+import tempfile
+import threading
+from multiprocessing import Pool
+
+def _worker(args):
+    """Add entries and sign up users from one process with several threads"""
+    work_dir, worker_id, threads, entries_per_thread, users = args
+    os.chdir(work_dir)
+    from co2_tracker import CO2Tracker
+    from auth import AuthManager
+    from rewards import RewardsManager
+    tracker = CO2Tracker()
+    auth_manager = AuthManager()
+    rewards_manager = RewardsManager()
+    errors = []
+
+    def run(thread_id):
+        try:
+            for i in range(entries_per_thread):
+                username = f"user{i % users}"
+                tracker.add_emission_entry(username, {
+                    "date": f"2025-01-{i % 28 + 1:02d}",
+                    "activity": f"stress {worker_id}/{thread_id}/{i}",
+                    "category": "Other",
+                    "co2_amount": 1.0,
+                    "entry_type": "detailed",
+                    "timestamp": f"{worker_id}-{thread_id}-{i}"
+                })
+                rewards_manager.update_daily_login(username)
+            success, message = auth_manager.signup_user(f"signup_{worker_id}_{thread_id}", "password")
+            if not success:
+                errors.append(message)
+        except Exception as e:
+            errors.append(repr(e))
+
+    pool = [threading.Thread(target=run, args=(thread_id,)) for thread_id in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return errors
+
+def run_write_stress(processes=4, threads=4, entries_per_thread=50, users=3):
+    """Hammer the stores from many processes and threads, then check nothing was lost"""
+    work_dir = tempfile.mkdtemp(prefix="co2_stress_")
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        results = pool.map(_worker, [
+            (work_dir, worker_id, threads, entries_per_thread, users) for worker_id in range(processes)
+        ])
+    elapsed = time.perf_counter() - started
+
+    os.chdir(work_dir)
+    from co2_tracker import CO2Tracker
+    from auth import AuthManager
+    tracker = CO2Tracker()
+    problems = [error for errors in results for error in errors]
+
+    expected_per_user = {f"user{u}": 0 for u in range(users)}
+    for i in range(entries_per_thread):
+        expected_per_user[f"user{i % users}"] += processes * threads
+
+    for username, expected in expected_per_user.items():
+        entries = tracker.load_user_data(username)
+        if len(entries) != expected:
+            problems.append(f"{username}: {len(entries)} entries stored, expected {expected}")
+        if len({entry['timestamp'] for entry in entries}) != len(entries):
+            problems.append(f"{username}: duplicate entries stored")
+        rank = tracker.leaderboard_index.rank_of(username)
+        if rank is None or rank[2] != expected:
+            problems.append(f"{username}: leaderboard index counts {rank and rank[2]}, expected {expected}")
+        if tracker.get_rollups(username)['count'] != expected:
+            problems.append(f"{username}: rollups count {tracker.get_rollups(username)['count']}, expected {expected}")
+
+    signups = len([name for name in AuthManager().load_users() if name.startswith("signup_")])
+    if signups != processes * threads:
+        problems.append(f"{signups} signups stored, expected {processes * threads}")
+
+    writes = processes * threads * (entries_per_thread * 2 + 1)
+    return {"work_dir": work_dir, "writes": writes, "seconds": elapsed, "problems": problems}